@@ -0,0 +1,295 @@
+"""Persistent cache of answers to repeated questions using SQLite."""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from local_dir_rag.defaults import (
+    DEFAULT_ANSWER_TTL_SECONDS,
+    DEFAULT_MAX_ANSWERS,
+)
+from local_dir_rag.file_tracker import SQLITE_PRAGMAS
+from local_dir_rag.vector_store import get_index_version
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize query text for exact matching.
+
+    Case, surrounding and repeated whitespace, and trailing punctuation
+    are ignored.
+
+    Args:
+        query: Query text.
+
+    Returns:
+        The normalized query.
+    """
+    return " ".join(query.casefold().split()).rstrip("?!. ")
+
+
+def _query_hash(query: str, settings: str) -> bytes:
+    """Hash normalized query text and query settings for use as a key."""
+    return hashlib.sha256(
+        f"{settings}\0{normalize_query(query)}".encode("utf-8")
+    ).digest()
+
+
+class AnswerCache:
+    """
+    Cache of answers keyed by normalized query, with a semantic tier.
+
+    Answers are stored in an SQLite database in the vector database
+    directory, tagged with the version of the index they were answered
+    from; answers from another version of the index are never returned.
+    Answers are also keyed by the query settings they were answered with,
+    such as the number of retrieved documents, so a session with other
+    settings does not reuse them.
+    Answers expire after ttl_seconds, and the least recently used answers
+    are evicted beyond max_entries.
+
+    With a similarity threshold, answers are also matched by the cosine
+    similarity of query embeddings.
+    """
+
+    def __init__(
+        self,
+        vector_db_path: str,
+        max_entries: int = DEFAULT_MAX_ANSWERS,
+        ttl_seconds: float = DEFAULT_ANSWER_TTL_SECONDS,
+        similarity_threshold: float = None,
+        settings: dict = None
+    ):
+        """
+        Initialize the answer cache.
+
+        Args:
+            vector_db_path: Path to the vector database directory.
+            max_entries: Maximum number of answers kept.
+            ttl_seconds: Seconds after which an answer expires.
+            similarity_threshold: Minimum cosine similarity between query
+                embeddings for a semantic match, or None to match exact
+                queries only.
+            settings: Query settings the answers depend on, such as the
+                number of retrieved documents; answers cached with other
+                settings are not returned.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.settings = json.dumps(settings or {}, sort_keys=True)
+        self.index_version = get_index_version(vector_db_path)
+        self.db_path = os.path.join(vector_db_path, "answer_cache.db")
+        self.hits = 0
+        self.misses = 0
+        # Opened while the session loads in the background, then used by
+        # one thread at a time
+        self._conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            check_same_thread=False
+        )
+        for pragma in SQLITE_PRAGMAS:
+            self._conn.execute(pragma)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    query_hash BLOB PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    embedding BLOB,
+                    index_version TEXT NOT NULL,
+                    settings TEXT NOT NULL DEFAULT '',
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            # Caches written before answers were keyed by settings
+            columns = [
+                row[1] for row in
+                self._conn.execute("PRAGMA table_info(answers)")
+            ]
+            if "settings" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE answers "
+                    "ADD COLUMN settings TEXT NOT NULL DEFAULT ''"
+                )
+            self._conn.execute("""
+                CREATE INDEX IF NOT EXISTS answers_last_used
+                ON answers (last_used)
+            """)
+            # Answers from another index, or expired, are never used again
+            removed = self._conn.execute(
+                """
+                DELETE FROM answers
+                WHERE index_version != ? OR created_at < ?
+                """,
+                (self.index_version, time.time() - ttl_seconds)
+            ).rowcount
+        if removed:
+            logger.info("Invalidated %d cached answers", removed)
+
+    @property
+    def semantic(self) -> bool:
+        """Whether answers are also matched by query embedding."""
+        return self.similarity_threshold is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+
+    def _use(self, query_hash: bytes) -> None:
+        """Record the use of an answer for least recently used eviction."""
+        with self._conn:
+            self._conn.execute(
+                "UPDATE answers SET last_used = ? WHERE query_hash = ?",
+                (time.time(), query_hash)
+            )
+
+    def get(self, query: str) -> str | None:
+        """
+        Look up the answer to a query with the same normalized text.
+
+        Args:
+            query: Query text.
+
+        Returns:
+            The cached answer, or None.
+        """
+        query_hash = _query_hash(query, self.settings)
+        row = self._conn.execute(
+            """
+            SELECT answer FROM answers
+            WHERE query_hash = ? AND index_version = ? AND settings = ?
+                AND created_at >= ?
+            """,
+            (
+                query_hash,
+                self.index_version,
+                self.settings,
+                time.time() - self.ttl_seconds
+            )
+        ).fetchone()
+        if row is None:
+            if not self.semantic:
+                self.misses += 1
+            return None
+        self._use(query_hash)
+        self.hits += 1
+        logger.info("Answer cache hit for '%s'", query)
+        return row[0]
+
+    def get_similar(self, query_embedding: list[float]) -> str | None:
+        """
+        Look up the answer to the most similar cached query.
+
+        Args:
+            query_embedding: Embedding of the query.
+
+        Returns:
+            The cached answer of the most similar query, if its similarity
+            reaches the threshold, or None.
+        """
+        rows = self._conn.execute(
+            """
+            SELECT query_hash, query, answer, embedding FROM answers
+            WHERE embedding IS NOT NULL
+                AND index_version = ? AND settings = ? AND created_at >= ?
+            """,
+            (
+                self.index_version,
+                self.settings,
+                time.time() - self.ttl_seconds
+            )
+        ).fetchall()
+        if not self.semantic or not rows:
+            self.misses += 1
+            return None
+
+        embeddings = np.stack([
+            np.frombuffer(row[3], dtype=np.float32) for row in rows
+        ])
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        similarities = embeddings @ query_vector / np.maximum(
+            np.linalg.norm(embeddings, axis=1)
+            * np.linalg.norm(query_vector),
+            1e-12
+        )
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+        self._use(rows[best][0])
+        self.hits += 1
+        logger.info(
+            "Semantic answer cache hit for '%s' (similarity %.3f)",
+            rows[best][1],
+            similarities[best]
+        )
+        return rows[best][2]
+
+    def put(
+        self,
+        query: str,
+        answer: str,
+        query_embedding: list[float] = None
+    ) -> None:
+        """
+        Store the answer to a query, evicting old answers if full.
+
+        Args:
+            query: Query text.
+            answer: Answer to cache.
+            query_embedding: Embedding of the query, for semantic matches.
+        """
+        now = time.time()
+        embedding = None
+        if query_embedding is not None:
+            embedding = np.asarray(query_embedding, dtype=np.float32)
+            embedding = embedding.tobytes()
+        with self._conn:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO answers
+                    (query_hash, query, answer, embedding, index_version,
+                     settings, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    _query_hash(query, self.settings),
+                    query,
+                    answer,
+                    embedding,
+                    self.index_version,
+                    self.settings,
+                    now,
+                    now
+                )
+            )
+            self._conn.execute(
+                """
+                DELETE FROM answers WHERE query_hash IN (
+                    SELECT query_hash FROM answers
+                    ORDER BY last_used DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
@@ -0,0 +1,432 @@
+"""Ingest benchmark on a synthetic corpus with a fake embedding model."""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from local_dir_rag.defaults import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_BATCH_TOKENS,
+    DEFAULT_MAX_CONCURRENCY,
+)
+from local_dir_rag.embed import aembed_docs, embed_docs
+from local_dir_rag.metrics import STAGES, RunMetrics, max_rss_bytes
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+_WORDS = (
+    "system", "index", "document", "pump", "valve", "pressure", "report",
+    "schedule", "maintenance", "customer", "contract", "invoice", "policy",
+    "network", "server", "storage", "backup", "release", "version",
+    "update", "install", "configure", "monitor", "alert", "error",
+    "request", "response", "latency", "throughput", "capacity", "budget",
+    "quarter", "review", "meeting", "project", "deadline", "team",
+    "the", "a", "of", "to", "and", "in", "for", "with", "on", "is", "was",
+    "will", "should", "must", "after", "before", "during", "each", "every",
+)
+
+# Letter-size page, with 10 point text on 12 point lines
+_PDF_LINES_PER_PAGE = 60
+_PDF_LINE_CHARS = 95
+
+
+@dataclass
+class CorpusConfig:
+    """
+    Size and shape of a synthetic corpus.
+
+    Files are spread over ``directories`` subdirectories. Each file has
+    between half and one and a half times ``paragraphs_per_file``
+    paragraphs of ``sentences_per_paragraph`` sentences, and a
+    ``pdf_fraction`` of the files are PDFs with ``paragraphs_per_page``
+    paragraphs on each page.
+    """
+    files: int = 100
+    pdf_fraction: float = 0.2
+    paragraphs_per_file: int = 20
+    sentences_per_paragraph: int = 5
+    paragraphs_per_page: int = 6
+    directories: int = 4
+    seed: int = 0
+
+
+def _sentence(rng: random.Random) -> str:
+    """Make up a sentence, with an identifier now and then."""
+    words = rng.choices(_WORDS, k=rng.randint(8, 16))
+    if rng.random() < 0.2:
+        words.append(f"{rng.choice('ABCDXZ')}{rng.randint(100, 9999)}")
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraphs(
+    rng: random.Random, config: CorpusConfig
+) -> list[str]:
+    """Make up the paragraphs of a file."""
+    count = rng.randint(
+        max(config.paragraphs_per_file // 2, 1),
+        max(config.paragraphs_per_file * 3 // 2, 1)
+    )
+    return [
+        " ".join(
+            _sentence(rng) for _ in range(config.sentences_per_paragraph)
+        )
+        for _ in range(count)
+    ]
+
+
+def _pdf_text(text: str) -> str:
+    """Escape text for a PDF string literal."""
+    return (
+        text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    )
+
+
+def _wrap(text: str, width: int) -> list[str]:
+    """Break text into lines of at most width characters at spaces."""
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def write_pdf(path: str, pages: list[str]) -> None:
+    """
+    Write a PDF with one page of Helvetica text per string.
+
+    Args:
+        path: Path of the PDF file.
+        pages: Text of each page; lines that do not fit are left out.
+    """
+    objects = {
+        1: "<< /Type /Catalog /Pages 2 0 R >>",
+        3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for page_text in pages:
+        lines = []
+        for paragraph in page_text.split("\n\n"):
+            lines.extend(_wrap(paragraph, _PDF_LINE_CHARS))
+            lines.append("")
+        stream = "BT /F1 10 Tf 12 TL 40 760 Td " + " ".join(
+            f"({_pdf_text(line)}) Tj T*"
+            for line in lines[:_PDF_LINES_PER_PAGE]
+        ) + " ET"
+        content_id = len(objects) + 2
+        page_id = content_id + 1
+        objects[content_id] = (
+            f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+        )
+        objects[page_id] = (
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            "/Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {content_id} 0 R >>"
+        )
+        kids.append(f"{page_id} 0 R")
+    objects[2] = (
+        f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    )
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(output)
+        output += (
+            f"{object_id} 0 obj\n{objects[object_id]}\nendobj\n"
+        ).encode("latin-1")
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for object_id in sorted(objects):
+        output += f"{offsets[object_id]:010d} 00000 n \n".encode()
+    output += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode()
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def generate_corpus(docs_path: str, config: CorpusConfig = None) -> dict:
+    """
+    Write a synthetic corpus of text and PDF files.
+
+    The same configuration always produces the same files.
+
+    Args:
+        docs_path: Directory to write the files in.
+        config: Size and shape of the corpus.
+
+    Returns:
+        The configuration, with the number of files, pages and bytes
+        written.
+    """
+    config = config or CorpusConfig()
+    rng = random.Random(config.seed)
+    pdf_files = round(config.files * config.pdf_fraction)
+    pages = 0
+    total_bytes = 0
+    for i in range(config.files):
+        directory = os.path.join(
+            docs_path, f"dir{i % max(config.directories, 1):03d}"
+        )
+        os.makedirs(directory, exist_ok=True)
+        paragraphs = _paragraphs(rng, config)
+        if i < pdf_files:
+            path = os.path.join(directory, f"doc{i:06d}.pdf")
+            page_texts = [
+                "\n\n".join(
+                    paragraphs[start:start + config.paragraphs_per_page]
+                )
+                for start in range(
+                    0, len(paragraphs), config.paragraphs_per_page
+                )
+            ]
+            write_pdf(path, page_texts)
+            pages += len(page_texts)
+        else:
+            path = os.path.join(directory, f"doc{i:06d}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(paragraphs))
+        total_bytes += os.path.getsize(path)
+    logger.info(
+        "Generated %d files (%d PDFs) of %d bytes in %s",
+        config.files,
+        pdf_files,
+        total_bytes,
+        docs_path
+    )
+    return {
+        **asdict(config),
+        "pdf_files": pdf_files,
+        "pdf_pages": pages,
+        "bytes": total_bytes,
+    }
+
+
+class LatencyEmbeddings(DeterministicFakeEmbedding):
+    """
+    Deterministic fake embedding model that takes time like a real one.
+
+    Each request sleeps for ``latency`` seconds plus ``text_latency``
+    seconds per text, so batching and concurrency show up in the
+    results. Sleeping releases the GIL, like waiting for an API.
+    """
+    latency: float = 0.0
+    text_latency: float = 0.0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency + self.text_latency * len(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency + self.text_latency)
+        return super().embed_query(text)
+
+    async def aembed_documents(
+        self, texts: list[str]
+    ) -> list[list[float]]:
+        await asyncio.sleep(self.latency + self.text_latency * len(texts))
+        return super().embed_documents(texts)
+
+
+def peak_rss_bytes(metrics: RunMetrics) -> dict[str, int | None]:
+    """
+    Get the peak resident set size of this process and its workers.
+
+    Args:
+        metrics: Metrics of the run, given the peak of each load and
+            split worker with its results.
+
+    Returns:
+        Peak bytes of the process, of its largest child that has exited,
+        and of the largest load and split worker, None where the platform
+        does not report them. Workers started by a fork server are not
+        children of this process, so they report their own peak.
+    """
+    return {
+        "process": max_rss_bytes(),
+        "children": max_rss_bytes(children=True),
+        "workers": metrics.worker_peak_rss_bytes,
+    }
+
+
+def run_benchmark(
+    docs_path: str,
+    vector_db_path: str,
+    workers: int = 1,
+    latency: float = 0.05,
+    text_latency: float = 0.0005,
+    dimension: int = 384,
+    max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_BATCH_SIZE,
+    use_async: bool = False,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+) -> dict:
+    """
+    Index a corpus into a new vector database and measure the run.
+
+    The embedding cache is disabled, so every chunk is embedded.
+
+    Args:
+        docs_path: Documents directory.
+        vector_db_path: Path of the vector database, which must not
+            exist yet.
+        workers: Number of load and split processes and of concurrent
+            embedding requests.
+        latency: Seconds taken by each embedding request.
+        text_latency: Additional seconds per text of a request.
+        dimension: Embedding dimension.
+        max_batch_tokens: Token budget of an embedding request.
+        max_batch_size: Maximum number of chunks in an embedding request.
+        use_async: Embed through the asynchronous client.
+        max_concurrency: Maximum number of asynchronous requests in
+            flight.
+
+    Returns:
+        The parameters, elapsed time, file and chunk counts and rates,
+        seconds in each stage, and peak memory.
+    """
+    if os.path.exists(vector_db_path):
+        raise ValueError(f"Vector database already exists: {vector_db_path}")
+    embeddings_model = LatencyEmbeddings(
+        size=dimension, latency=latency, text_latency=text_latency
+    )
+    metrics = RunMetrics()
+    options = {
+        "docs_paths": docs_path,
+        "vector_db_path": vector_db_path,
+        "embeddings_model": embeddings_model,
+        "workers": workers,
+        "max_batch_tokens": max_batch_tokens,
+        "max_batch_size": max_batch_size,
+        "embedding_cache_entries": 0,
+        "metrics": metrics,
+    }
+    if use_async:
+        asyncio.run(aembed_docs(
+            **options, max_concurrency=max_concurrency
+        ))
+    else:
+        embed_docs(**options)
+    return {
+        "parameters": {
+            "workers": workers,
+            "latency": latency,
+            "text_latency": text_latency,
+            "dimension": dimension,
+            "max_batch_tokens": max_batch_tokens,
+            "max_batch_size": max_batch_size,
+            "use_async": use_async,
+            "max_concurrency": max_concurrency,
+        },
+        **metrics.as_dict(),
+        "peak_rss_bytes": peak_rss_bytes(metrics),
+    }
+
+
+def benchmark(
+    corpus: CorpusConfig = None,
+    work_dir: str = None,
+    **options
+) -> dict:
+    """
+    Generate a corpus, index it, and measure the run.
+
+    Args:
+        corpus: Size and shape of the corpus.
+        work_dir: Directory for the corpus and the vector database
+            (default: a temporary directory, removed afterwards).
+        **options: Options of ``run_benchmark``.
+
+    Returns:
+        The corpus description and the results of ``run_benchmark``.
+    """
+    if work_dir is not None:
+        os.makedirs(work_dir, exist_ok=True)
+    with (
+        tempfile.TemporaryDirectory() if work_dir is None
+        else nullcontext(work_dir)
+    ) as directory:
+        docs_path = os.path.join(directory, "docs")
+        corpus_info = generate_corpus(docs_path, corpus)
+        vector_db_path = os.path.join(
+            directory, f"vector_db-{time.strftime('%Y%m%d-%H%M%S')}"
+        )
+        results = run_benchmark(docs_path, vector_db_path, **options)
+    return {"corpus": corpus_info, **results}
+
+
+def format_results(results: dict, baseline: dict = None) -> str:
+    """
+    Format benchmark results as a table, compared with a baseline.
+
+    Args:
+        results: Results of ``benchmark``.
+        baseline: Earlier results to compare with, if any.
+
+    Returns:
+        One line per measurement, with the change from the baseline.
+    """
+    rows = [
+        ("elapsed seconds", ("elapsed_seconds",)),
+        ("files/sec", ("files_per_second",)),
+        ("chunks/sec", ("chunks_per_second",)),
+    ] + [
+        (f"{stage} seconds", ("stage_seconds", stage)) for stage in STAGES
+    ] + [
+        ("peak RSS MiB", ("peak_rss_bytes", "process")),
+        ("peak child RSS MiB", ("peak_rss_bytes", "children")),
+        ("peak worker RSS MiB", ("peak_rss_bytes", "workers")),
+    ]
+
+    def value(values: dict, keys: tuple[str, ...]) -> float | None:
+        for key in keys:
+            values = values.get(key) if isinstance(values, dict) else None
+        if values is not None and keys[0] == "peak_rss_bytes":
+            return values / (1024 * 1024)
+        return values
+
+    lines = [
+        f"{results['files']} files, {results['chunks']} chunks "
+        f"({results['corpus']['pdf_files']} PDFs, "
+        f"{results['corpus']['bytes']} bytes)"
+    ]
+    for label, keys in rows:
+        current = value(results, keys)
+        line = f"{label:>20}  " + (
+            "?" if current is None else f"{current:12.3f}"
+        )
+        previous = value(baseline, keys) if baseline else None
+        if current is not None and previous:
+            line += f"  {100 * (current - previous) / previous:+7.1f}%"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def write_results(results: dict, path: str) -> None:
+    """
+    Save benchmark results as JSON.
+
+    Args:
+        results: Results of ``benchmark``.
+        path: Path of the JSON file.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,39 @@
+"""
+Default settings and choices of the command line.
+
+Kept apart from the modules that use them, which import LangChain, FAISS
+or the OpenAI client, so the command line can be parsed without loading
+those. The modules import their settings from here.
+"""
+
+# Default size limits of a single embedding request
+DEFAULT_BATCH_TOKENS = 64_000
+DEFAULT_BATCH_SIZE = 256
+
+# Default checkpoint policy: save the vector database after this many
+# indexed files or seconds, whichever comes first
+DEFAULT_CHECKPOINT_FILES = 100
+DEFAULT_CHECKPOINT_SECONDS = 300.0
+
+# Default maximum number of cached vectors; about 1.2 GB with 1536
+# dimensions
+DEFAULT_CACHE_ENTRIES = 200_000
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+STORAGE_TYPES = ("flat", "sq8", "fp16", "pq")
+
+SHARD_BY = ("none", "root", "subdirectory")
+
+# Default token budget of the context given to the chat model
+DEFAULT_CONTEXT_TOKENS = 6000
+
+DEFAULT_MAX_ANSWERS = 1000
+DEFAULT_ANSWER_TTL_SECONDS = 7 * 24 * 3600.0
+
+# Watch mode: index a burst of changes once no change arrived for the
+# debounce time, or once it has lasted the maximum delay
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+DEFAULT_MAX_DELAY_SECONDS = 30.0
+DEFAULT_POLL_INTERVAL = 5.0
@@ -0,0 +1,197 @@
+"""Document store in SQLite, fetching documents by id on demand."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+from local_dir_rag.file_tracker import SQLITE_PRAGMAS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+DOCSTORE_FILE = "docstore.db"
+
+# Maximum number of ids bound in one statement
+SQL_BATCH_SIZE = 500
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Document store of chunk texts and metadata in an SQLite database.
+
+    Documents are read by id when a search returns them, so loading the
+    vector database does not read the corpus text. Texts are optionally
+    compressed with zlib, and metadata is stored as JSON; values that
+    JSON cannot represent are stored as strings.
+
+    The store is pickled with the vector database as a reference to
+    ``docstore.db`` in the same directory, and attached to it again when
+    the vector database is loaded. Added documents are committed right
+    away, before any index that refers to them is saved, and deleted
+    documents are removed once the index is saved, so an interrupted run
+    never leaves the saved index referring to missing documents; at
+    worst, it leaves documents that no index refers to. One connection is
+    shared between threads.
+    """
+
+    def __init__(self, vector_db_path: str = None, compress: bool = True):
+        """
+        Initialize the document store.
+
+        Args:
+            vector_db_path: Path to the vector database directory, or
+                None to attach the store later.
+            compress: Whether to compress the text of added documents.
+        """
+        self.compress = compress
+        self.db_path = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pending_deletes: set[str] = set()
+        if vector_db_path is not None:
+            self.attach(vector_db_path)
+
+    def __getstate__(self):
+        return {"compress": self.compress}
+
+    def __setstate__(self, state):
+        self.__init__(compress=state["compress"])
+
+    def attach(self, vector_db_path: str) -> None:
+        """
+        Open the document database of a vector database.
+
+        Args:
+            vector_db_path: Path to the vector database directory.
+        """
+        self.close()
+        os.makedirs(vector_db_path, exist_ok=True)
+        self.db_path = os.path.join(vector_db_path, DOCSTORE_FILE)
+        self._conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            check_same_thread=False
+        )
+        for pragma in SQLITE_PRAGMAS:
+            self._conn.execute(pragma)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id TEXT PRIMARY KEY,
+                    text BLOB NOT NULL,
+                    compressed INTEGER NOT NULL,
+                    metadata TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get the database connection of an attached store."""
+        if self._conn is None:
+            raise RuntimeError(
+                "Document store is not attached to a vector database"
+            )
+        return self._conn
+
+    def search(self, search: str) -> Document | str:
+        """
+        Get a document by id.
+
+        Args:
+            search: Document id.
+
+        Returns:
+            The document, or a message if there is no document with the id.
+        """
+        if search in self._pending_deletes:
+            return f"ID {search} not found."
+        with self._lock:
+            row = self._connection().execute(
+                """
+                SELECT text, compressed, metadata FROM documents
+                WHERE id = ?
+                """,
+                (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        text, compressed, metadata = row
+        if compressed:
+            text = zlib.decompress(text).decode("utf-8")
+        return Document(
+            id=search, page_content=text, metadata=json.loads(metadata)
+        )
+
+    def add(self, texts: dict[str, Document]) -> None:
+        """
+        Add documents, replacing documents with the same ids.
+
+        Args:
+            texts: Documents by id.
+        """
+        rows = []
+        for doc_id, doc in texts.items():
+            text = doc.page_content
+            if self.compress:
+                text = zlib.compress(text.encode("utf-8"))
+            rows.append((
+                doc_id,
+                text,
+                int(self.compress),
+                json.dumps(doc.metadata, default=str)
+            ))
+        with self._lock, self._connection() as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO documents
+                    (id, text, compressed, metadata)
+                VALUES (?, ?, ?, ?)
+                """,
+                rows
+            )
+        self._pending_deletes.difference_update(texts)
+
+    def delete(self, ids: list) -> None:
+        """
+        Delete documents; they are removed when the index is next saved.
+
+        Args:
+            ids: Document ids.
+        """
+        self._pending_deletes.update(ids)
+
+    def purge_deleted(self) -> int:
+        """
+        Remove deleted documents, once the saved index no longer refers to
+        them.
+
+        Returns:
+            Number of documents removed.
+        """
+        ids = list(self._pending_deletes)
+        removed = 0
+        with self._lock, self._connection() as conn:
+            for start in range(0, len(ids), SQL_BATCH_SIZE):
+                batch = ids[start:start + SQL_BATCH_SIZE]
+                removed += conn.execute(
+                    "DELETE FROM documents WHERE id IN "
+                    f"({', '.join('?' * len(batch))})",
+                    batch
+                ).rowcount
+        self._pending_deletes.clear()
+        return removed
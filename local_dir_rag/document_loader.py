@@ -1,8 +1,8 @@
 """Document Loader Module to load documents from directories."""
-import glob
-
 import os
 import logging
+import re
+from dataclasses import dataclass, field
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_core.documents import Document
 
@@ -12,37 +12,251 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Extensions of the files that directory scans find by default
+DEFAULT_EXTENSIONS = [".pdf", ".txt"]
 
-def get_files_from_directory(
-    directory_path: str, extensions: list[str] = None
-) -> list[str]:
+
+def _glob_to_regex(pattern: str) -> str:
     """
-    Get all files with specified extensions from a directory.
+    Translate a gitignore-style glob into a regular expression.
+
+    Args:
+        pattern: Glob using ``*``, ``?``, ``[...]`` and ``**``.
+
+    Returns:
+        Regular expression matching a whole ``/``-separated path.
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[":
+            start = i + 1
+            negated = pattern.startswith("!", start)
+            if negated:
+                start += 1
+            # A "]" first in the brackets is part of the set
+            end = pattern.find("]", start + 1)
+            if end < 0:
+                regex += re.escape(pattern[i])
+                i += 1
+                continue
+            characters = re.sub(
+                r"([\\^\[&~|])", r"\\\1", pattern[start:end]
+            )
+            regex += ("[^/" if negated else "[") + characters + "]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex + r"\Z"
+
+
+@dataclass
+class ExcludeRules:
+    """
+    Gitignore-style exclude rules for directory scans.
+
+    Supported syntax: blank lines and ``#`` comments are ignored, ``!``
+    re-includes a previously excluded path, a trailing ``/`` matches only
+    directories, a pattern containing ``/`` is anchored to the scanned
+    root, and other patterns match a name at any depth. The last matching
+    rule wins, and files inside an excluded directory are never scanned.
+    """
+    rules: list[tuple[re.Pattern, bool, bool]] = field(default_factory=list)
+
+    @classmethod
+    def from_patterns(cls, patterns: list[str] = None) -> "ExcludeRules":
+        """
+        Compile exclude rules from gitignore-style patterns.
+
+        Args:
+            patterns: Patterns, one per rule.
+
+        Returns:
+            The compiled rules.
+        """
+        rules = []
+        for pattern in patterns or []:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negated = pattern.startswith("!")
+            if negated:
+                pattern = pattern[1:]
+            directory_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            if "/" in pattern:
+                regex = _glob_to_regex(pattern.lstrip("/"))
+            else:
+                regex = "(?:.*/)?" + _glob_to_regex(pattern)
+            rules.append((re.compile(regex), negated, directory_only))
+        return cls(rules)
+
+    def is_excluded(self, relative_path: str, is_dir: bool) -> bool:
+        """
+        Check if a path is excluded.
+
+        Args:
+            relative_path: Path relative to the scanned root, with ``/``
+                separators.
+            is_dir: Whether the path is a directory.
+
+        Returns:
+            True if the last matching rule excludes the path.
+        """
+        excluded = False
+        for regex, negated, directory_only in self.rules:
+            if directory_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                excluded = not negated
+        return excluded
+
+
+def scan_directory(
+    directory_path: str,
+    extensions: list[str] = None,
+    exclude_rules: ExcludeRules = None,
+    relative_dir: str = ""
+) -> dict[str, os.stat_result]:
+    """
+    Find files with specified extensions in a single walk of a directory.
+
+    Extensions are matched case-insensitively. Hidden files and
+    directories are skipped, and symbolic links to directories are
+    followed once.
 
     Args:
         directory_path: Path to the directory containing files.
         extensions: List of file extensions to include.
+        exclude_rules: Rules for paths to leave out of the scan.
+        relative_dir: Path of the directory relative to the root that
+            the exclude rules are anchored to, ending in ``/``, when
+            scanning a subdirectory of that root.
 
     Returns:
-        List of absolute file paths matching the specified extensions.
+        Dictionary of stat results by file path, in walk order.
     """
-
     if extensions is None:
-        extensions = [".pdf", ".txt"]
+        extensions = DEFAULT_EXTENSIONS
+    suffixes = tuple(extension.lower() for extension in extensions)
+
+    files = {}
+    visited = set()
+    pending = [(directory_path, relative_dir)]
+    while pending:
+        current_path, relative_dir = pending.pop()
+        try:
+            directory_stat = os.stat(current_path)
+            directory_key = (directory_stat.st_dev, directory_stat.st_ino)
+            if directory_key in visited:
+                continue
+            visited.add(directory_key)
+            with os.scandir(current_path) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError as error:
+            logger.warning("Cannot scan directory %s: %s", current_path, error)
+            continue
 
-    all_files = []
-    for ext in extensions:
-        pattern = os.path.join(directory_path, f"**/*{ext}")
-        files = glob.glob(pattern, recursive=True)
-        all_files.extend(files)
+        subdirectories = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            relative_path = relative_dir + entry.name
+            try:
+                is_dir = entry.is_dir()
+                if exclude_rules and exclude_rules.is_excluded(
+                    relative_path, is_dir
+                ):
+                    continue
+                if is_dir:
+                    subdirectories.append((entry.path, relative_path + "/"))
+                elif entry.name.lower().endswith(suffixes):
+                    files[entry.path] = entry.stat()
+            except OSError as error:
+                # The entry vanished or is unreadable since it was listed
+                logger.warning("Cannot stat %s: %s", entry.path, error)
+        # Walk subdirectories in name order
+        pending.extend(reversed(subdirectories))
 
     logger.info(
         "Found %d %s files in '%s' (including subdirectories)",
-        len(all_files),
+        len(files),
         str(extensions),
         directory_path
     )
-    return all_files
+    return files
+
+
+def is_scanned(
+    path: str,
+    directory_path: str,
+    is_dir: bool = False,
+    extensions: list[str] = None,
+    exclude_rules: ExcludeRules = None
+) -> bool:
+    """
+    Check if a scan of a directory would include a path.
+
+    Args:
+        path: Path of a file or directory inside the directory.
+        directory_path: Path to the scanned directory.
+        is_dir: Whether the path is a directory.
+        extensions: List of file extensions to include.
+        exclude_rules: Rules for paths to leave out of the scan.
+
+    Returns:
+        True if no part of the path is hidden or excluded, and a file
+        has one of the extensions.
+    """
+    if extensions is None:
+        extensions = DEFAULT_EXTENSIONS
+    relative_path = os.path.relpath(path, directory_path)
+    if relative_path == ".":
+        return is_dir
+    parts = relative_path.split(os.sep)
+    if parts[0] == ".." or any(part.startswith(".") for part in parts):
+        return False
+    if exclude_rules:
+        for end in range(1, len(parts) + 1):
+            if exclude_rules.is_excluded(
+                "/".join(parts[:end]), is_dir or end < len(parts)
+            ):
+                return False
+    return is_dir or path.lower().endswith(
+        tuple(extension.lower() for extension in extensions)
+    )
+
+
+def get_files_from_directory(
+    directory_path: str,
+    extensions: list[str] = None,
+    exclude_rules: ExcludeRules = None
+) -> list[str]:
+    """
+    Get all files with specified extensions from a directory.
+
+    Args:
+        directory_path: Path to the directory containing files.
+        extensions: List of file extensions to include.
+        exclude_rules: Rules for paths to leave out of the scan.
+
+    Returns:
+        List of absolute file paths matching the specified extensions.
+    """
+    return list(scan_directory(directory_path, extensions, exclude_rules))
 
 
 def load_document(file_path: str) -> list[Document]:
@@ -53,7 +267,8 @@ def load_document(file_path: str) -> list[Document]:
         file_path: Path to the file to be loaded.
 
     Returns:
-        List of Document objects containing the content and metadata.
+        List of Document objects containing the content and metadata, or
+        an empty list if the file cannot be loaded.
     """
     _, file_name = os.path.split(file_path)
     logger.info("Loading '%s'", file_name)
@@ -62,13 +277,15 @@ def load_document(file_path: str) -> list[Document]:
         return []
     _, file_extension = os.path.splitext(file_path)
 
-    if file_extension.lower() == ".pdf":
-        loader = PyPDFLoader(file_path)
-        return loader.load()
-
-    if file_extension.lower() == ".txt":
-        loader = TextLoader(file_path)
-        return loader.load()
+    try:
+        if file_extension.lower() == ".pdf":
+            return PyPDFLoader(file_path).load()
+        if file_extension.lower() == ".txt":
+            return TextLoader(file_path).load()
+    except Exception as error:  # pylint: disable=broad-exception-caught
+        # Undecodable text, malformed PDFs, or files deleted meanwhile
+        logger.error("Cannot load %s: %s", file_path, error)
+        return []
 
     logger.error("Unsupported file format: %s", file_extension)
     return []
@@ -1,23 +1,91 @@
 """Main entry point for the local-dir-rag package."""
 
+import asyncio
+import hashlib
 import logging
+import multiprocessing
 import os
-from typing import Iterable
+import stat
+import threading
+import time
+from collections import deque
+from contextlib import (
+    aclosing,
+    asynccontextmanager,
+    contextmanager,
+    nullcontext,
+)
+from dataclasses import dataclass, field
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator
+
+from langchain_core.documents import Document
 
 from langchain_core.embeddings import Embeddings
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 
+from local_dir_rag.defaults import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_BATCH_TOKENS,
+    DEFAULT_CHECKPOINT_FILES,
+    DEFAULT_CHECKPOINT_SECONDS,
+    DEFAULT_DEBOUNCE_SECONDS,
+    DEFAULT_MAX_DELAY_SECONDS,
+    DEFAULT_POLL_INTERVAL,
+)
 from local_dir_rag.document_loader import (
-    get_files_from_directory,
+    ExcludeRules,
+    is_scanned,
     load_document,
+    scan_directory,
+)
+from local_dir_rag.embedding_cache import (
+    DEFAULT_CACHE_ENTRIES,
+    EmbeddingCache,
+    embedding_model_name,
+)
+from local_dir_rag.embedding_client import (
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_RETRIES,
+    AsyncEmbeddingClient,
 )
-from local_dir_rag.file_tracker import FileTracker
-from local_dir_rag.text_processor import split_documents
+from local_dir_rag.embedding_models import (
+    IndexInfo,
+    check_embeddings,
+    create_embeddings,
+)
+from local_dir_rag.faiss_index import IndexConfig
+from local_dir_rag.file_tracker import (
+    DEFAULT_CHECKSUM_ALGORITHM,
+    FileStatus,
+    FileTracker,
+)
+from local_dir_rag.keyword_index import KeywordIndex
+from local_dir_rag.metrics import RunMetrics, max_rss_bytes
+from local_dir_rag.shards import (
+    ShardConfig,
+    ShardedVectorStore,
+    list_shards,
+    shard_path,
+)
+from local_dir_rag.text_processor import estimate_tokens, split_documents
 from local_dir_rag.vector_store import (
+    add_document_sources,
+    create_vector_database,
+    find_document_ids_by_source,
     load_vector_database,
-    remove_documents_by_source,
+    lock_vector_database,
+    recover_interrupted_saves,
+    remove_documents_by_ids,
+    save_vector_database,
+    set_document_sources,
 )
+from local_dir_rag.watcher import collect_changes, create_watcher
 
 logging.basicConfig(
     level=logging.INFO,
@@ -44,17 +112,1431 @@ def _normalize_docs_paths(docs_paths: str | Iterable[str] | None) -> list[str]:
     return normalized_paths
 
 
+def _scan_docs_paths(
+    docs_paths: list[str],
+    exclude_rules: ExcludeRules = None
+) -> dict[str, os.stat_result]:
+    """
+    Scan document directories concurrently.
+
+    Args:
+        docs_paths: Document directories.
+        exclude_rules: Rules for paths to leave out of the scan.
+
+    Returns:
+        Dictionary of stat results by file path, in the order of the
+        directories.
+    """
+    docs_directories = []
+    for docs_directory in docs_paths:
+        if not os.path.isdir(docs_directory):
+            logger.error(
+                "Documents path does not exist or is not a directory: %s",
+                docs_directory
+            )
+            continue
+        logger.info("Loading documents from %s", docs_directory)
+        docs_directories.append(docs_directory)
+
+    files: dict[str, os.stat_result] = {}
+    if not docs_directories:
+        return files
+    with ThreadPoolExecutor(max_workers=len(docs_directories)) as pool:
+        for directory_files in pool.map(
+            lambda docs_directory: scan_directory(
+                docs_directory,
+                exclude_rules=exclude_rules
+            ),
+            docs_directories
+        ):
+            files.update(directory_files)
+    return files
+
+
+class _InlineExecutor(Executor):
+    """Executor that runs each task in the calling thread on submit."""
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            future.set_exception(error)
+        return future
+
+
+def _create_process_pool(workers: int) -> Executor:
+    """
+    Create the process pool used to load and split documents.
+
+    Args:
+        workers: Number of worker processes; 1 or less runs inline.
+
+    Returns:
+        An executor.
+    """
+    if workers <= 1:
+        return _InlineExecutor()
+    # Forking a process that already runs threads can deadlock, so workers
+    # are forked from a clean server process where it is available
+    methods = multiprocessing.get_all_start_methods()
+    method = "forkserver" if "forkserver" in methods else "spawn"
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(method)
+    )
+
+
+def _run_stage(
+    executor: Executor,
+    function: Callable[[Any], Any],
+    items: Iterable[tuple[Any, Any]],
+    max_pending: int
+) -> Iterator[tuple[Any, Any]]:
+    """
+    Run one stage of the ingest pipeline.
+
+    Each item is a (context, argument) pair; ``function(argument)`` runs
+    on the executor and (context, result) pairs are yielded in input
+    order. The pending futures form a bounded queue: once max_pending
+    tasks are in flight, the stage waits for the oldest before pulling
+    more input, so a slow stage holds back the stages feeding it.
+
+    Args:
+        executor: Executor to run the stage on.
+        function: Function applied to each argument.
+        items: Stream of (context, argument) pairs.
+        max_pending: Maximum number of tasks in flight.
+
+    Yields:
+        (context, result) pairs, in input order.
+    """
+    pending = deque()
+    for context, argument in items:
+        pending.append((context, executor.submit(function, argument)))
+        if len(pending) >= max_pending:
+            context, future = pending.popleft()
+            yield context, future.result()
+    while pending:
+        context, future = pending.popleft()
+        yield context, future.result()
+
+
+@dataclass
+class _SplitFile:
+    """
+    Chunks of a file, the time taken to load and split it, and the peak
+    resident set size of the process that did.
+    """
+    chunks: list[Document]
+    pages: int
+    load_seconds: float
+    split_seconds: float
+    peak_rss_bytes: int | None = None
+
+
+def _load_and_split(file_path: str) -> _SplitFile:
+    """
+    Load a document and split it into chunks.
+
+    Runs in a worker process, so that PDF parsing and splitting of
+    several files proceed in parallel.
+
+    Args:
+        file_path: Path to the file to load.
+
+    Returns:
+        The chunks, with the time taken by each step and the peak memory
+        of the worker, which is not a child of the indexing process when
+        started by a fork server.
+    """
+    start = time.perf_counter()
+    documents = load_document(file_path)
+    loaded = time.perf_counter()
+    logger.info(
+        "Loaded %d documents from '%s'",
+        len(documents),
+        os.path.basename(file_path)
+    )
+    chunks = split_documents(documents)
+    return _SplitFile(
+        chunks,
+        len(documents),
+        loaded - start,
+        time.perf_counter() - loaded,
+        max_rss_bytes()
+    )
+
+
+@dataclass
+class IngestFile:
+    """A file and its chunks, on the way through the ingest pipeline."""
+    status: FileStatus
+    chunks: list[Document]
+
+
+@dataclass
+class EmbeddingBatch:
+    """
+    Chunks from one or more files, embedded in a single request.
+
+    ``file_paths`` holds the path of the file of each chunk. ``started``
+    lists the files whose first chunk is in the batch, and ``completed``
+    the files whose last chunk is in the batch. Files without chunks are
+    both started and completed by the batch that follows them.
+    """
+    chunks: list[Document] = field(default_factory=list)
+    file_paths: list[str] = field(default_factory=list)
+    started: list[IngestFile] = field(default_factory=list)
+    completed: list[IngestFile] = field(default_factory=list)
+
+
+def batch_chunks(
+    files: Iterable[IngestFile],
+    max_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_items: int = DEFAULT_BATCH_SIZE
+) -> Iterator[EmbeddingBatch]:
+    """
+    Group chunks across files into embedding requests.
+
+    Small files share a request, and large files are spread over several
+    requests, so that each request holds at most max_items chunks and
+    about max_tokens tokens. A single chunk larger than max_tokens is sent
+    on its own.
+
+    Args:
+        files: Files with their chunks, in order.
+        max_tokens: Token budget of a request.
+        max_items: Maximum number of chunks in a request.
+
+    Yields:
+        Embedding batches, preserving the order of files and chunks.
+    """
+    batch = EmbeddingBatch()
+    batch_tokens = 0
+    for ingest_file in files:
+        if len(ingest_file.chunks) == 0:
+            batch.started.append(ingest_file)
+        for index, chunk in enumerate(ingest_file.chunks):
+            chunk_tokens = estimate_tokens(chunk.page_content)
+            if batch.chunks and (
+                len(batch.chunks) >= max_items
+                or batch_tokens + chunk_tokens > max_tokens
+            ):
+                yield batch
+                batch = EmbeddingBatch()
+                batch_tokens = 0
+            if index == 0:
+                batch.started.append(ingest_file)
+            batch.chunks.append(chunk)
+            batch.file_paths.append(ingest_file.status.file_path)
+            batch_tokens += chunk_tokens
+        batch.completed.append(ingest_file)
+    if batch.chunks or batch.completed:
+        yield batch
+
+
+def _get_cached_embeddings(
+    texts: list[str], embedding_cache: EmbeddingCache
+) -> tuple[list[list[float] | None], list[str]]:
+    """
+    Look up the cached embeddings of texts.
+
+    Args:
+        texts: Chunk texts.
+        embedding_cache: Cache of embedding vectors.
+
+    Returns:
+        The cached vector of each text or None, and the distinct texts
+        that are not cached.
+    """
+    embeddings = embedding_cache.get_many(texts)
+    missing_texts = list(dict.fromkeys(
+        text
+        for text, embedding in zip(texts, embeddings)
+        if embedding is None
+    ))
+    return embeddings, missing_texts
+
+
+def _add_new_embeddings(
+    texts: list[str],
+    embeddings: list[list[float] | None],
+    new_embeddings: dict[str, list[float]],
+    embedding_cache: EmbeddingCache
+) -> list[list[float]]:
+    """
+    Cache newly computed embeddings and fill them in.
+
+    Args:
+        texts: Chunk texts.
+        embeddings: The cached vector of each text or None.
+        new_embeddings: Vectors of the texts that were not cached.
+        embedding_cache: Cache of embedding vectors.
+
+    Returns:
+        Embedding vectors, one per text.
+    """
+    embedding_cache.put_many(new_embeddings)
+    return [
+        new_embeddings[text] if embedding is None else embedding
+        for text, embedding in zip(texts, embeddings)
+    ]
+
+
+def _count_request(metrics: RunMetrics, texts: list[str]) -> None:
+    """Count an embedding request and the chunks and tokens it sends."""
+    metrics.count("embedding_requests")
+    metrics.count("chunks_embedded", len(texts))
+    metrics.count("tokens_embedded", sum(map(estimate_tokens, texts)))
+
+
+def _embed_batch(
+    embeddings_model: Embeddings,
+    batch: EmbeddingBatch,
+    embedding_cache: EmbeddingCache = None,
+    metrics: RunMetrics = None
+) -> list[list[float]]:
+    """
+    Embed the chunks of a batch.
+
+    With a cache, only chunks whose text is not cached are sent to the
+    model, each distinct text once, and their vectors are then cached.
+
+    Args:
+        embeddings_model: Embedding model to use.
+        batch: Batch to embed.
+        embedding_cache: Cache of embedding vectors, if any.
+        metrics: Metrics of the run, given the requests and their
+            latency.
+
+    Returns:
+        Embedding vectors, one per chunk.
+    """
+    metrics = metrics or RunMetrics()
+
+    def embed_documents(texts: list[str]) -> list[list[float]]:
+        _count_request(metrics, texts)
+        start = time.perf_counter()
+        embeddings = embeddings_model.embed_documents(texts)
+        metrics.observe(
+            "embedding_request_seconds", time.perf_counter() - start
+        )
+        return embeddings
+
+    if len(batch.chunks) == 0:
+        return []
+    texts = [chunk.page_content for chunk in batch.chunks]
+    if embedding_cache is None:
+        return embed_documents(texts)
+
+    embeddings, missing_texts = _get_cached_embeddings(texts, embedding_cache)
+    metrics.count(
+        "embedding_cache_hits",
+        sum(embedding is not None for embedding in embeddings)
+    )
+    if missing_texts:
+        embeddings = _add_new_embeddings(
+            texts,
+            embeddings,
+            dict(zip(missing_texts, embed_documents(missing_texts))),
+            embedding_cache
+        )
+    return embeddings
+
+
+async def _aembed_batch(
+    embedding_client: AsyncEmbeddingClient,
+    batch: EmbeddingBatch,
+    embedding_cache: EmbeddingCache = None,
+    metrics: RunMetrics = None
+) -> list[list[float]]:
+    """
+    Embed the chunks of a batch through the asynchronous client.
+
+    Args:
+        embedding_client: Client to send embedding requests through.
+        batch: Batch to embed.
+        embedding_cache: Cache of embedding vectors, if any.
+        metrics: Metrics of the run, given the requests and their
+            latency, including rate limiting and retries.
+
+    Returns:
+        Embedding vectors, one per chunk.
+    """
+    metrics = metrics or RunMetrics()
+
+    async def aembed_documents(texts: list[str]) -> list[list[float]]:
+        _count_request(metrics, texts)
+        start = time.perf_counter()
+        embeddings = await embedding_client.aembed_documents(texts)
+        metrics.observe(
+            "embedding_request_seconds", time.perf_counter() - start
+        )
+        return embeddings
+
+    if len(batch.chunks) == 0:
+        return []
+    texts = [chunk.page_content for chunk in batch.chunks]
+    if embedding_cache is None:
+        return await aembed_documents(texts)
+
+    embeddings, missing_texts = await asyncio.to_thread(
+        _get_cached_embeddings, texts, embedding_cache
+    )
+    metrics.count(
+        "embedding_cache_hits",
+        sum(embedding is not None for embedding in embeddings)
+    )
+    if missing_texts:
+        embeddings = await asyncio.to_thread(
+            _add_new_embeddings,
+            texts,
+            embeddings,
+            dict(zip(missing_texts, await aembed_documents(missing_texts))),
+            embedding_cache
+        )
+    return embeddings
+
+
+def _split_batches(
+    process_pool: Executor,
+    file_statuses: list[FileStatus],
+    max_pending: int,
+    metrics: RunMetrics,
+    max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[EmbeddingBatch]:
+    """
+    Load and split files on a process pool, and group their chunks.
+
+    Args:
+        process_pool: Executor to load and split files on.
+        file_statuses: Statuses of the files to index.
+        max_pending: Maximum number of files loaded ahead.
+        metrics: Metrics of the run, given the load and split times.
+        max_batch_tokens: Token budget of an embedding request.
+        max_batch_size: Maximum number of chunks in an embedding request.
+
+    Returns:
+        Embedding batches, in input order.
+    """
+    def ingest_files() -> Iterator[IngestFile]:
+        for status, split_file in _run_stage(
+            process_pool,
+            _load_and_split,
+            ((status, status.file_path) for status in file_statuses),
+            max_pending
+        ):
+            metrics.add_time("load", split_file.load_seconds)
+            metrics.add_time("split", split_file.split_seconds)
+            metrics.observe(
+                "file_load_seconds",
+                split_file.load_seconds + split_file.split_seconds
+            )
+            metrics.count("pages_parsed", split_file.pages)
+            metrics.observe_worker_rss(split_file.peak_rss_bytes)
+            yield IngestFile(status, split_file.chunks)
+
+    return batch_chunks(
+        ingest_files(),
+        max_tokens=max_batch_tokens,
+        max_items=max_batch_size
+    )
+
+
+def _ingest_files(
+    file_statuses: list[FileStatus],
+    embeddings_model: Embeddings,
+    workers: int,
+    max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_BATCH_SIZE,
+    embedding_cache: EmbeddingCache = None,
+    metrics: RunMetrics = None
+) -> Iterator[tuple[EmbeddingBatch, list[list[float]]]]:
+    """
+    Load, split and embed files through a staged pipeline.
+
+    Loading and splitting run together in a process pool, one task per
+    file, so page text crosses a process boundary only once. Chunks are
+    then grouped across files into embedding requests, which run
+    concurrently on a thread pool. Bounded queues between the stages
+    limit the number of files in memory.
+
+    Args:
+        file_statuses: Statuses of the files to index.
+        embeddings_model: Embedding model to use.
+        workers: Number of load and split processes and of concurrent
+            embedding requests.
+        max_batch_tokens: Token budget of an embedding request.
+        max_batch_size: Maximum number of chunks in an embedding request.
+        embedding_cache: Cache of embedding vectors, if any.
+        metrics: Metrics of the run, given the time of each stage.
+
+    Yields:
+        (batch, embeddings) for each embedding request, in input order.
+    """
+    metrics = metrics or RunMetrics()
+
+    def embed_batch(batch: EmbeddingBatch) -> list[list[float]]:
+        with metrics.measure("embed"):
+            return _embed_batch(
+                embeddings_model, batch, embedding_cache, metrics
+            )
+
+    max_pending = 2 * max(workers, 1)
+    with (
+        _create_process_pool(workers) as process_pool,
+        ThreadPoolExecutor(max_workers=max(workers, 1)) as thread_pool,
+    ):
+        batches = _split_batches(
+            process_pool,
+            file_statuses,
+            max_pending,
+            metrics,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_size=max_batch_size
+        )
+        yield from _run_stage(
+            thread_pool,
+            embed_batch,
+            ((batch, batch) for batch in batches),
+            max_pending
+        )
+
+
+async def _aingest_files(
+    file_statuses: list[FileStatus],
+    embedding_client: AsyncEmbeddingClient,
+    workers: int,
+    max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_BATCH_SIZE,
+    embedding_cache: EmbeddingCache = None,
+    metrics: RunMetrics = None
+) -> AsyncIterator[tuple[EmbeddingBatch, list[list[float]]]]:
+    """
+    Load, split and embed files, with embedding requests on the event loop.
+
+    Loading, splitting and batching run as in ``_ingest_files``, pulled
+    from a worker thread. Each batch becomes a task on the embedding
+    client, and up to twice the client's concurrency limit of batches are
+    embedded ahead of the one being yielded.
+
+    Args:
+        file_statuses: Statuses of the files to index.
+        embedding_client: Client to send embedding requests through.
+        workers: Number of load and split processes.
+        max_batch_tokens: Token budget of an embedding request.
+        max_batch_size: Maximum number of chunks in an embedding request.
+        embedding_cache: Cache of embedding vectors, if any.
+        metrics: Metrics of the run, given the time of each stage.
+
+    Yields:
+        (batch, embeddings) for each embedding request, in input order.
+    """
+    metrics = metrics or RunMetrics()
+
+    async def embed_batch(batch: EmbeddingBatch) -> list[list[float]]:
+        with metrics.measure("embed"):
+            return await _aembed_batch(
+                embedding_client, batch, embedding_cache, metrics
+            )
+
+    max_pending = 2 * max(embedding_client.max_concurrency, 1)
+    pending = deque()
+    with _create_process_pool(workers) as process_pool:
+        batches = _split_batches(
+            process_pool,
+            file_statuses,
+            2 * max(workers, 1),
+            metrics,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_size=max_batch_size
+        )
+        try:
+            while True:
+                batch = await asyncio.to_thread(next, batches, None)
+                if batch is None:
+                    break
+                pending.append((batch, asyncio.ensure_future(
+                    embed_batch(batch)
+                )))
+                if len(pending) >= max_pending:
+                    batch, task = pending.popleft()
+                    yield batch, await task
+            while pending:
+                batch, task = pending.popleft()
+                yield batch, await task
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+
+def _file_size(status: FileStatus) -> int:
+    """Size of a file as of its scan, or 0 if it was not stat'ed."""
+    return status.file_stat.st_size if status.file_stat else 0
+
+
+def _content_id(text: str, shard: str = "") -> str:
+    """
+    Identify a chunk by its text, so identical chunks share one id.
+
+    Args:
+        text: Text of the chunk.
+        shard: Shard that stores the chunk; chunks of different shards
+            are stored separately, so they get different ids.
+
+    Returns:
+        A hex digest of the text.
+    """
+    key = f"{shard}\0{text}" if shard else text
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+class _IndexWriter:
+    """
+    Single writer applying ingest results to the vector store and tracker.
+
+    The vector database is saved at checkpoints rather than after every
+    file. Tracker changes are held back until the checkpoint that makes
+    them durable, so an interrupted run never leaves the tracker claiming
+    files that the saved index does not contain, or forgetting files
+    whose chunks the saved index still holds.
+
+    In a sharded database, each shard is loaded when the run first
+    changes one of its files, and only changed shards are saved. Keyword
+    index changes are also held back, and applied once the vectors they
+    describe are saved.
+
+    Chunks are identified by a hash of their text, and each distinct
+    text is stored once per shard. The file tracker records which files
+    reference each chunk, and a chunk is removed only when no file
+    references it any more. Stored chunks list the files that reference
+    them in their ``sources`` metadata, and cite one of them as their
+    ``source``.
+    """
+
+    def __init__(
+        self,
+        vector_db_path: str,
+        embeddings_model: Embeddings,
+        file_tracker: FileTracker,
+        checkpoint_files: int = DEFAULT_CHECKPOINT_FILES,
+        checkpoint_seconds: float = DEFAULT_CHECKPOINT_SECONDS,
+        index_config: IndexConfig = None,
+        rebuild_index: bool = False,
+        shard_config: ShardConfig = None,
+        docs_paths: list[str] = None,
+        keyword_index: KeywordIndex = None,
+        metrics: RunMetrics = None
+    ):
+        """
+        Initialize the writer.
+
+        Args:
+            vector_db_path: Path to save the vector database.
+            embeddings_model: Embedding model of the vector database.
+            file_tracker: Tracker to record indexed files in.
+            checkpoint_files: Save after this many indexed files; 0 to
+                save only by time and at the end.
+            checkpoint_seconds: Save when this many seconds have passed
+                since the last save; 0 to save only by file count and at
+                the end.
+            index_config: Type of index to build when the run finishes
+                (default: flat).
+            rebuild_index: Rebuild the index when the run finishes, even
+                if it is already of the configured type.
+            shard_config: Partitioning of the vector database into shards
+                (default: a single index).
+            docs_paths: Documents directories of the run, which files are
+                assigned to shards by.
+            keyword_index: Keyword index to keep in step with the vector
+                database, if any.
+            metrics: Metrics of the run, given the time spent saving and
+                the indexed files.
+        """
+        self.vector_db_path = vector_db_path
+        self.embeddings_model = embeddings_model
+        self.file_tracker = file_tracker
+        self.checkpoint_files = checkpoint_files
+        self.checkpoint_seconds = checkpoint_seconds
+        self.index_config = index_config or IndexConfig()
+        self.rebuild_index = rebuild_index
+        self.shard_config = shard_config or ShardConfig()
+        self.docs_paths = docs_paths or []
+        self.keyword_index = keyword_index
+        self.metrics = metrics or RunMetrics()
+        self.files_processed = 0
+        self.chunks_written = 0
+        self.duplicate_chunks = 0
+        self.duplicate_bytes = 0
+        self._vector_dbs: dict[str, FAISS | None] = {}
+        self._shards: dict[str, str | None] = {}
+        self._dirty_shards: set[str] = set()
+        self._shard_ids: dict[str, set[str]] = {}
+        self._in_progress: dict[str, FileStatus] = {}
+        self._chunk_ids: dict[str, list[str]] = {}
+        self._pending_updates: list[FileStatus] = []
+        self._pending_chunk_ids: dict[str, list[str]] = {}
+        self._pending_removals: list[str] = []
+        self._pending_keywords: dict[str, tuple[str, str]] = {}
+        self._pending_keyword_deletes: set[str] = set()
+        self._last_checkpoint = time.monotonic()
+
+    @property
+    def vector_db(self) -> FAISS | ShardedVectorStore | None:
+        """
+        The vector database: the single index, or every saved shard.
+
+        Shards that the run did not load are memory-mapped read-only.
+        """
+        if not self.shard_config.sharded:
+            return self._vector_dbs.get("")
+        shards = {}
+        for shard in list_shards(self.vector_db_path):
+            vector_db = self._vector_dbs.get(shard)
+            if vector_db is None:
+                vector_db = load_vector_database(
+                    shard_path(self.vector_db_path, shard),
+                    self.embeddings_model,
+                    mmap=True
+                )
+            if vector_db is not None:
+                shards[shard] = vector_db
+        return ShardedVectorStore(shards) if shards else None
+
+    def _shard_for(self, file_path: str) -> str | None:
+        """
+        Get the shard of a file.
+
+        Args:
+            file_path: Path of the file.
+
+        Returns:
+            The shard name, "" if the database is not sharded, or None if
+            the file belongs to no shard.
+        """
+        if file_path not in self._shards:
+            self._shards[file_path] = self.shard_config.shard_for(
+                file_path, self.docs_paths
+            )
+        return self._shards[file_path]
+
+    def _load_shard(self, shard: str) -> FAISS | None:
+        """
+        Load a shard the first time it is used.
+
+        Args:
+            shard: Shard name, or "" for an unsharded database.
+
+        Returns:
+            The shard's vector database, or None if it was never saved.
+        """
+        if shard not in self._vector_dbs:
+            vector_db = self._vector_dbs[shard] = load_vector_database(
+                shard_path(self.vector_db_path, shard),
+                self.embeddings_model
+            )
+            self._shard_ids[shard] = (
+                set(vector_db.index_to_docstore_id.values())
+                if vector_db is not None else set()
+            )
+        return self._vector_dbs[shard]
+
+    def remove_old_chunks(
+        self,
+        deleted_files: list[str],
+        modified_files: list[FileStatus]
+    ) -> None:
+        """
+        Remove the chunks of deleted and modified files in one delete.
+
+        Chunk ids are looked up in the file tracker. Chunks of files
+        tracked before chunk ids were recorded are found in a single scan
+        of the docstore. Chunks that other files also reference are kept.
+        Modified files count as in progress until all of their new chunks
+        are written.
+
+        Args:
+            deleted_files: Paths of files that no longer exist.
+            modified_files: Statuses of files whose content changed.
+        """
+        for deleted_file in deleted_files:
+            logger.info("File deleted: %s", deleted_file)
+        for status in modified_files:
+            logger.info(
+                "File modified, removing old chunks: %s",
+                os.path.basename(status.file_path)
+            )
+        file_paths = deleted_files + [
+            status.file_path for status in modified_files
+        ]
+        chunk_ids = self.file_tracker.get_chunk_ids(file_paths)
+        files_by_shard: dict[str, list[str]] = {}
+        for file_path in file_paths:
+            shard = self._shard_for(file_path)
+            if shard is None:
+                logger.warning("No shard holds the chunks of %s", file_path)
+                continue
+            files_by_shard.setdefault(shard, []).append(file_path)
+        for shard, shard_files in files_by_shard.items():
+            if self._load_shard(shard) is not None:
+                chunk_ids.update(find_document_ids_by_source(
+                    self._vector_dbs[shard],
+                    [path for path in shard_files if path not in chunk_ids]
+                ))
+        shared = self.file_tracker.get_chunk_references(
+            (
+                chunk_id
+                for file_path in file_paths
+                for chunk_id in chunk_ids.get(file_path, [])
+            ),
+            file_paths
+        )
+        # Files indexed earlier in this run are not yet in the tracker
+        for other_ids in (self._chunk_ids, self._pending_chunk_ids):
+            for file_path, ids in other_ids.items():
+                if file_path not in file_paths:
+                    for chunk_id in ids:
+                        shared.setdefault(chunk_id, []).append(file_path)
+        removed_ids = []
+        for shard, shard_files in files_by_shard.items():
+            vector_db = self._vector_dbs.get(shard)
+            if vector_db is None:
+                continue
+            shard_ids = [
+                chunk_id
+                for file_path in shard_files
+                for chunk_id in chunk_ids.get(file_path, [])
+                if chunk_id not in shared
+            ]
+            if remove_documents_by_ids(vector_db, shard_ids):
+                self._dirty_shards.add(shard)
+            # Shared chunks are cited from the files that keep them
+            if set_document_sources(vector_db, {
+                chunk_id: shared[chunk_id]
+                for file_path in shard_files
+                for chunk_id in chunk_ids.get(file_path, [])
+                if chunk_id in shared
+            }):
+                self._dirty_shards.add(shard)
+            self._shard_ids[shard].difference_update(shard_ids)
+            removed_ids.extend(shard_ids)
+        self._delete_keywords(removed_ids)
+        for status in modified_files:
+            # Old chunk ids are kept until the file is complete, in case
+            # a checkpoint saves the index while they are still on disk
+            self._in_progress[status.file_path] = status
+            self._chunk_ids[status.file_path] = list(
+                chunk_ids.get(status.file_path, [])
+            )
+        self._pending_removals.extend(deleted_files)
+
+    def write_batch(
+        self, batch: EmbeddingBatch, embeddings: list[list[float]]
+    ) -> None:
+        """
+        Add an embedded batch to the vector store.
+
+        Args:
+            batch: Batch of chunks.
+            embeddings: Embedding vectors of the chunks.
+        """
+        for ingest_file in batch.started:
+            file_path = ingest_file.status.file_path
+            self._in_progress[file_path] = ingest_file.status
+            self._chunk_ids.setdefault(file_path, [])
+
+        if batch.chunks:
+            ids = []
+            chunks_by_shard: dict[str, list[int]] = {}
+            sources_by_shard: dict[str, dict[str, list[str]]] = {}
+            for position, file_path in enumerate(batch.file_paths):
+                shard = self._shard_for(file_path)
+                text = batch.chunks[position].page_content
+                chunk_id = _content_id(text, shard)
+                ids.append(chunk_id)
+                self._chunk_ids[file_path].append(chunk_id)
+                self._load_shard(shard)
+                shard_ids = self._shard_ids[shard]
+                if chunk_id in shard_ids:
+                    # Stored once; the tracker records each reference
+                    self.duplicate_chunks += 1
+                    self.metrics.count("chunks_deduplicated")
+                    # Text and a float32 vector that are not stored
+                    self.duplicate_bytes += (
+                        len(text.encode("utf-8"))
+                        + 4 * len(embeddings[position])
+                    )
+                    sources_by_shard.setdefault(shard, {}).setdefault(
+                        chunk_id, []
+                    ).append(file_path)
+                    continue
+                shard_ids.add(chunk_id)
+                if self.keyword_index is not None:
+                    self._pending_keywords[chunk_id] = (file_path, text)
+                chunks_by_shard.setdefault(shard, []).append(position)
+            self.chunks_written += len(batch.chunks)
+            for shard, positions in chunks_by_shard.items():
+                vector_db = self._vector_dbs[shard]
+                if vector_db is None:
+                    vector_db = self._vector_dbs[shard] = (
+                        create_vector_database(
+                            shard_path(self.vector_db_path, shard),
+                            self.embeddings_model,
+                            len(embeddings[0])
+                        )
+                    )
+                chunks = [batch.chunks[position] for position in positions]
+                vector_db.add_embeddings(
+                    [
+                        (chunk.page_content, embeddings[position])
+                        for chunk, position in zip(chunks, positions)
+                    ],
+                    [
+                        {**chunk.metadata, "sources": [
+                            batch.file_paths[position]
+                        ]}
+                        for chunk, position in zip(chunks, positions)
+                    ],
+                    ids=[ids[position] for position in positions]
+                )
+                self._dirty_shards.add(shard)
+            for shard, sources in sources_by_shard.items():
+                # Chunks stored for an earlier file are also cited from
+                # the files that repeat them
+                if add_document_sources(self._vector_dbs[shard], sources):
+                    self._dirty_shards.add(shard)
+            logger.info(
+                "Added %d chunks to the database",
+                sum(len(positions) for positions in chunks_by_shard.values())
+            )
+
+        for ingest_file in batch.completed:
+            file_path = ingest_file.status.file_path
+            file_name = os.path.basename(file_path)
+            if len(ingest_file.chunks) == 0:
+                logger.warning("No chunks created from %s", file_name)
+                if not self._chunk_ids[file_path]:
+                    # Left untracked, so the file is tried again when it
+                    # changes, or next run
+                    del self._in_progress[file_path]
+                    del self._chunk_ids[file_path]
+                # Otherwise left in progress, since the index may hold
+                # old chunks of the file
+                continue
+            self.metrics.add_files(
+                1, len(ingest_file.chunks), _file_size(ingest_file.status)
+            )
+            logger.info(
+                "Indexed %d chunks from %s (%s)",
+                len(ingest_file.chunks),
+                file_name,
+                self.metrics.progress()
+            )
+            del self._in_progress[file_path]
+            # Only the new chunks remain once the file is complete
+            self._pending_chunk_ids[file_path] = self._chunk_ids.pop(
+                file_path
+            )[-len(ingest_file.chunks):]
+            self._pending_updates.append(ingest_file.status)
+
+        self._maybe_checkpoint()
+
+    def _delete_keywords(self, chunk_ids: list[str]) -> None:
+        """
+        Delete chunks from the keyword index at the next checkpoint.
+
+        Args:
+            chunk_ids: Ids of the chunks removed from the vector database.
+        """
+        if self.keyword_index is None:
+            return
+        for chunk_id in chunk_ids:
+            # Chunks added since the last checkpoint are simply not added
+            if self._pending_keywords.pop(chunk_id, None) is None:
+                self._pending_keyword_deletes.add(chunk_id)
+
+    def backfill_keyword_index(self) -> int:
+        """
+        Add the chunks already in the vector database to an empty keyword
+        index, in one transaction.
+
+        Returns:
+            Number of chunks added.
+        """
+        added = 0
+
+        def existing_chunks() -> Iterator[tuple[str, str, str]]:
+            nonlocal added
+            for shard in list_shards(self.vector_db_path):
+                vector_db = self._load_shard(shard)
+                if vector_db is None:
+                    continue
+                doc_ids = list(vector_db.index_to_docstore_id.values())
+                for start in range(0, len(doc_ids), DEFAULT_BATCH_SIZE):
+                    for doc in vector_db.get_by_ids(
+                        doc_ids[start:start + DEFAULT_BATCH_SIZE]
+                    ):
+                        added += 1
+                        yield (
+                            doc.id,
+                            doc.metadata.get("source"),
+                            doc.page_content
+                        )
+
+        self.keyword_index.update(added=existing_chunks())
+        if added:
+            logger.info(
+                "Added %d existing chunks to the keyword index", added
+            )
+        return added
+
+    def _maybe_checkpoint(self) -> None:
+        """Save a checkpoint if the file count or time limit is reached."""
+        due_by_files = (
+            self.checkpoint_files > 0
+            and len(self._pending_updates) >= self.checkpoint_files
+        )
+        due_by_time = (
+            self.checkpoint_seconds > 0
+            and time.monotonic() - self._last_checkpoint
+            >= self.checkpoint_seconds
+        )
+        if due_by_files or due_by_time:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """
+        Save the vector database, then record pending tracker changes.
+
+        Files with only some of their chunks written so far are marked
+        incomplete in the tracker before the save, with the ids of all the
+        chunks the saved index may hold for them, so that the next run
+        replaces their chunks if this one is interrupted.
+        """
+        if self._dirty_shards:
+            if self._in_progress:
+                self.file_tracker.mark_files_incomplete({
+                    file_path: self._chunk_ids[file_path]
+                    for file_path in self._in_progress
+                })
+            if self.shard_config.sharded:
+                # Register new shards before saving them
+                self.shard_config.save(self.vector_db_path)
+            for shard in sorted(self._dirty_shards):
+                with self.metrics.measure("save", "save_seconds"):
+                    save_vector_database(
+                        self._vector_dbs[shard],
+                        shard_path(self.vector_db_path, shard)
+                    )
+            self._dirty_shards.clear()
+        if self._pending_keywords or self._pending_keyword_deletes:
+            self.keyword_index.update(
+                added=(
+                    (chunk_id, source, text)
+                    for chunk_id, (source, text)
+                    in self._pending_keywords.items()
+                ),
+                deleted=self._pending_keyword_deletes
+            )
+            self._pending_keywords = {}
+            self._pending_keyword_deletes = set()
+        if self._pending_removals:
+            self.file_tracker.remove_files(self._pending_removals)
+        if self._pending_updates:
+            # Update file tracker after the index is durable
+            self.file_tracker.update_file_checksums(
+                self._pending_updates, self._pending_chunk_ids
+            )
+            self.files_processed += len(self._pending_updates)
+        self._pending_removals = []
+        self._pending_updates = []
+        self._pending_chunk_ids = {}
+        self._last_checkpoint = time.monotonic()
+
+    def finish(self) -> None:
+        """
+        Convert the index to the configured type and save the last
+        checkpoint.
+
+        Chunks are added to the index as it is while the run progresses,
+        so a new database starts flat; approximate indexes are built, or
+        IVF lists trained, from all vectors once they are written. Shards
+        the run did not change are converted only when their saved
+        configuration differs, or the index is rebuilt. Converted and
+        rebuilt indexes leave out the vectors of deleted documents.
+        """
+        shards = set(self._vector_dbs)
+        if not self.shard_config.sharded:
+            shards.add("")
+        else:
+            shards.update(
+                shard for shard in list_shards(self.vector_db_path)
+                if self.rebuild_index or IndexConfig.load(
+                    shard_path(self.vector_db_path, shard)
+                ) != self.index_config
+            )
+        for shard in sorted(shards):
+            vector_db = self._load_shard(shard)
+            if vector_db is None:
+                continue
+            with self.metrics.measure("save"):
+                converted = vector_db.convert_index(
+                    self.index_config, rebuild=self.rebuild_index
+                )
+            if converted:
+                self._dirty_shards.add(shard)
+        self.checkpoint()
+        for shard in shards:
+            if shard and self._vector_dbs[shard] is not None:
+                self.index_config.save(shard_path(self.vector_db_path, shard))
+        self.index_config.save(self.vector_db_path)
+        self.shard_config.save(self.vector_db_path)
+        dimensions = {
+            vector_db.index.d
+            for vector_db in self._vector_dbs.values()
+            if vector_db is not None
+        }
+        if dimensions:
+            IndexInfo(
+                embedding_model_name(self.embeddings_model),
+                dimensions.pop()
+            ).save(self.vector_db_path)
+
+
+@dataclass
+class _IndexingRun:
+    """State of an incremental indexing run, shared by both entry points."""
+    writer: _IndexWriter
+    files_to_index: list[FileStatus]
+    files_skipped: int
+    embedding_cache: EmbeddingCache | None
+    metrics: RunMetrics
+
+
+def _shard_config(vector_db_path: str, shard_by: str | None) -> ShardConfig:
+    """
+    Get the shard configuration of a vector database.
+
+    Args:
+        vector_db_path: Path to the vector database.
+        shard_by: Requested partitioning, or None for the saved one.
+
+    Returns:
+        The saved configuration, or a new one for a new database.
+
+    Raises:
+        ValueError: If the database is already partitioned differently.
+    """
+    shard_config = ShardConfig.load(vector_db_path) or ShardConfig()
+    if shard_by is None or shard_by == shard_config.shard_by:
+        return shard_config
+    if shard_config.partitions or os.path.exists(
+        os.path.join(vector_db_path, "index.faiss")
+    ):
+        raise ValueError(
+            f"Vector database at {vector_db_path} is sharded by "
+            f"{shard_config.shard_by}; embed into a new vector database "
+            f"path to shard by {shard_by}"
+        )
+    return ShardConfig(shard_by)
+
+
+@contextmanager
+def _open_writer(
+    docs_paths: list[str],
+    vector_db_path: str,
+    embeddings_model: Embeddings,
+    verify_checksums: bool,
+    checksum_algorithm: str,
+    workers: int,
+    checkpoint_files: int,
+    checkpoint_seconds: float,
+    embedding_cache_entries: int,
+    index_config: IndexConfig | None,
+    rebuild_index: bool,
+    shard_by: str | None,
+    metrics: RunMetrics
+) -> Iterator[tuple[_IndexWriter, EmbeddingCache | None]]:
+    """
+    Lock a vector database for writing, open its file tracker, embedding
+    cache and keyword index, and create its writer.
+
+    Args:
+        docs_paths: Normalized documents directories.
+        vector_db_path, embeddings_model, verify_checksums,
+        checksum_algorithm, workers, checkpoint_files,
+        checkpoint_seconds, embedding_cache_entries, index_config,
+        rebuild_index, shard_by, metrics:
+            See ``embed_docs``.
+
+    Yields:
+        The writer, and the embedding cache if it is enabled.
+
+    Raises:
+        RuntimeError: If another process is writing the vector database.
+    """
+    check_embeddings(vector_db_path, embeddings_model)
+
+    # Initialize file tracker (creates directory if needed)
+    with (
+        lock_vector_database(vector_db_path),
+        FileTracker(
+            vector_db_path,
+            verify_checksums=verify_checksums,
+            checksum_algorithm=checksum_algorithm,
+            max_workers=workers if workers > 1 else None
+        ) as file_tracker,
+        EmbeddingCache(
+            vector_db_path,
+            embedding_model_name(embeddings_model),
+            max_entries=embedding_cache_entries
+        ) if embedding_cache_entries > 0 else nullcontext()
+        as embedding_cache,
+        KeywordIndex(vector_db_path) as keyword_index,
+    ):
+        logger.info("Vector database path %s", vector_db_path)
+        recover_interrupted_saves(vector_db_path)
+        writer = _IndexWriter(
+            vector_db_path,
+            embeddings_model,
+            file_tracker,
+            checkpoint_files=checkpoint_files,
+            checkpoint_seconds=checkpoint_seconds,
+            index_config=index_config or IndexConfig.load(vector_db_path),
+            rebuild_index=rebuild_index,
+            shard_config=_shard_config(vector_db_path, shard_by),
+            docs_paths=docs_paths,
+            keyword_index=keyword_index,
+            metrics=metrics
+        )
+        if keyword_index.count() == 0:
+            # Databases created before the keyword index
+            writer.backfill_keyword_index()
+        yield writer, embedding_cache
+
+
+def _plan_files(
+    writer: _IndexWriter,
+    file_stats: dict[str, os.stat_result],
+    deleted_files: list[str]
+) -> tuple[list[FileStatus], int]:
+    """
+    Find the files to index, and remove the chunks of deleted and
+    modified files before any are added.
+
+    Args:
+        writer: Writer of the vector database.
+        file_stats: Stat results of the files to check, by file path.
+        deleted_files: Paths of tracked files that no longer exist.
+
+    Returns:
+        Statuses of the new and modified files, and the number of
+        unchanged files.
+    """
+    file_tracker = writer.file_tracker
+    metrics = writer.metrics
+    files_hashed = file_tracker.files_hashed
+    bytes_hashed = file_tracker.bytes_hashed
+    files_skipped = 0
+    files_to_index = []
+    deleted_files = list(deleted_files)
+    with metrics.measure("hash"):
+        for file_status in file_tracker.get_file_statuses(
+            list(file_stats), file_stats
+        ):
+            if file_status.needs_indexing:
+                files_to_index.append(file_status)
+            elif file_status.is_deleted:
+                # Deleted since the scan; only tracked files have chunks
+                if file_status.checksum is not None:
+                    deleted_files.append(file_status.file_path)
+            else:
+                logger.info(
+                    "Skipping unchanged file: %s",
+                    os.path.basename(file_status.file_path)
+                )
+                files_skipped += 1
+    metrics.count("files_hashed", file_tracker.files_hashed - files_hashed)
+    metrics.count("bytes_hashed", file_tracker.bytes_hashed - bytes_hashed)
+    metrics.count("files_skipped", files_skipped)
+    metrics.count("files_deleted", len(deleted_files))
+    metrics.start_files(
+        len(files_to_index), sum(map(_file_size, files_to_index))
+    )
+
+    writer.remove_old_chunks(deleted_files, [
+        file_status for file_status in files_to_index
+        if file_status.is_modified
+    ])
+    return files_to_index, files_skipped
+
+
+@contextmanager
+def _indexing_run(
+    docs_paths: str | Iterable[str],
+    vector_db_path: str,
+    embeddings_model: Embeddings,
+    verify_checksums: bool,
+    checksum_algorithm: str,
+    exclude_patterns: list[str] | None,
+    workers: int,
+    checkpoint_files: int,
+    checkpoint_seconds: float,
+    embedding_cache_entries: int,
+    index_config: IndexConfig | None,
+    rebuild_index: bool,
+    shard_by: str | None,
+    metrics: RunMetrics | None
+) -> Iterator[_IndexingRun]:
+    """
+    Prepare an incremental indexing run, and finish it when the block exits.
+
+    Before the block, the file tracker, embedding cache and keyword index
+    are opened, the document directories are scanned, and the chunks of
+    deleted and modified files are removed, loading the vector database
+    or the shards that hold them. The block writes the embedded chunks of
+    the files to index; when it exits normally, the index is converted to
+    the configured type, the last checkpoint is saved and the run summary
+    logged.
+
+    Args:
+        See ``embed_docs``.
+
+    Yields:
+        The indexing run.
+    """
+    normalized_docs_paths = _normalize_docs_paths(docs_paths)
+    if len(normalized_docs_paths) == 0:
+        raise ValueError("Documents path is not set.")
+    metrics = metrics or RunMetrics()
+
+    with _open_writer(
+        normalized_docs_paths,
+        vector_db_path,
+        embeddings_model,
+        verify_checksums,
+        checksum_algorithm,
+        workers,
+        checkpoint_files,
+        checkpoint_seconds,
+        embedding_cache_entries,
+        index_config,
+        rebuild_index,
+        shard_by,
+        metrics
+    ) as (writer, embedding_cache):
+        with metrics.measure("scan"):
+            file_stats = _scan_docs_paths(
+                normalized_docs_paths,
+                ExcludeRules.from_patterns(exclude_patterns)
+            )
+        with metrics.measure("hash"):
+            deleted_files = writer.file_tracker.get_deleted_files(
+                list(file_stats)
+            )
+        files_to_index, files_skipped = _plan_files(
+            writer, file_stats, deleted_files
+        )
+
+        yield _IndexingRun(
+            writer, files_to_index, files_skipped, embedding_cache, metrics
+        )
+        writer.finish()
+        metrics.finish()
+
+        logger.info(
+            "Indexing complete: %d files processed, %d files skipped",
+            writer.files_processed,
+            files_skipped
+        )
+        logger.info(
+            "Stage times: %s",
+            ", ".join(
+                f"{stage} {seconds:.1f}s"
+                for stage, seconds in metrics.stage_seconds.items()
+            )
+        )
+        if writer.duplicate_chunks:
+            logger.info(
+                "Deduplicated %d of %d chunks, saving about %.1f MiB",
+                writer.duplicate_chunks,
+                writer.chunks_written,
+                writer.duplicate_bytes / (1024 * 1024)
+            )
+        if embedding_cache is not None:
+            logger.info(
+                "Embedding cache: %d hits, %d misses (%.1f%% hit rate)",
+                embedding_cache.hits,
+                embedding_cache.misses,
+                100 * embedding_cache.hit_rate
+            )
+
+
+@asynccontextmanager
+async def _aindexing_run(*args) -> AsyncIterator[_IndexingRun]:
+    """
+    Prepare and finish an incremental indexing run on a worker thread.
+
+    Scanning, hashing and removing old chunks before the block, and
+    converting and saving the index after it, take seconds on large
+    trees, so they run off the event loop.
+
+    Args:
+        See ``_indexing_run``.
+
+    Yields:
+        The indexing run.
+    """
+    context = _indexing_run(*args)
+    run = await asyncio.to_thread(context.__enter__)
+    try:
+        yield run
+    except BaseException as error:
+        if not await asyncio.to_thread(
+            context.__exit__, type(error), error, error.__traceback__
+        ):
+            raise
+    else:
+        await asyncio.to_thread(context.__exit__, None, None, None)
+
+
 def embed_docs(
     docs_paths: str | Iterable[str] = None,
     vector_db_path: str = None,
-    embeddings_model: Embeddings = None
+    embeddings_model: Embeddings = None,
+    verify_checksums: bool = False,
+    checksum_algorithm: str = DEFAULT_CHECKSUM_ALGORITHM,
+    exclude_patterns: list[str] = None,
+    workers: int = 1,
+    max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint_files: int = DEFAULT_CHECKPOINT_FILES,
+    checkpoint_seconds: float = DEFAULT_CHECKPOINT_SECONDS,
+    embedding_cache_entries: int = DEFAULT_CACHE_ENTRIES,
+    index_config: IndexConfig = None,
+    rebuild_index: bool = False,
+    shard_by: str = None,
+    metrics: RunMetrics = None
 ):
     """
     Create and save a vector database from documents.
 
     Uses incremental indexing: only new or modified files are processed.
     Modified files have their old chunks removed before re-indexing.
-    Deleted files have their chunks removed from the vector store.
+    Deleted files have their chunks removed from the vector store. The
+    chunk ids of each file are recorded in the file tracker, so removal
+    does not scan the vector store.
+
+    Files are processed by a pipeline: scan, status, load and split in
+    worker processes, embed concurrently in requests that group chunks
+    across files, and write to the vector store from a single thread in
+    the original file order.
+
+    A sharded vector database keeps one index per partition of the
+    documents, under ``shards`` in the vector database directory; a run
+    loads and saves only the shards of the files it changes.
 
     Args:
         docs_paths (str | Iterable[str], optional): One or more document
@@ -62,99 +1544,439 @@ def embed_docs(
             ``os.pathsep``.
         vector_db_path (str, optional): Path to save the vector database.
         embeddings_model (Embeddings, optional): Embedding model to use.
+            Defaults to the model selected by the ``EMBEDDINGS``
+            environment variable, or OpenAI. A database is only updated
+            with the model it was built with.
+        verify_checksums (bool, optional): Hash every file to detect
+            changes, even when its size and modification time are unchanged.
+        checksum_algorithm (str, optional): Algorithm used to checksum new
+            and changed files.
+        exclude_patterns (list[str], optional): Gitignore-style patterns,
+            relative to each document directory, of paths to leave out.
+        workers (int, optional): Number of processes that load and split
+            documents, and of concurrent embedding requests. With 1,
+            loading and splitting run in the calling process.
+        max_batch_tokens (int, optional): Estimated token budget of an
+            embedding request.
+        max_batch_size (int, optional): Maximum number of chunks in an
+            embedding request.
+        checkpoint_files (int, optional): Save the vector database after
+            this many indexed files; 0 to disable.
+        checkpoint_seconds (float, optional): Save the vector database
+            when this many seconds have passed since the last save; 0 to
+            disable. The database is always saved at the end of the run.
+        embedding_cache_entries (int, optional): Maximum number of
+            embedding vectors kept in the cache in the vector database
+            directory, so unchanged chunks are not embedded again; 0 to
+            disable the cache.
+        index_config (IndexConfig, optional): Type and parameters of the
+            FAISS index. Defaults to the configuration saved with the
+            vector database, or a flat index.
+        rebuild_index (bool, optional): Rebuild the index at the end of
+            the run even if it is already of the configured type, for
+            example to retrain IVF lists after the corpus has grown.
+        shard_by (str, optional): Partitioning of a new vector database
+            into shards: ``none`` for a single index, ``root`` for one
+            shard per documents directory, or ``subdirectory`` for one
+            shard per top-level subdirectory. Defaults to the saved
+            partitioning, or a single index.
+        metrics (RunMetrics, optional): Metrics to record the time of
+            each stage and the indexed files in.
 
     Returns:
-        FAISS: The vector database.
+        FAISS | ShardedVectorStore: The vector database.
     """
     if embeddings_model is None:
-        embeddings_model = OpenAIEmbeddings()
+        embeddings_model = create_embeddings()
 
-    normalized_docs_paths = _normalize_docs_paths(docs_paths)
-    if len(normalized_docs_paths) == 0:
-        raise ValueError("Documents path is not set.")
+    with _indexing_run(
+        docs_paths,
+        vector_db_path,
+        embeddings_model,
+        verify_checksums,
+        checksum_algorithm,
+        exclude_patterns,
+        workers,
+        checkpoint_files,
+        checkpoint_seconds,
+        embedding_cache_entries,
+        index_config,
+        rebuild_index,
+        shard_by,
+        metrics
+    ) as run:
+        for batch, embeddings in _ingest_files(
+            run.files_to_index,
+            embeddings_model,
+            workers,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_size=max_batch_size,
+            embedding_cache=run.embedding_cache,
+            metrics=run.metrics
+        ):
+            run.writer.write_batch(batch, embeddings)
 
-    # Initialize file tracker (creates directory if needed)
-    file_tracker = FileTracker(vector_db_path)
+    return run.writer.vector_db
 
-    # Attempt to load vector database from the specified path,
-    # if it exists
-    vector_db = load_vector_database(
-        vector_db_path,
-        embeddings_model
+
+async def aembed_docs(
+    docs_paths: str | Iterable[str] = None,
+    vector_db_path: str = None,
+    embeddings_model: Embeddings = None,
+    verify_checksums: bool = False,
+    checksum_algorithm: str = DEFAULT_CHECKSUM_ALGORITHM,
+    exclude_patterns: list[str] = None,
+    workers: int = 1,
+    max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint_files: int = DEFAULT_CHECKPOINT_FILES,
+    checkpoint_seconds: float = DEFAULT_CHECKPOINT_SECONDS,
+    embedding_cache_entries: int = DEFAULT_CACHE_ENTRIES,
+    index_config: IndexConfig = None,
+    rebuild_index: bool = False,
+    shard_by: str = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    requests_per_minute: float = None,
+    tokens_per_minute: float = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    metrics: RunMetrics = None
+):
+    """
+    Create and save a vector database from documents, embedding them
+    with concurrent asynchronous requests.
+
+    Works as ``embed_docs``, except that embedding requests are sent
+    through an ``AsyncEmbeddingClient``: up to max_concurrency requests
+    are in flight, request and token rates are limited, and requests
+    rejected with 429 or 5xx responses are retried with exponential
+    backoff and smaller batches. Scanning, hashing, writes to the
+    vector store and tracker, and saves run on worker threads, so the
+    event loop keeps serving other coroutines.
+
+    Args:
+        docs_paths, vector_db_path, verify_checksums, checksum_algorithm,
+        exclude_patterns, max_batch_tokens, max_batch_size,
+        checkpoint_files, checkpoint_seconds, embedding_cache_entries,
+        index_config, rebuild_index, shard_by, metrics:
+            See ``embed_docs``.
+        embeddings_model (Embeddings, optional): Embedding model to use.
+            Defaults to the model selected by the ``EMBEDDINGS``
+            environment variable, with OpenAI's own retries off.
+        workers (int, optional): Number of processes that load and split
+            documents.
+        max_concurrency (int, optional): Maximum number of embedding
+            requests in flight.
+        requests_per_minute (float, optional): Embedding request rate
+            limit.
+        tokens_per_minute (float, optional): Estimated embedding token
+            rate limit.
+        max_retries (int, optional): Number of times a rejected request
+            is retried.
+
+    Returns:
+        FAISS | ShardedVectorStore: The vector database.
+    """
+    if embeddings_model is None:
+        embeddings_model = create_embeddings(max_retries=0)
+    embedding_client = AsyncEmbeddingClient(
+        embeddings_model,
+        max_concurrency=max_concurrency,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        max_batch_size=max_batch_size,
+        max_retries=max_retries
     )
-    logger.info("Vector database path %s", vector_db_path)
 
-    files: list[str] = []
-    for docs_directory in normalized_docs_paths:
-        if not os.path.isdir(docs_directory):
-            logger.error(
-                "Documents path does not exist or is not a directory: %s",
-                docs_directory
+    async with _aindexing_run(
+        docs_paths,
+        vector_db_path,
+        embeddings_model,
+        verify_checksums,
+        checksum_algorithm,
+        exclude_patterns,
+        workers,
+        checkpoint_files,
+        checkpoint_seconds,
+        embedding_cache_entries,
+        index_config,
+        rebuild_index,
+        shard_by,
+        metrics
+    ) as run:
+        async with aclosing(_aingest_files(
+            run.files_to_index,
+            embedding_client,
+            workers,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_size=max_batch_size,
+            embedding_cache=run.embedding_cache,
+            metrics=run.metrics
+        )) as results:
+            async for batch, embeddings in results:
+                await asyncio.to_thread(
+                    run.writer.write_batch, batch, embeddings
+                )
+        if embedding_client.retries:
+            logger.info(
+                "Retried %d embedding requests",
+                embedding_client.retries
             )
-            continue
-        logger.info("Loading documents from %s", docs_directory)
-        files.extend(get_files_from_directory(docs_directory))
-
-    # Handle deleted files
-    deleted_files = file_tracker.get_deleted_files(files)
-    for deleted_file in deleted_files:
-        logger.info("File deleted: %s", deleted_file)
-        if vector_db is not None:
-            remove_documents_by_source(vector_db, deleted_file)
-        file_tracker.remove_file(deleted_file)
-
-    # Process each file
-    files_processed = 0
-    files_skipped = 0
 
-    for file_path in files:
-        file_status = file_tracker.get_file_status(file_path)
-        _, file_name = os.path.split(file_path)
+    return run.writer.vector_db
 
-        if not file_status.needs_indexing:
-            logger.info("Skipping unchanged file: %s", file_name)
-            files_skipped += 1
-            continue
 
-        # If file was modified, remove old chunks first
-        if file_status.is_modified and vector_db is not None:
-            logger.info("File modified, removing old chunks: %s", file_name)
-            remove_documents_by_source(vector_db, file_path)
+def _docs_root(path: str, docs_paths: list[str]) -> str | None:
+    """Get the innermost documents directory containing a path."""
+    roots = [
+        docs_path for docs_path in docs_paths
+        if path == docs_path or path.startswith(os.path.join(docs_path, ""))
+    ]
+    return max(roots, key=len) if roots else None
 
-        documents = load_document(file_path)
-        logger.info(
-            "Loaded %d documents from '%s'",
-            len(documents),
-            file_name
-        )
-        chunks = split_documents(documents)
-        if len(chunks) == 0:
-            logger.warning("No chunks created from %s", file_name)
+
+def _resolve_changes(
+    changed_paths: set[str],
+    docs_paths: list[str],
+    exclude_rules: ExcludeRules,
+    file_tracker: FileTracker
+) -> tuple[dict[str, os.stat_result], list[str]]:
+    """
+    Find the files affected by changed paths.
+
+    Changed directories are scanned again. Tracked files under removed
+    paths, or missing from the scan of their directory, are deleted.
+
+    Args:
+        changed_paths: Paths of changed files and directories.
+        docs_paths: Normalized documents directories.
+        exclude_rules: Rules for paths to leave out.
+        file_tracker: Tracker of the indexed files.
+
+    Returns:
+        Stat results of the existing files, by file path, and the paths
+        of the tracked files that no longer exist.
+    """
+    file_stats = {}
+    removed_paths = []
+    scanned_directories = []
+    for path in sorted(changed_paths):
+        root = _docs_root(path, docs_paths)
+        if root is None:
+            continue
+        try:
+            path_stat = os.stat(path)
+        except FileNotFoundError:
+            removed_paths.append(path)
+            continue
+        except OSError as error:
+            logger.warning("Cannot stat %s: %s", path, error)
+            continue
+        is_dir = stat.S_ISDIR(path_stat.st_mode)
+        if not is_scanned(path, root, is_dir, exclude_rules=exclude_rules):
+            continue
+        if not is_dir:
+            file_stats[path] = path_stat
             continue
-        logger.info("Created %d chunks", len(chunks))
-        # Add chunks to the vector database
-        if vector_db is None:
-            vector_db = FAISS.from_documents(
-                chunks,
-                embeddings_model
+        relative_dir = os.path.relpath(path, root).replace(os.sep, "/")
+        scanned_directories.append(path)
+        file_stats.update(scan_directory(
+            path,
+            exclude_rules=exclude_rules,
+            relative_dir="" if relative_dir == "." else relative_dir + "/"
+        ))
+
+    deleted_files = []
+    if removed_paths or scanned_directories:
+        deleted_files = [
+            file_path for file_path in file_tracker.get_all_tracked_files()
+            if any(
+                file_path == path
+                or file_path.startswith(os.path.join(path, ""))
+                for path in removed_paths
+            ) or (
+                file_path not in file_stats
+                and any(
+                    file_path.startswith(os.path.join(path, ""))
+                    for path in scanned_directories
+                )
             )
-        else:
-            # Append to the existing database
-            vector_db.add_documents(chunks)
-        logger.info("Added %d chunks to the database", len(chunks))
-        vector_db.save_local(vector_db_path)
+        ]
+    return file_stats, deleted_files
 
-        # Update file tracker after successful indexing
-        file_tracker.update_file_checksum(file_path)
-        files_processed += 1
 
-    logger.info(
-        "Indexing complete: %d files processed, %d files skipped",
-        files_processed,
-        files_skipped
-    )
+def watch_docs(
+    docs_paths: str | Iterable[str] = None,
+    vector_db_path: str = None,
+    embeddings_model: Embeddings = None,
+    verify_checksums: bool = False,
+    checksum_algorithm: str = DEFAULT_CHECKSUM_ALGORITHM,
+    exclude_patterns: list[str] = None,
+    workers: int = 1,
+    max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint_files: int = DEFAULT_CHECKPOINT_FILES,
+    checkpoint_seconds: float = DEFAULT_CHECKPOINT_SECONDS,
+    embedding_cache_entries: int = DEFAULT_CACHE_ENTRIES,
+    index_config: IndexConfig = None,
+    shard_by: str = None,
+    debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS,
+    max_delay_seconds: float = DEFAULT_MAX_DELAY_SECONDS,
+    polling: bool = False,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    stop_event: threading.Event = None
+) -> None:
+    """
+    Keep a vector database up to date with its documents directories.
+
+    The documents are indexed as by ``embed_docs``, then the directories
+    are watched for changes, with inotify or by polling. The file tracker,
+    embedding cache, keyword index and loaded indexes stay open between
+    changes. A burst of changes is indexed once it settles: only the
+    changed files are checked, and new, modified and deleted files are
+    handled as in a full run, without scanning or hashing the others.
+    The vector database is saved after each burst, so running queries
+    reload it. Files that cannot be loaded are left untracked, and tried
+    again when they change; if indexing a burst fails, its paths are
+    checked again with the next burst.
+
+    Args:
+        docs_paths, vector_db_path, embeddings_model, verify_checksums,
+        checksum_algorithm, exclude_patterns, workers, max_batch_tokens,
+        max_batch_size, checkpoint_files, checkpoint_seconds,
+        embedding_cache_entries, index_config, shard_by:
+            See ``embed_docs``.
+        debounce_seconds (float, optional): Seconds without changes that
+            end a burst.
+        max_delay_seconds (float, optional): Maximum seconds a burst is
+            collected before it is indexed.
+        polling (bool, optional): Poll the directories even where inotify
+            is available, for example on network filesystems.
+        poll_interval (float, optional): Seconds between polls.
+        stop_event (threading.Event, optional): Stop watching when set;
+            by default, watch until interrupted.
+    """
+    normalized_docs_paths = _normalize_docs_paths(docs_paths)
+    if len(normalized_docs_paths) == 0:
+        raise ValueError("Documents path is not set.")
+    if embeddings_model is None:
+        embeddings_model = create_embeddings()
+    exclude_rules = ExcludeRules.from_patterns(exclude_patterns)
+    stop_event = stop_event or threading.Event()
+
+    def include(path: str, is_dir: bool) -> bool:
+        root = _docs_root(path, normalized_docs_paths)
+        return root is not None and is_scanned(
+            path, root, is_dir, exclude_rules=exclude_rules
+        )
+
+    def index_changes(
+        writer: _IndexWriter,
+        embedding_cache: EmbeddingCache | None,
+        file_stats: dict[str, os.stat_result],
+        deleted_files: list[str]
+    ) -> None:
+        metrics = writer.metrics = RunMetrics()
+        files_to_index, files_skipped = _plan_files(
+            writer, file_stats, deleted_files
+        )
+        if not files_to_index and not deleted_files:
+            return
+        for batch, embeddings in _ingest_files(
+            files_to_index,
+            embeddings_model,
+            workers,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_size=max_batch_size,
+            embedding_cache=embedding_cache,
+            metrics=metrics
+        ):
+            writer.write_batch(batch, embeddings)
+        writer.finish()
+        metrics.finish()
+        logger.info(
+            "Index updated in %.1fs: %d files indexed, %d deleted, "
+            "%d unchanged",
+            metrics.elapsed_seconds,
+            metrics.files,
+            len(deleted_files),
+            files_skipped
+        )
 
-    return vector_db
+    # Watch before the first run, so no change made during it is missed
+    with (
+        create_watcher(
+            [
+                docs_path for docs_path in normalized_docs_paths
+                if os.path.isdir(docs_path)
+            ],
+            include,
+            polling=polling,
+            poll_interval=poll_interval
+        ) as watcher,
+        _open_writer(
+            normalized_docs_paths,
+            vector_db_path,
+            embeddings_model,
+            verify_checksums,
+            checksum_algorithm,
+            workers,
+            checkpoint_files,
+            checkpoint_seconds,
+            embedding_cache_entries,
+            index_config,
+            False,
+            shard_by,
+            RunMetrics()
+        ) as (writer, embedding_cache),
+    ):
+        # Paths of a burst that failed, checked again with the next one
+        failed_paths = set()
+        try:
+            file_stats = _scan_docs_paths(
+                normalized_docs_paths, exclude_rules
+            )
+            index_changes(
+                writer,
+                embedding_cache,
+                file_stats,
+                writer.file_tracker.get_deleted_files(list(file_stats))
+            )
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Indexing the documents failed")
+            failed_paths.update(normalized_docs_paths)
+        logger.info(
+            "Watching %s for changes", ", ".join(normalized_docs_paths)
+        )
+
+        while not stop_event.is_set():
+            # Wake up regularly to notice the stop event
+            changed_paths = collect_changes(
+                watcher,
+                timeout=1.0,
+                debounce_seconds=debounce_seconds,
+                max_delay_seconds=max_delay_seconds
+            )
+            if not changed_paths:
+                continue
+            logger.info("%d paths changed", len(changed_paths))
+            changed_paths |= failed_paths
+            failed_paths = set()
+            try:
+                file_stats, deleted_files = _resolve_changes(
+                    changed_paths,
+                    normalized_docs_paths,
+                    exclude_rules,
+                    writer.file_tracker
+                )
+                index_changes(
+                    writer, embedding_cache, file_stats, deleted_files
+                )
+            except Exception:  # pylint: disable=broad-exception-caught
+                # For example, the embedding model is unreachable
+                logger.exception(
+                    "Indexing %d changed paths failed", len(changed_paths)
+                )
+                failed_paths = changed_paths
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+"""Persistent cache of embedding vectors using SQLite."""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from local_dir_rag.defaults import DEFAULT_CACHE_ENTRIES
+from local_dir_rag.file_tracker import SQLITE_PRAGMAS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Fraction of max_entries kept after eviction, so that eviction runs
+# once per batch of new entries rather than on every insert
+EVICTION_TARGET = 0.9
+
+
+def embedding_model_name(embeddings_model: Embeddings) -> str:
+    """
+    Identify an embedding model, for keying cached vectors.
+
+    Args:
+        embeddings_model: Embedding model.
+
+    Returns:
+        The model name, with the output dimensions if they are set.
+    """
+    name = (
+        getattr(embeddings_model, "model", None)
+        or getattr(embeddings_model, "model_name", None)
+        or type(embeddings_model).__name__
+    )
+    dimensions = getattr(embeddings_model, "dimensions", None)
+    if dimensions:
+        return f"{name}:{dimensions}"
+    return str(name)
+
+
+def _text_hash(text: str) -> bytes:
+    """Hash chunk text for use as a cache key."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Cache of embedding vectors keyed by model name and chunk text hash.
+
+    Vectors are stored as float32 in an SQLite database in the vector
+    database directory. When the cache grows beyond max_entries, the
+    least recently used vectors are evicted. One connection is shared
+    between threads; call ``close`` or use the cache as a context manager
+    to release it.
+    """
+
+    def __init__(
+        self,
+        vector_db_path: str,
+        model_name: str,
+        max_entries: int = DEFAULT_CACHE_ENTRIES
+    ):
+        """
+        Initialize the embedding cache.
+
+        Args:
+            vector_db_path: Path to the vector database directory.
+                The SQLite database will be created in this directory.
+            model_name: Name of the embedding model whose vectors are
+                cached.
+            max_entries: Maximum number of vectors kept, across models.
+        """
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.db_path = os.path.join(vector_db_path, "embedding_cache.db")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(vector_db_path, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            check_same_thread=False
+        )
+        for pragma in SQLITE_PRAGMAS:
+            self._conn.execute(pragma)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash BLOB NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used INTEGER NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("""
+                CREATE INDEX IF NOT EXISTS embeddings_last_used
+                ON embeddings (last_used)
+            """)
+            self._size = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()[0]
+        logger.info(
+            "Embedding cache at %s holds %d vectors",
+            self.db_path,
+            self._size
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        """
+        Look up the cached vectors of several texts.
+
+        Args:
+            texts: Chunk texts.
+
+        Returns:
+            The vector of each text, or None where it is not cached.
+        """
+        hashes = [_text_hash(text) for text in texts]
+        found: dict[bytes, list[float]] = {}
+        with self._lock, self._conn:
+            for text_hash in dict.fromkeys(hashes):
+                row = self._conn.execute(
+                    """
+                    SELECT vector FROM embeddings
+                    WHERE model = ? AND text_hash = ?
+                    """,
+                    (self.model_name, text_hash)
+                ).fetchone()
+                if row is not None:
+                    found[text_hash] = array("f", row[0]).tolist()
+            # Record the use of hits for least recently used eviction
+            self._conn.executemany(
+                """
+                UPDATE embeddings SET last_used = ?
+                WHERE model = ? AND text_hash = ?
+                """,
+                (
+                    (time.time_ns(), self.model_name, text_hash)
+                    for text_hash in found
+                )
+            )
+        vectors = [found.get(text_hash) for text_hash in hashes]
+        hits = sum(vector is not None for vector in vectors)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, vectors: dict[str, list[float]]) -> None:
+        """
+        Store the vectors of several texts, evicting old vectors if full.
+
+        Args:
+            vectors: Embedding vectors by chunk text.
+        """
+        now = time.time_ns()
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                """
+                INSERT OR IGNORE INTO embeddings
+                    (model, text_hash, vector, last_used)
+                VALUES (?, ?, ?, ?)
+                """,
+                (
+                    (
+                        self.model_name,
+                        _text_hash(text),
+                        array("f", vector).tobytes(),
+                        now
+                    )
+                    for text, vector in vectors.items()
+                )
+            )
+            self._size += self._conn.total_changes - before
+            if self._size > self.max_entries:
+                evicted = self._size - int(self.max_entries * EVICTION_TARGET)
+                self._conn.execute(
+                    """
+                    DELETE FROM embeddings
+                    WHERE (model, text_hash) IN (
+                        SELECT model, text_hash FROM embeddings
+                        ORDER BY last_used
+                        LIMIT ?
+                    )
+                    """,
+                    (evicted,)
+                )
+                self._size -= evicted
+                logger.info("Evicted %d vectors from the cache", evicted)
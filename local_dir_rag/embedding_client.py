@@ -0,0 +1,266 @@
+"""Asynchronous embedding client with rate limiting and backoff."""
+
+import asyncio
+import logging
+import random
+import time
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+from local_dir_rag.defaults import DEFAULT_MAX_CONCURRENCY
+from local_dir_rag.text_processor import estimate_tokens
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_RETRIES = 6
+
+# Exponential backoff starts at this delay and doubles with each retry of
+# a request, up to the maximum, with random jitter
+INITIAL_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the rate of some quantity per minute.
+
+    The bucket holds up to ``capacity`` tokens and refills continuously at
+    ``rate_per_minute``. Callers wait in first-come order.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        """
+        Initialize a full token bucket.
+
+        Args:
+            rate_per_minute: Number of tokens added per minute.
+            capacity: Maximum number of tokens held; defaults to one
+                minute's worth.
+        """
+        if rate_per_minute <= 0:
+            raise ValueError("Rate must be positive.")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        """Add the tokens accumulated since the last refill."""
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """
+        Wait until the bucket holds enough tokens, then take them.
+
+        Amounts larger than the capacity wait for a full bucket.
+
+        Args:
+            amount: Number of tokens to take.
+        """
+        async with self._lock:
+            amount = min(amount, self.capacity)
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+
+def _error_status(error: Exception) -> int | None:
+    """
+    Get the HTTP status code of a failed request, if it has one.
+
+    Args:
+        error: Error raised by an embedding model.
+
+    Returns:
+        The status code, or None.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    Whether a failed request may succeed if retried.
+
+    Rate limit (429) and server (5xx) responses, timeouts and connection
+    errors are retried.
+
+    Args:
+        error: Error raised by an embedding model.
+
+    Returns:
+        True if the request should be retried.
+    """
+    status = _error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(
+        error,
+        (openai.APIConnectionError, ConnectionError, TimeoutError)
+    )
+
+
+def _retry_after(error: Exception) -> float | None:
+    """
+    Get the delay a server asked for in a Retry-After header.
+
+    Args:
+        error: Error raised by an embedding model.
+
+    Returns:
+        The delay in seconds, or None if the header is absent.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncEmbeddingClient:
+    """
+    Embed texts concurrently through any LangChain embedding model.
+
+    At most ``max_concurrency`` requests are in flight. Requests and
+    estimated tokens per minute are limited by token buckets. A request
+    rejected with a 429 or 5xx response is retried with exponential
+    backoff, and the batch size is halved; it grows back gradually as
+    requests succeed.
+
+    Models with their own retry logic, such as ``OpenAIEmbeddings``, should
+    have it disabled (``max_retries=0``), so that retries are not
+    multiplied.
+    """
+
+    def __init__(
+        self,
+        embeddings_model: Embeddings,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+        max_batch_size: int = None,
+        max_retries: int = DEFAULT_MAX_RETRIES
+    ):
+        """
+        Initialize the client.
+
+        Args:
+            embeddings_model: Embedding model to send requests through.
+            max_concurrency: Maximum number of requests in flight.
+            requests_per_minute: Request rate limit, if any.
+            tokens_per_minute: Estimated token rate limit, if any.
+            max_batch_size: Maximum number of texts in a request; texts
+                passed in one call are split to fit. Defaults to no limit
+                until a request is rejected.
+            max_retries: Number of times a request is retried.
+        """
+        self.embeddings_model = embeddings_model
+        self.max_concurrency = max_concurrency
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.batch_size = max_batch_size
+        self.retries = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self._token_bucket = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        )
+
+    def _shrink_batch_size(self, failed_size: int) -> None:
+        """Halve the batch size after a rejected request."""
+        self.batch_size = max(1, failed_size // 2)
+
+    def _grow_batch_size(self) -> None:
+        """Grow the batch size back by a quarter after a success."""
+        if self.batch_size is None:
+            return
+        batch_size = self.batch_size + max(1, self.batch_size // 4)
+        if self.max_batch_size is not None:
+            batch_size = min(batch_size, self.max_batch_size)
+        self.batch_size = batch_size
+
+    async def _request(self, texts: list[str]) -> list[list[float]]:
+        """
+        Send one request, once the rate limits allow it.
+
+        Args:
+            texts: Texts to embed.
+
+        Returns:
+            Embedding vectors, one per text.
+        """
+        if self._request_bucket is not None:
+            await self._request_bucket.acquire()
+        if self._token_bucket is not None:
+            await self._token_bucket.acquire(
+                sum(estimate_tokens(text) for text in texts)
+            )
+        async with self._semaphore:
+            return await self.embeddings_model.aembed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed texts, in as many requests as the current batch size needs.
+
+        Args:
+            texts: Texts to embed.
+
+        Returns:
+            Embedding vectors, one per text.
+
+        Raises:
+            Exception: The error of the last attempt, if a request still
+                fails after max_retries retries, or cannot be retried.
+        """
+        embeddings: list[list[float]] = []
+        attempt = 0
+        while len(embeddings) < len(texts):
+            start = len(embeddings)
+            batch = texts[start:start + (self.batch_size or len(texts))]
+            try:
+                embeddings.extend(await self._request(batch))
+            # pylint: disable-next=broad-exception-caught
+            except Exception as error:
+                if attempt >= self.max_retries or not _is_retryable(error):
+                    raise
+                delay = _retry_after(error)
+                if delay is None:
+                    delay = random.uniform(0.5, 1.0) * min(
+                        MAX_BACKOFF_SECONDS,
+                        INITIAL_BACKOFF_SECONDS * 2 ** attempt
+                    )
+                attempt += 1
+                self.retries += 1
+                self._shrink_batch_size(len(batch))
+                logger.warning(
+                    "Embedding request of %d texts failed (%s), retrying "
+                    "in %.1f seconds with batches of %d",
+                    len(batch),
+                    _error_status(error) or type(error).__name__,
+                    delay,
+                    self.batch_size
+                )
+                await asyncio.sleep(delay)
+                continue
+            attempt = 0
+            self._grow_batch_size()
+        return embeddings
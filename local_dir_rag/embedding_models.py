@@ -0,0 +1,255 @@
+"""Selectable embedding models, and the model recorded with an index."""
+
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass, fields
+
+from langchain_core.embeddings import Embeddings
+
+from local_dir_rag.embedding_cache import embedding_model_name
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+INDEX_INFO_FILE = "index_info.json"
+
+# Environment variable selecting the embedding model, as in --embeddings
+EMBEDDINGS_ENV = "EMBEDDINGS"
+DEFAULT_EMBEDDINGS = "openai"
+
+DEFAULT_LOCAL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_LOCAL_BATCH_SIZE = 64
+# Dynamically quantized ONNX export published with sentence-transformers
+# models, with int8 weights for CPUs with AVX2
+QUANTIZED_MODEL_FILE = "onnx/model_qint8_avx2.onnx"
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Sentence-transformers model running on the local CPU.
+
+    Texts are encoded in batches of ``batch_size``, each batch spread
+    over the CPU threads of the model's runtime. Only one batch is
+    encoded at a time, since concurrent batches would compete for the
+    same threads. With ``quantized``, the model's int8 ONNX export is run
+    with ONNX Runtime instead of the PyTorch model.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_LOCAL_MODEL,
+        quantized: bool = False,
+        threads: int = None,
+        batch_size: int = DEFAULT_LOCAL_BATCH_SIZE,
+        normalize: bool = True
+    ):
+        """
+        Load the model.
+
+        Args:
+            model_name: Name or path of a sentence-transformers model.
+            quantized: Run the int8 ONNX export of the model.
+            threads: Number of CPU threads of PyTorch (default: its
+                own default, the number of cores).
+            batch_size: Number of texts encoded at once.
+            normalize: Scale embeddings to unit length, so inner product
+                and Euclidean distance rank alike.
+        """
+        # Imported here, since the model runtime takes seconds to import
+        import sentence_transformers
+
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        options = {}
+        if quantized:
+            options = {
+                "backend": "onnx",
+                "model_kwargs": {"file_name": QUANTIZED_MODEL_FILE},
+            }
+        self.model_name = model_name
+        self.quantized = quantized
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self._model = sentence_transformers.SentenceTransformer(
+            model_name, device="cpu", **options
+        )
+        self.dimension = self._model.get_sentence_embedding_dimension()
+        self._lock = threading.Lock()
+        logger.info(
+            "Loaded local embedding model %s (%d dimensions%s)",
+            model_name,
+            self.dimension,
+            ", int8" if quantized else ""
+        )
+
+    @property
+    def model(self) -> str:
+        """Name of the model, as recorded with the index."""
+        suffix = ":int8" if self.quantized else ""
+        return f"local:{self.model_name}{suffix}"
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed texts.
+
+        Args:
+            texts: Texts to embed.
+
+        Returns:
+            Embedding vectors, in the order of the texts.
+        """
+        if not texts:
+            return []
+        with self._lock:
+            vectors = self._model.encode(
+                texts,
+                batch_size=self.batch_size,
+                normalize_embeddings=self.normalize,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        """
+        Embed a query.
+
+        Args:
+            text: Query text.
+
+        Returns:
+            The embedding vector.
+        """
+        return self.embed_documents([text])[0]
+
+
+def create_embeddings(
+    spec: str = None,
+    quantized: bool = False,
+    threads: int = None,
+    max_retries: int = None
+) -> Embeddings:
+    """
+    Create an embedding model from its specification.
+
+    ``openai`` or ``openai:<model>`` selects an OpenAI embedding model,
+    and ``local`` or ``local:<model>`` a sentence-transformers model run
+    on the CPU.
+
+    Args:
+        spec: Model specification (default: the ``EMBEDDINGS``
+            environment variable, or ``openai``).
+        quantized: Run the int8 ONNX export of a local model.
+        threads: Number of CPU threads of a local model.
+        max_retries: Retries of OpenAI requests (default: the client's).
+
+    Returns:
+        The embedding model.
+    """
+    spec = spec or os.getenv(EMBEDDINGS_ENV) or DEFAULT_EMBEDDINGS
+    backend, _, model_name = spec.partition(":")
+    if backend == "local":
+        return LocalEmbeddings(
+            model_name or DEFAULT_LOCAL_MODEL,
+            quantized=quantized,
+            threads=threads
+        )
+    if backend == "openai":
+        # Imported here, since the OpenAI client takes seconds to import
+        from langchain_openai import OpenAIEmbeddings
+
+        options = {}
+        if model_name:
+            options["model"] = model_name
+        if max_retries is not None:
+            options["max_retries"] = max_retries
+        return OpenAIEmbeddings(**options)
+    raise ValueError(f"Unknown embedding model: {spec}")
+
+
+@dataclass
+class IndexInfo:
+    """
+    Embedding model that a vector database was built with.
+
+    Vectors of different models, or of the same model with different
+    dimensions, cannot be compared, so a database is only searched and
+    updated with the model recorded here.
+    """
+    embeddings: str
+    dimension: int
+
+    @classmethod
+    def load(cls, db_path: str) -> "IndexInfo | None":
+        """
+        Load the model information saved with a vector database.
+
+        Args:
+            db_path: Path to the vector database directory.
+
+        Returns:
+            The information, or None if none was saved.
+        """
+        info_path = os.path.join(db_path, INDEX_INFO_FILE)
+        if not os.path.exists(info_path):
+            return None
+        with open(info_path, encoding="utf-8") as f:
+            values = json.load(f)
+        names = {info_field.name for info_field in fields(cls)}
+        return cls(**{
+            name: value for name, value in values.items() if name in names
+        })
+
+    def save(self, db_path: str) -> None:
+        """
+        Save the model information with a vector database.
+
+        Args:
+            db_path: Path to the vector database directory.
+        """
+        os.makedirs(db_path, exist_ok=True)
+        info_path = os.path.join(db_path, INDEX_INFO_FILE)
+        tmp_path = f"{info_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=2)
+        os.replace(tmp_path, info_path)
+
+
+def check_embeddings(db_path: str, embeddings_model: Embeddings) -> None:
+    """
+    Refuse an embedding model other than the one a database was built with.
+
+    Databases saved without model information are not checked. The
+    dimension is compared when the model reports it.
+
+    Args:
+        db_path: Path to the vector database directory.
+        embeddings_model: Embedding model to search or update it with.
+
+    Raises:
+        ValueError: If the model or its dimension differ.
+    """
+    info = IndexInfo.load(db_path)
+    if info is None:
+        return
+    name = embedding_model_name(embeddings_model)
+    if name != info.embeddings:
+        raise ValueError(
+            f"The vector database at {db_path} was built with embedding "
+            f"model {info.embeddings}, not {name}"
+        )
+    dimension = (
+        getattr(embeddings_model, "dimension", None)
+        or getattr(embeddings_model, "dimensions", None)
+    )
+    if dimension and dimension != info.dimension:
+        raise ValueError(
+            f"The vector database at {db_path} has {info.dimension}-"
+            f"dimensional embeddings, not {dimension}"
+        )
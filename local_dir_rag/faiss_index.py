@@ -0,0 +1,656 @@
+"""Types and parameters of the FAISS index behind the vector store."""
+
+import json
+import logging
+import math
+import os
+import time
+from dataclasses import asdict, dataclass, fields, replace
+
+import faiss
+import numpy as np
+
+from local_dir_rag.defaults import INDEX_TYPES, STORAGE_TYPES
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+INDEX_CONFIG_FILE = "index_config.json"
+
+DEFAULT_NPROBE = 16
+DEFAULT_HNSW_M = 32
+DEFAULT_EF_CONSTRUCTION = 80
+DEFAULT_EF_SEARCH = 64
+DEFAULT_TRAINING_SAMPLE = 100_000
+DEFAULT_RERANK_FACTOR = 4
+# Indexes that cannot remove vectors are rebuilt once this fraction of
+# their vectors belongs to deleted documents
+MAX_DELETED_FRACTION = 0.2
+
+# FAISS asks for at least this many training vectors per IVF list
+MIN_POINTS_PER_LIST = 39
+# Product quantizers encode each subvector with 8 bits, in 256 centroids
+PQ_CENTROIDS = 256
+
+SCALAR_QUANTIZER_STORAGE = {
+    faiss.ScalarQuantizer.QT_8bit: "sq8",
+    faiss.ScalarQuantizer.QT_fp16: "fp16",
+}
+
+
+@dataclass
+class IndexConfig:
+    """
+    Type and parameters of the FAISS index.
+
+    ``flat`` searches every vector exactly. ``ivf`` clusters vectors into
+    ``nlist`` lists, trained on a sample of up to ``training_sample``
+    vectors, and searches the ``nprobe`` nearest lists. ``hnsw`` searches
+    a graph with ``m`` links per vector, built with ``ef_construction``
+    and searched with ``ef_search`` candidates.
+
+    Vectors are stored as float32 (``flat``), or compressed to one byte
+    per dimension (``sq8``), two bytes per dimension (``fp16``), or
+    ``pq_m`` bytes by product quantization (``pq``). With a
+    ``rerank_factor``, compressed indexes also keep the float32 vectors,
+    and re-rank ``rerank_factor`` times as many candidates as requested
+    by their exact distances.
+    """
+    index_type: str = "flat"
+    nlist: int | None = None
+    nprobe: int = DEFAULT_NPROBE
+    m: int = DEFAULT_HNSW_M
+    ef_construction: int = DEFAULT_EF_CONSTRUCTION
+    ef_search: int = DEFAULT_EF_SEARCH
+    training_sample: int = DEFAULT_TRAINING_SAMPLE
+    storage: str = "flat"
+    pq_m: int | None = None
+    rerank_factor: int = 0
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {self.index_type}")
+        if self.storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown index storage: {self.storage}")
+        if self.rerank_factor < 0:
+            raise ValueError("Re-rank factor must not be negative")
+
+    @property
+    def reranks(self) -> bool:
+        """Whether compressed vectors are re-ranked by exact distance."""
+        return self.rerank_factor > 0 and self.storage != "flat"
+
+    @classmethod
+    def load(cls, db_path: str) -> "IndexConfig | None":
+        """
+        Load the index configuration saved with a vector database.
+
+        Args:
+            db_path: Path to the vector database directory.
+
+        Returns:
+            The configuration, or None if none was saved.
+        """
+        config_path = os.path.join(db_path, INDEX_CONFIG_FILE)
+        if not os.path.exists(config_path):
+            return None
+        with open(config_path, encoding="utf-8") as f:
+            values = json.load(f)
+        names = {field.name for field in fields(cls)}
+        return cls(**{
+            name: value for name, value in values.items() if name in names
+        })
+
+    def save(self, db_path: str) -> None:
+        """
+        Save the index configuration with a vector database.
+
+        Args:
+            db_path: Path to the vector database directory.
+        """
+        config_path = os.path.join(db_path, INDEX_CONFIG_FILE)
+        tmp_path = f"{config_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=2)
+        os.replace(tmp_path, config_path)
+
+    def nlist_for(self, count: int) -> int:
+        """
+        Number of IVF lists for an index of count vectors.
+
+        Args:
+            count: Number of vectors.
+
+        Returns:
+            The configured nlist, or about 4 * sqrt(count) lists, limited
+            so that each list has enough training vectors.
+        """
+        if self.nlist:
+            return self.nlist
+        return max(1, min(
+            int(4 * math.sqrt(count)),
+            count // MIN_POINTS_PER_LIST
+        ))
+
+    def pq_m_for(self, dimensions: int) -> int:
+        """
+        Number of product quantizer subvectors for vectors of some size.
+
+        Args:
+            dimensions: Number of dimensions of the vectors.
+
+        Returns:
+            The configured pq_m, or the largest divisor of dimensions up
+            to one eighth of it, which stores vectors in 1/32 of their
+            float32 size.
+        """
+        if self.pq_m:
+            return self.pq_m
+        pq_m = max(1, dimensions // 8)
+        while dimensions % pq_m:
+            pq_m -= 1
+        return pq_m
+
+    def min_training_vectors(self, count: int) -> int:
+        """
+        Number of vectors needed to train the configured index.
+
+        Args:
+            count: Number of vectors the index is built from.
+
+        Returns:
+            The minimum number of training vectors.
+        """
+        needed = 1
+        if self.index_type == "ivf":
+            needed = self.nlist_for(count)
+        if self.storage == "pq":
+            needed = max(needed, PQ_CENTROIDS)
+        return needed
+
+    def factory_string(self, count: int, dimensions: int) -> str:
+        """
+        FAISS index factory description of the configured index.
+
+        Args:
+            count: Number of vectors the index is built from.
+            dimensions: Number of dimensions of the vectors.
+
+        Returns:
+            The factory string.
+        """
+        # "np" skips polysemous training, which only serves Hamming
+        # distance filtering and takes seconds
+        codes = {
+            "flat": "Flat",
+            "sq8": "SQ8",
+            "fp16": "SQfp16",
+            "pq": f"PQ{self.pq_m_for(dimensions)}np",
+        }[self.storage]
+        if self.index_type == "ivf":
+            description = f"IVF{self.nlist_for(count)},{codes}"
+        elif self.index_type == "hnsw":
+            description = f"HNSW{self.m}"
+            if self.storage != "flat":
+                description += f"_{codes}"
+        else:
+            description = codes
+        if self.reranks:
+            description += ",RFlat"
+        return description
+
+
+def _base_index(index: faiss.Index) -> faiss.Index:
+    """Get the index that holds the search structure of an index."""
+    if not isinstance(index, faiss.Index):
+        return index
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexRefine):
+        index = faiss.downcast_index(index.base_index)
+    return index
+
+
+def describe_index(index: faiss.Index) -> str:
+    """
+    Get the type of a FAISS index.
+
+    Args:
+        index: FAISS index.
+
+    Returns:
+        One of INDEX_TYPES, or the class name of other indexes.
+    """
+    index = _base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexFlatCodes):
+        return "flat"
+    return type(index).__name__
+
+
+def describe_storage(index: faiss.Index) -> str:
+    """
+    Get the storage of the vectors of a FAISS index.
+
+    Args:
+        index: FAISS index.
+
+    Returns:
+        One of STORAGE_TYPES, or the class name of other storage.
+    """
+    index = _base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexIVFFlat)):
+        return "flat"
+    if isinstance(
+        index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)
+    ):
+        return SCALAR_QUANTIZER_STORAGE.get(
+            index.sq.qtype, type(index).__name__
+        )
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return type(index).__name__
+
+
+def _reranks(index: faiss.Index) -> bool:
+    """Whether an index re-ranks candidates by exact distance."""
+    return isinstance(index, faiss.Index) and isinstance(
+        faiss.downcast_index(index), faiss.IndexRefine
+    )
+
+
+def matches_config(index: faiss.Index, config: IndexConfig) -> bool:
+    """
+    Whether an index is of the configured type and storage.
+
+    Args:
+        index: FAISS index.
+        config: Index configuration.
+
+    Returns:
+        True if the index needs no conversion.
+    """
+    return (
+        describe_index(index) == config.index_type
+        and describe_storage(index) == config.storage
+        and _reranks(index) == config.reranks
+    )
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    """
+    Whether removing vectors keeps the positions of the others in order.
+
+    Removing from a flat index, compressed or not, shifts the following
+    vectors down, which is what the vector store's position mapping
+    expects. IVF indexes move their last vectors into the positions left
+    free instead, see ``remove_ivf_vectors``; HNSW and re-ranking indexes
+    cannot remove vectors, and are searched without them until they are
+    rebuilt, see ``search_parameters``.
+
+    Args:
+        index: FAISS index.
+
+    Returns:
+        False for IVF, HNSW and re-ranking indexes.
+    """
+    return not _reranks(index) and not isinstance(
+        _base_index(index), (faiss.IndexIVF, faiss.IndexHNSW)
+    )
+
+
+def supports_ivf_removal(index: faiss.Index) -> bool:
+    """
+    Whether vectors can be removed from an index by remove_ivf_vectors.
+
+    Args:
+        index: FAISS index.
+
+    Returns:
+        True for IVF indexes that do not re-rank.
+    """
+    return not _reranks(index) and isinstance(
+        _base_index(index), faiss.IndexIVF
+    )
+
+
+def remove_ivf_vectors(
+    index: faiss.Index, positions: set[int]
+) -> dict[int, int]:
+    """
+    Remove the vectors at some positions from an IVF index.
+
+    The vectors are removed from their inverted lists, and the vectors
+    at the last positions are moved into the positions left free, so
+    positions stay contiguous without rebuilding the index. Moved
+    vectors are decoded and encoded again, which keeps flat and product
+    quantized codes, and scalar quantized codes up to rounding.
+
+    Args:
+        index: IVF index, see supports_ivf_removal.
+        positions: Positions of the vectors to remove.
+
+    Returns:
+        The new positions of the moved vectors, by old position.
+    """
+    index = faiss.downcast_index(index)
+    count = index.ntotal - len(positions)
+    free = sorted(position for position in positions if position < count)
+    moved = [
+        position for position in range(count, index.ntotal)
+        if position not in positions
+    ]
+    vectors = None
+    if moved:
+        # Decoded before the tail of the index is removed
+        vectors = index.reconstruct_n(count, index.ntotal - count)[
+            [position - count for position in moved]
+        ]
+    # An array direct map cannot remove vectors, and reconstructing many
+    # vectors does not need one
+    index.set_direct_map_type(faiss.DirectMap.NoMap)
+    index.remove_ids(faiss.IDSelectorBatch(
+        np.array(sorted(positions.union(moved)), dtype=np.int64)
+    ))
+    if moved:
+        index.add_with_ids(vectors, np.array(free, dtype=np.int64))
+    return dict(zip(moved, free))
+
+
+def index_vectors(index: faiss.Index) -> np.ndarray:
+    """
+    Get all vectors of an index, in position order.
+
+    Compressed vectors are decoded, and so only approximate the original
+    vectors, unless the index keeps them for re-ranking.
+
+    Args:
+        index: FAISS index.
+
+    Returns:
+        Array of shape (ntotal, d).
+    """
+    if index.ntotal == 0:
+        return np.empty((0, index.d), dtype=np.float32)
+    # IVF indexes reconstruct ranges from their inverted lists, without
+    # an id to list map
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def search_parameters(
+    index: faiss.Index, selector: faiss.IDSelector
+) -> faiss.SearchParameters:
+    """
+    Get parameters that search an index among some of its vectors.
+
+    The index's own search parameters are overridden by the parameters
+    passed to a search, so they are copied.
+
+    Args:
+        index: FAISS index.
+        selector: Selector of the positions searched.
+
+    Returns:
+        The search parameters.
+    """
+    base_index = _base_index(index)
+    if isinstance(base_index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(
+            sel=selector, efSearch=base_index.hnsw.efSearch
+        )
+    elif isinstance(base_index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(
+            sel=selector, nprobe=base_index.nprobe
+        )
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    if _reranks(index):
+        # The base index finds the candidates that are re-ranked
+        params = faiss.IndexRefineSearchParameters(
+            k_factor=faiss.downcast_index(index).k_factor,
+            base_index_params=params
+        )
+    return params
+
+
+def set_search_parameters(
+    index: faiss.Index,
+    nprobe: int = None,
+    ef_search: int = None,
+    rerank_factor: int = None
+) -> None:
+    """
+    Set the search parameters of an index.
+
+    Args:
+        index: FAISS index.
+        nprobe: Number of IVF lists searched.
+        ef_search: Number of HNSW candidates searched.
+        rerank_factor: Number of candidates re-ranked by exact distance,
+            as a multiple of the number of results.
+    """
+    if rerank_factor and _reranks(index):
+        faiss.downcast_index(index).k_factor = rerank_factor
+    index = _base_index(index)
+    if nprobe is not None and isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe
+    if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+
+def build_index(
+    config: IndexConfig,
+    vectors: np.ndarray,
+    metric_type: int = faiss.METRIC_L2
+) -> faiss.Index:
+    """
+    Build an index of the configured type from vectors.
+
+    Indexes with IVF lists or quantized vectors are trained on a random
+    sample of the vectors. Vectors keep their positions.
+
+    Args:
+        config: Index configuration.
+        vectors: Array of shape (n, d).
+        metric_type: FAISS metric of the index.
+
+    Returns:
+        The new index.
+    """
+    count, dimensions = vectors.shape
+    description = config.factory_string(count, dimensions)
+    index = faiss.index_factory(dimensions, description, metric_type)
+    base_index = _base_index(index)
+    if isinstance(base_index, faiss.IndexHNSW):
+        base_index.hnsw.efConstruction = config.ef_construction
+    if not index.is_trained:
+        sample = vectors
+        if count > config.training_sample:
+            rng = np.random.default_rng(0)
+            sample = vectors[
+                np.sort(rng.choice(count, config.training_sample, False))
+            ]
+        logger.info(
+            "Training %s index on %d vectors", description, len(sample)
+        )
+        index.train(sample)
+    index.add(vectors)
+    set_search_parameters(
+        index, config.nprobe, config.ef_search, config.rerank_factor
+    )
+    return index
+
+
+def convert_index(
+    index: faiss.Index,
+    config: IndexConfig,
+    rebuild: bool = False,
+    positions: set[int] = frozenset()
+) -> faiss.Index | None:
+    """
+    Convert an index to the configured type and storage, if it differs.
+
+    IVF indexes need at least as many vectors as lists to train, and
+    product quantizers at least PQ_CENTROIDS; until there are enough,
+    the index is left as it is.
+
+    Args:
+        index: FAISS index.
+        config: Index configuration.
+        rebuild: Rebuild the index even if it is of the configured type,
+            for example to retrain IVF lists after the corpus has grown.
+        positions: Positions of vectors to leave out of a new index; the
+            others keep their order, as with rebuild_without.
+
+    Returns:
+        The new index, or None if the index is left as it is.
+    """
+    if matches_config(index, config) and not rebuild:
+        set_search_parameters(
+            index, config.nprobe, config.ef_search, config.rerank_factor
+        )
+        return None
+    count = index.ntotal - len(positions)
+    if count < config.min_training_vectors(count):
+        logger.warning(
+            "Too few vectors (%d) to train a %s index with %s storage, "
+            "keeping a %s index",
+            count,
+            config.index_type,
+            config.storage,
+            describe_index(index)
+        )
+        return None
+    logger.info(
+        "Building %s index with %s storage from %d vectors",
+        config.index_type,
+        config.storage,
+        count
+    )
+    vectors = index_vectors(index)
+    if positions:
+        vectors = vectors[_kept_positions(index, positions)]
+    return build_index(config, vectors, index.metric_type)
+
+
+def _kept_positions(index: faiss.Index, positions: set[int]) -> list[int]:
+    """Get the positions of an index other than some positions."""
+    return [
+        position for position in range(index.ntotal)
+        if position not in positions
+    ]
+
+
+def rebuild_without(
+    index: faiss.Index, positions: set[int]
+) -> tuple[faiss.Index, list[int]]:
+    """
+    Rebuild an index without the vectors at some positions.
+
+    The index is cloned and emptied, which keeps its training, and the
+    remaining vectors are added back in order.
+
+    Args:
+        index: FAISS index.
+        positions: Positions of the vectors to leave out.
+
+    Returns:
+        The new index, and the old positions of its vectors.
+    """
+    kept = _kept_positions(index, positions)
+    vectors = index_vectors(index)[kept]
+    new_index = faiss.clone_index(index)
+    new_index.reset()
+    new_index.add(vectors)
+    return new_index, kept
+
+
+@dataclass
+class IndexReport:
+    """Memory and recall of an index built with one storage option."""
+    storage: str
+    rerank_factor: int
+    description: str
+    memory_bytes: int
+    recall: float
+    query_ms: float
+
+
+def compare_storage_options(
+    vectors: np.ndarray,
+    config: IndexConfig,
+    metric_type: int = faiss.METRIC_L2,
+    k: int = 10,
+    query_count: int = 100
+) -> list[IndexReport]:
+    """
+    Build an index with each storage option and measure it.
+
+    Every storage option is built with the configured index type, once
+    without re-ranking and, for compressed storage, once with it. Recall
+    is the fraction of the exact k nearest neighbours of a sample of the
+    stored vectors that each index finds.
+
+    Args:
+        vectors: Array of shape (n, d) of the vectors to index.
+        config: Index configuration whose type and search parameters are
+            used; its rerank_factor, or DEFAULT_RERANK_FACTOR, is used for
+            the re-ranking options.
+        metric_type: FAISS metric of the index.
+        k: Number of neighbours searched.
+        query_count: Number of vectors used as queries.
+
+    Returns:
+        A report for each option that there are enough vectors to train.
+    """
+    count = len(vectors)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(count, min(query_count, count), False)]
+    exact_index = faiss.IndexFlat(vectors.shape[1], metric_type)
+    exact_index.add(vectors)
+    _, expected = exact_index.search(queries, k)
+
+    reports = []
+    for storage in STORAGE_TYPES:
+        rerank_factors = [0]
+        if storage != "flat":
+            rerank_factors.append(
+                config.rerank_factor or DEFAULT_RERANK_FACTOR
+            )
+        for rerank_factor in rerank_factors:
+            option = replace(
+                config, storage=storage, rerank_factor=rerank_factor
+            )
+            if count < option.min_training_vectors(count):
+                logger.warning(
+                    "Too few vectors (%d) to train %s storage",
+                    count,
+                    storage
+                )
+                continue
+            index = build_index(option, vectors, metric_type)
+            started = time.perf_counter()
+            _, found = index.search(queries, k)
+            query_ms = (
+                1000 * (time.perf_counter() - started) / len(queries)
+            )
+            recall = np.mean([
+                len(set(row_found) & set(row_expected)) / len(row_expected)
+                for row_found, row_expected in zip(found, expected)
+            ])
+            reports.append(IndexReport(
+                storage=storage,
+                rerank_factor=rerank_factor,
+                description=option.factory_string(count, vectors.shape[1]),
+                memory_bytes=len(faiss.serialize_index(index)),
+                recall=float(recall),
+                query_ms=query_ms
+            ))
+    return reports
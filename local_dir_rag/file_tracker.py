@@ -4,8 +4,18 @@ import hashlib
 import logging
 import os
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from enum import Enum
+from typing import Iterable
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,19 +23,66 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Files modified this close to the time their stat data is recorded may
+# change again within the filesystem timestamp granularity, so their stat
+# data is not trusted by the fast path (the "racily clean" problem)
+RACY_WINDOW_NS = 2_000_000_000
+
+# Read size for hashing; large reads keep the hash functions, which release
+# the GIL, busy between system calls
+HASH_BUFFER_SIZE = 1024 * 1024
+
+DEFAULT_CHECKSUM_ALGORITHM = "sha256"
+
+# Maximum number of ids bound in one statement
+SQL_BATCH_SIZE = 500
+
+# WAL journaling lets readers proceed during a write, and with
+# synchronous=NORMAL a commit no longer waits for an fsync
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 30000",
+)
+
+CHECKSUM_ALGORITHMS = (
+    "sha256",
+    "blake2b",
+    "blake2s",
+    "xxh64",
+    "xxh3_64",
+    "xxh3_128",
+)
+
 
 class FileState(Enum):
     """Enumeration of possible file states relative to the tracker."""
     NEW = "new"
     MODIFIED = "modified"
     UNCHANGED = "unchanged"
+    DELETED = "deleted"
 
 
 @dataclass
 class FileStatus:
-    """Status of a file relative to the tracker database."""
+    """
+    Status of a file relative to the tracker database.
+
+    When the file content was hashed to compute the status, the checksum
+    and the stat result taken before hashing are kept, so that the tracker
+    can be updated after indexing without hashing the file again.
+
+    A file that disappeared while its status was computed is deleted; its
+    checksum is the stored one, or None if it was never tracked.
+    """
     file_path: str
     state: FileState
+    checksum: str | None = None
+    checksum_algorithm: str | None = None
+    file_stat: os.stat_result | None = None
 
     @property
     def is_new(self) -> bool:
@@ -37,27 +94,94 @@ class FileStatus:
         """Check if the file has been modified."""
         return self.state == FileState.MODIFIED
 
+    @property
+    def is_deleted(self) -> bool:
+        """Check if the file no longer exists."""
+        return self.state == FileState.DELETED
+
     @property
     def needs_indexing(self) -> bool:
         """Check if the file needs to be indexed."""
         return self.state in (FileState.NEW, FileState.MODIFIED)
 
 
-def compute_file_checksum(file_path: str) -> str:
+def _trusted_mtime_ns(file_stat: os.stat_result) -> int | None:
+    """
+    Get the modification time to record for a file, if it can be trusted.
+
+    Args:
+        file_stat: Stat result of the file.
+
+    Returns:
+        Modification time in nanoseconds, or None if the file was modified
+        too recently for its modification time to identify its content.
+    """
+    if file_stat.st_mtime_ns >= time.time_ns() - RACY_WINDOW_NS:
+        return None
+    return file_stat.st_mtime_ns
+
+
+def _new_hasher(algorithm: str):
+    """
+    Create a hash object for a checksum algorithm.
+
+    Args:
+        algorithm: One of CHECKSUM_ALGORITHMS.
+
+    Returns:
+        A hash object with ``update`` and ``hexdigest`` methods.
+    """
+    if algorithm.startswith("xxh"):
+        if xxhash is None:
+            raise ValueError(
+                f"Checksum algorithm {algorithm} requires the xxhash package"
+            )
+        return getattr(xxhash, algorithm)()
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError(f"Unsupported checksum algorithm: {algorithm}")
+    return hashlib.new(algorithm)
+
+
+def compute_file_checksums(
+    file_path: str, algorithms: tuple[str, ...]
+) -> dict[str, str]:
+    """
+    Compute checksums of a file with several algorithms in a single read.
+
+    Args:
+        file_path: Path to the file.
+        algorithms: Checksum algorithms to compute.
+
+    Returns:
+        Dictionary of hex digests by algorithm.
+    """
+    hashers = {algorithm: _new_hasher(algorithm) for algorithm in algorithms}
+    buffer = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        while size := f.readinto(buffer):
+            for hasher in hashers.values():
+                hasher.update(view[:size])
+    return {
+        algorithm: hasher.hexdigest()
+        for algorithm, hasher in hashers.items()
+    }
+
+
+def compute_file_checksum(
+    file_path: str, algorithm: str = DEFAULT_CHECKSUM_ALGORITHM
+) -> str:
     """
-    Compute SHA-256 checksum of a file.
+    Compute the checksum of a file.
 
     Args:
         file_path: Path to the file.
+        algorithm: Checksum algorithm, SHA-256 by default.
 
     Returns:
-        SHA-256 hex digest of the file content.
+        Hex digest of the file content.
     """
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            sha256_hash.update(chunk)
-    return sha256_hash.hexdigest()
+    return compute_file_checksums(file_path, (algorithm,))[algorithm]
 
 
 class FileTracker:
@@ -65,118 +189,510 @@ class FileTracker:
     Track file checksums in a SQLite database for incremental indexing.
 
     The database is stored alongside the vector store in the same directory.
+    A single connection is kept open for the lifetime of the tracker and
+    shared between threads; call ``close`` or use the tracker as a context
+    manager to release it.
     """
 
-    def __init__(self, vector_db_path: str):
+    def __init__(
+        self,
+        vector_db_path: str,
+        verify_checksums: bool = False,
+        checksum_algorithm: str = DEFAULT_CHECKSUM_ALGORITHM,
+        max_workers: int = None
+    ):
         """
         Initialize the file tracker.
 
         Args:
             vector_db_path: Path to the vector database directory.
                 The SQLite database will be created in this directory.
+            verify_checksums: If True, always hash file content instead of
+                trusting unchanged size, modification time and inode.
+            checksum_algorithm: Algorithm used to checksum new and changed
+                files. Files tracked with another algorithm are compared
+                using the algorithm they were recorded with.
+            max_workers: Number of threads used to hash files in bulk.
         """
+        _new_hasher(checksum_algorithm)
         self.vector_db_path = vector_db_path
+        self.verify_checksums = verify_checksums
+        self.checksum_algorithm = checksum_algorithm
+        self.max_workers = max_workers
+        self.files_hashed = 0
+        self.bytes_hashed = 0
         self.db_path = os.path.join(vector_db_path, "file_tracker.db")
+        self._lock = threading.RLock()
         self._ensure_directory()
+        self._conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            check_same_thread=False
+        )
+        for pragma in SQLITE_PRAGMAS:
+            self._conn.execute(pragma)
         self._init_database()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run statements in a single transaction on the shared connection.
+
+        Yields:
+            A cursor; the transaction is committed when the block exits
+            normally and rolled back if it raises.
+        """
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.cursor()
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+
     def _ensure_directory(self) -> None:
         """Ensure the vector database directory exists."""
         os.makedirs(self.vector_db_path, exist_ok=True)
 
     def _init_database(self) -> None:
         """Initialize the SQLite database with the required schema."""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
+        with self._transaction() as cursor:
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS file_checksums (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     directory_path TEXT NOT NULL,
                     file_name TEXT NOT NULL,
                     checksum TEXT NOT NULL,
+                    checksum_algorithm TEXT,
                     file_size INTEGER,
+                    mtime_ns INTEGER,
+                    inode INTEGER,
                     indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     UNIQUE (directory_path, file_name)
                 )
             """)
-            conn.commit()
-        finally:
-            conn.close()
+            # Databases created by earlier versions lack the newer columns
+            cursor.execute("PRAGMA table_info(file_checksums)")
+            columns = {row[1] for row in cursor.fetchall()}
+            added_columns = {
+                "checksum_algorithm": "TEXT",
+                "mtime_ns": "INTEGER",
+                "inode": "INTEGER",
+                "chunk_count": "INTEGER",
+            }
+            for column, column_type in added_columns.items():
+                if column not in columns:
+                    cursor.execute(
+                        "ALTER TABLE file_checksums "
+                        f"ADD COLUMN {column} {column_type}"
+                    )
+            # Chunk ids of each file in the vector store, so that a file's
+            # chunks are found without scanning the docstore
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS file_chunks (
+                    directory_path TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    PRIMARY KEY (directory_path, file_name, chunk_id)
+                ) WITHOUT ROWID
+            """)
+            # Chunks are identified by content, so files may share them
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS file_chunks_chunk_id
+                ON file_chunks (chunk_id)
+            """)
+            cursor.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS current_files (
+                    directory_path TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    PRIMARY KEY (directory_path, file_name)
+                ) WITHOUT ROWID
+            """)
         logger.info("File tracker database initialized at %s", self.db_path)
 
-    def get_file_status(self, file_path: str) -> FileStatus:
+    @staticmethod
+    def _load_current_files(cursor, file_paths: list[str]) -> None:
         """
-        Get the status of a file relative to what's stored in the database.
+        Replace the contents of the temporary current_files table.
+
+        Args:
+            cursor: Cursor inside an open transaction.
+            file_paths: Absolute paths to load into the table.
+        """
+        cursor.execute("DELETE FROM temp.current_files")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO temp.current_files VALUES (?, ?)",
+            (os.path.split(file_path) for file_path in file_paths)
+        )
+
+    def _get_tracked_rows(self, file_paths: list[str]) -> dict[str, tuple]:
+        """
+        Get the stored records of several files.
+
+        Args:
+            file_paths: Absolute paths to the files.
+
+        Returns:
+            Dictionary of (checksum, checksum_algorithm, file_size,
+            mtime_ns, inode) tuples by file path, for tracked files only.
+        """
+        with self._transaction() as cursor:
+            self._load_current_files(cursor, file_paths)
+            cursor.execute("""
+                SELECT f.directory_path, f.file_name, f.checksum,
+                    f.checksum_algorithm, f.file_size, f.mtime_ns, f.inode
+                FROM temp.current_files c
+                JOIN file_checksums f
+                    ON f.directory_path = c.directory_path
+                    AND f.file_name = c.file_name
+            """)
+            rows = {
+                os.path.join(row[0], row[1]): row[2:]
+                for row in cursor.fetchall()
+            }
+            cursor.execute("DELETE FROM temp.current_files")
+        return rows
+
+    def _resolve_status(
+        self,
+        file_path: str,
+        row: tuple | None,
+        file_stat: os.stat_result = None
+    ) -> tuple[FileStatus, bool]:
+        """
+        Compare a file on disk with its stored record.
 
         Args:
             file_path: Absolute path to the file.
+            row: Stored record of the file, or None if it is not tracked.
+            file_stat: Stat result of the file, if already known.
 
         Returns:
-            FileStatus indicating if the file is new or modified.
+            The file status, and whether the stored record of an unchanged
+            file is stale and should be refreshed.
         """
-        current_checksum = compute_file_checksum(file_path)
-        directory_path, file_name = os.path.split(file_path)
-        conn = sqlite3.connect(self.db_path)
         try:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT checksum FROM file_checksums
-                WHERE directory_path = ? AND file_name = ?
-                """,
-                (directory_path, file_name)
-            )
-            row = cursor.fetchone()
-        finally:
-            conn.close()
+            return self._compare_file(file_path, row, file_stat)
+        except FileNotFoundError:
+            # Deleted since it was scanned
+            return FileStatus(
+                file_path=file_path,
+                state=FileState.DELETED,
+                checksum=None if row is None else row[0]
+            ), False
+
+    def _compare_file(
+        self,
+        file_path: str,
+        row: tuple | None,
+        file_stat: os.stat_result = None
+    ) -> tuple[FileStatus, bool]:
+        """
+        Compare a file on disk with its stored record; see
+        ``_resolve_status``.
 
+        Raises:
+            FileNotFoundError: If the file no longer exists.
+        """
+        if file_stat is None:
+            file_stat = os.stat(file_path)
         if row is None:
+            checksum = compute_file_checksum(
+                file_path, self.checksum_algorithm
+            )
+            self._count_hashed(file_stat.st_size)
             return FileStatus(
                 file_path=file_path,
-                state=FileState.NEW
-            )
-
-        stored_checksum = row[0]
-        if current_checksum != stored_checksum:
+                state=FileState.NEW,
+                checksum=checksum,
+                checksum_algorithm=self.checksum_algorithm,
+                file_stat=file_stat
+            ), False
+
+        (
+            stored_checksum,
+            stored_algorithm,
+            file_size,
+            mtime_ns,
+            inode,
+        ) = row
+        stored_algorithm = stored_algorithm or DEFAULT_CHECKSUM_ALGORITHM
+        stat_unchanged = (
+            file_size == file_stat.st_size
+            and mtime_ns == file_stat.st_mtime_ns
+            and inode == file_stat.st_ino
+        )
+        if stat_unchanged and not self.verify_checksums:
             return FileStatus(
                 file_path=file_path,
-                state=FileState.MODIFIED
+                state=FileState.UNCHANGED,
+                checksum=stored_checksum,
+                checksum_algorithm=stored_algorithm,
+                file_stat=file_stat
+            ), False
+
+        # Compute the stored algorithm's digest for comparison and the
+        # configured algorithm's digest for recording in the same pass
+        checksums = compute_file_checksums(
+            file_path,
+            tuple({stored_algorithm, self.checksum_algorithm})
+        )
+        self._count_hashed(file_stat.st_size)
+        status = FileStatus(
+            file_path=file_path,
+            state=FileState.UNCHANGED,
+            checksum=checksums[self.checksum_algorithm],
+            checksum_algorithm=self.checksum_algorithm,
+            file_stat=file_stat
+        )
+        if checksums[stored_algorithm] != stored_checksum:
+            status.state = FileState.MODIFIED
+            return status, False
+
+        # Content is the same (for example, the file was touched or
+        # copied), so record the new stat data for the next run
+        stale = (
+            not stat_unchanged
+            or stored_algorithm != self.checksum_algorithm
+        )
+        return status, stale
+
+    def _count_hashed(self, size: int) -> None:
+        """Count a hashed file and its bytes."""
+        with self._lock:
+            self.files_hashed += 1
+            self.bytes_hashed += size
+
+    def get_file_status(self, file_path: str) -> FileStatus:
+        """
+        Get the status of a file relative to what's stored in the database.
+
+        If the size, modification time and inode recorded for the file
+        match the file on disk, the file is reported as unchanged without
+        reading its content, unless the tracker verifies checksums.
+
+        Args:
+            file_path: Absolute path to the file.
+
+        Returns:
+            FileStatus indicating if the file is new or modified.
+        """
+        return self.get_file_statuses([file_path])[0]
+
+    def get_file_statuses(
+        self,
+        file_paths: list[str],
+        file_stats: dict[str, os.stat_result] = None
+    ) -> list[FileStatus]:
+        """
+        Get the status of several files, hashing them concurrently.
+
+        Args:
+            file_paths: Absolute paths to the files.
+            file_stats: Stat results already taken while scanning, by file
+                path. Files without one are stat'ed again.
+
+        Returns:
+            FileStatus of each file, in the order of file_paths. Files
+            that no longer exist are reported as deleted.
+        """
+        rows = self._get_tracked_rows(file_paths)
+        file_stats = file_stats or {}
+
+        def resolve(file_path: str) -> tuple[FileStatus, bool]:
+            return self._resolve_status(
+                file_path,
+                rows.get(file_path),
+                file_stats.get(file_path)
             )
 
-        return FileStatus(
-            file_path=file_path,
-            state=FileState.UNCHANGED
+        if len(file_paths) <= 1:
+            results = [resolve(file_path) for file_path in file_paths]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(resolve, file_paths))
+
+        stale_statuses = [status for status, stale in results if stale]
+        if stale_statuses:
+            self.update_file_checksums(stale_statuses)
+
+        return [status for status, _ in results]
+
+    @staticmethod
+    def _replace_chunk_ids(
+        cursor, chunk_ids: dict[str, list[str]]
+    ) -> None:
+        """
+        Replace the recorded chunk ids of several files.
+
+        Args:
+            cursor: Cursor inside an open transaction.
+            chunk_ids: Chunk ids by file path.
+        """
+        cursor.executemany(
+            """
+            DELETE FROM file_chunks
+            WHERE directory_path = ? AND file_name = ?
+            """,
+            (os.path.split(file_path) for file_path in chunk_ids)
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO file_chunks VALUES (?, ?, ?)",
+            (
+                (*os.path.split(file_path), chunk_id)
+                for file_path, file_chunk_ids in chunk_ids.items()
+                for chunk_id in file_chunk_ids
+            )
         )
 
-    def update_file_checksum(self, file_path: str) -> None:
+    def update_file_checksums(
+        self,
+        statuses: list[FileStatus],
+        chunk_ids: dict[str, list[str]] = None
+    ) -> None:
+        """
+        Update or insert the checksums of several files in one transaction.
+
+        Args:
+            statuses: Statuses computed before indexing. Statuses without a
+                checksum are hashed first.
+            chunk_ids: Ids of the chunks stored in the vector store for
+                each file, by file path. Files without an entry keep the
+                chunk ids already recorded for them.
+        """
+        chunk_ids = chunk_ids or {}
+        records = []
+        for status in statuses:
+            directory_path, file_name = os.path.split(status.file_path)
+            file_chunk_ids = chunk_ids.get(status.file_path)
+            if status.checksum is None or status.file_stat is None:
+                try:
+                    # Stat before hashing, so that a write racing with the
+                    # hash makes the stored stat data stale rather than
+                    # the checksum
+                    file_stat = os.stat(status.file_path)
+                    checksum = compute_file_checksum(
+                        status.file_path, self.checksum_algorithm
+                    )
+                except FileNotFoundError:
+                    logger.warning(
+                        "File deleted before it was recorded: %s",
+                        status.file_path
+                    )
+                    if file_chunk_ids is not None:
+                        # Recorded without a checksum, as an incomplete
+                        # file, so the next run removes its chunks
+                        records.append((
+                            directory_path, file_name, "", None, None,
+                            None, None, len(file_chunk_ids)
+                        ))
+                    continue
+                status = FileStatus(
+                    file_path=status.file_path,
+                    state=status.state,
+                    checksum=checksum,
+                    checksum_algorithm=self.checksum_algorithm,
+                    file_stat=file_stat
+                )
+            records.append((
+                directory_path,
+                file_name,
+                status.checksum,
+                status.checksum_algorithm,
+                status.file_stat.st_size,
+                _trusted_mtime_ns(status.file_stat),
+                status.file_stat.st_ino,
+                None if file_chunk_ids is None else len(file_chunk_ids)
+            ))
+
+        with self._transaction() as cursor:
+            cursor.executemany("""
+                INSERT INTO file_checksums
+                    (directory_path, file_name, checksum, checksum_algorithm,
+                     file_size, mtime_ns, inode, chunk_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (directory_path, file_name) DO UPDATE SET
+                    checksum = excluded.checksum,
+                    checksum_algorithm = excluded.checksum_algorithm,
+                    file_size = excluded.file_size,
+                    mtime_ns = excluded.mtime_ns,
+                    inode = excluded.inode,
+                    chunk_count = COALESCE(excluded.chunk_count, chunk_count),
+                    indexed_at = CURRENT_TIMESTAMP
+            """, records)
+            self._replace_chunk_ids(cursor, chunk_ids)
+
+        logger.info("Updated checksums for %d files", len(records))
+
+    def update_file_checksum(
+        self, file_path: str, status: FileStatus = None
+    ) -> None:
         """
         Update or insert the checksum for a file.
 
         Args:
             file_path: Absolute path to the file.
+            status: Status of the file computed before indexing. If it
+                carries a checksum, the file is not hashed again.
         """
-        checksum = compute_file_checksum(file_path)
-        directory_path, file_name = os.path.split(file_path)
-        file_size = os.path.getsize(file_path)
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
+        if status is None:
+            status = FileStatus(file_path=file_path, state=FileState.NEW)
+        self.update_file_checksums([status])
+
+    def mark_files_incomplete(
+        self, chunk_ids: dict[str, list[str]]
+    ) -> None:
+        """
+        Record files whose chunks are only partly saved in the index.
+
+        The files are stored with an empty checksum and no stat data, so
+        the next run reports them as modified and replaces their chunks,
+        or as deleted if they are gone.
+
+        Args:
+            chunk_ids: Ids of every chunk of each file that the index may
+                hold, by file path.
+        """
+        with self._transaction() as cursor:
+            cursor.executemany("""
                 INSERT OR REPLACE INTO file_checksums
-                    (directory_path, file_name, checksum, file_size)
-                VALUES (?, ?, ?, ?)
+                    (directory_path, file_name, checksum, chunk_count)
+                VALUES (?, ?, '', ?)
             """, (
-                directory_path,
-                file_name,
-                checksum,
-                file_size
+                (*os.path.split(file_path), len(file_chunk_ids))
+                for file_path, file_chunk_ids in chunk_ids.items()
             ))
-            conn.commit()
-        finally:
-            conn.close()
+            self._replace_chunk_ids(cursor, chunk_ids)
 
-        logger.info("Updated checksum for %s", file_path)
+    def remove_files(self, file_paths: list[str]) -> None:
+        """
+        Remove several files from the tracker database in one transaction.
+
+        Args:
+            file_paths: Absolute paths to the files.
+        """
+        with self._transaction() as cursor:
+            for table in ("file_checksums", "file_chunks"):
+                cursor.executemany(
+                    f"""
+                    DELETE FROM {table}
+                    WHERE directory_path = ? AND file_name = ?
+                    """,
+                    (os.path.split(file_path) for file_path in file_paths)
+                )
+
+        logger.info("Removed %d files from tracker", len(file_paths))
 
     def remove_file(self, file_path: str) -> None:
         """
@@ -185,22 +701,136 @@ class FileTracker:
         Args:
             file_path: Absolute path to the file.
         """
-        directory_path, file_name = os.path.split(file_path)
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
+        self.remove_files([file_path])
+
+    def get_chunk_ids(self, file_paths: list[str]) -> dict[str, list[str]]:
+        """
+        Get the recorded chunk ids of several files.
+
+        Args:
+            file_paths: Absolute paths to the files.
+
+        Returns:
+            Dictionary of chunk ids by file path. Files that are not
+            tracked, or were tracked before chunk ids were recorded, are
+            left out.
+        """
+        with self._transaction() as cursor:
+            self._load_current_files(cursor, file_paths)
+            cursor.execute("""
+                SELECT f.directory_path, f.file_name
+                FROM temp.current_files c
+                JOIN file_checksums f
+                    ON f.directory_path = c.directory_path
+                    AND f.file_name = c.file_name
+                WHERE f.chunk_count IS NOT NULL
+            """)
+            chunk_ids = {
+                os.path.join(row[0], row[1]): []
+                for row in cursor.fetchall()
+            }
+            cursor.execute("""
+                SELECT k.directory_path, k.file_name, k.chunk_id
+                FROM temp.current_files c
+                JOIN file_chunks k
+                    ON k.directory_path = c.directory_path
+                    AND k.file_name = c.file_name
+            """)
+            for row in cursor.fetchall():
+                file_path = os.path.join(row[0], row[1])
+                if file_path in chunk_ids:
+                    chunk_ids[file_path].append(row[2])
+            cursor.execute("DELETE FROM temp.current_files")
+        return chunk_ids
+
+    def get_shared_chunk_ids(
+        self, chunk_ids: Iterable[str], file_paths: list[str]
+    ) -> set[str]:
+        """
+        Find which chunks are also referenced by other files.
+
+        Args:
+            chunk_ids: Chunk ids to check.
+            file_paths: Absolute paths of the files whose references are
+                not counted.
+
+        Returns:
+            The chunk ids that a file not in file_paths references.
+        """
+        return set(self.get_chunk_references(chunk_ids, file_paths))
+
+    def get_chunk_references(
+        self, chunk_ids: Iterable[str], file_paths: list[str]
+    ) -> dict[str, list[str]]:
+        """
+        Find the other files that reference chunks.
+
+        Args:
+            chunk_ids: Chunk ids to check.
+            file_paths: Absolute paths of the files whose references are
+                not counted.
+
+        Returns:
+            Dictionary of the paths of the files not in file_paths that
+            reference each chunk, sorted, for chunks with at least one.
+        """
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        references: dict[str, list[str]] = {}
+        with self._transaction() as cursor:
+            self._load_current_files(cursor, file_paths)
+            for start in range(0, len(chunk_ids), SQL_BATCH_SIZE):
+                batch = chunk_ids[start:start + SQL_BATCH_SIZE]
+                cursor.execute(
+                    f"""
+                    SELECT DISTINCT k.chunk_id, k.directory_path, k.file_name
+                    FROM file_chunks k
+                    WHERE k.chunk_id IN ({', '.join('?' * len(batch))})
+                    AND NOT EXISTS (
+                        SELECT 1 FROM temp.current_files c
+                        WHERE c.directory_path = k.directory_path
+                        AND c.file_name = k.file_name
+                    )
+                    ORDER BY k.chunk_id, k.directory_path, k.file_name
+                    """,
+                    batch
+                )
+                for row in cursor.fetchall():
+                    references.setdefault(row[0], []).append(
+                        os.path.join(row[1], row[2])
+                    )
+            cursor.execute("DELETE FROM temp.current_files")
+        return references
+
+    def get_chunk_totals(self) -> tuple[int, int]:
+        """
+        Count the chunk references of all files, and the distinct chunks.
+
+        Returns:
+            Number of references and number of distinct chunk ids.
+        """
+        with self._transaction() as cursor:
             cursor.execute(
-                """
-                DELETE FROM file_checksums
-                WHERE directory_path = ? AND file_name = ?
-                """,
-                (directory_path, file_name)
+                "SELECT COUNT(*), COUNT(DISTINCT chunk_id) FROM file_chunks"
             )
-            conn.commit()
-        finally:
-            conn.close()
+            return cursor.fetchone()
+
+    def get_chunk_counts(self) -> list[tuple[str, int | None]]:
+        """
+        Get the number of chunks recorded for each tracked file.
 
-        logger.info("Removed %s from tracker", file_path)
+        Returns:
+            List of (file path, chunk count) tuples sorted by path. The
+            count is None for files tracked before chunk ids were
+            recorded.
+        """
+        with self._transaction() as cursor:
+            cursor.execute("""
+                SELECT directory_path, file_name, chunk_count
+                FROM file_checksums
+                ORDER BY directory_path, file_name
+            """)
+            rows = cursor.fetchall()
+        return [(os.path.join(row[0], row[1]), row[2]) for row in rows]
 
     def get_all_tracked_files(self) -> list[str]:
         """
@@ -209,27 +839,37 @@ class FileTracker:
         Returns:
             List of file paths.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
+        with self._transaction() as cursor:
             cursor.execute(
                 "SELECT directory_path, file_name FROM file_checksums"
             )
             rows = cursor.fetchall()
-            return [os.path.join(row[0], row[1]) for row in rows]
-        finally:
-            conn.close()
+        return [os.path.join(row[0], row[1]) for row in rows]
 
     def get_deleted_files(self, current_files: list[str]) -> list[str]:
         """
         Find files that are tracked but no longer exist in current_files.
 
+        The set difference is computed by SQLite against a temporary table
+        of the current files.
+
         Args:
             current_files: List of current file paths in the docs directory.
 
         Returns:
             List of file paths that were tracked but are now deleted.
         """
-        tracked_files = set(self.get_all_tracked_files())
-        current_files_set = set(current_files)
-        return list(tracked_files - current_files_set)
+        with self._transaction() as cursor:
+            self._load_current_files(cursor, current_files)
+            cursor.execute("""
+                SELECT f.directory_path, f.file_name
+                FROM file_checksums f
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM temp.current_files c
+                    WHERE c.directory_path = f.directory_path
+                        AND c.file_name = f.file_name
+                )
+            """)
+            rows = cursor.fetchall()
+            cursor.execute("DELETE FROM temp.current_files")
+        return [os.path.join(row[0], row[1]) for row in rows]
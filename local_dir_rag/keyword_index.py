@@ -0,0 +1,278 @@
+"""Keyword index of chunk texts using SQLite FTS5, and hybrid search."""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Iterable
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from local_dir_rag.file_tracker import SQLITE_PRAGMAS
+from local_dir_rag.shards import ShardedVectorStore
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+KEYWORD_INDEX_FILE = "keyword_index.db"
+
+# Rank constant of reciprocal rank fusion; larger values flatten the
+# advantage of the top ranks
+DEFAULT_RRF_K = 60
+
+# Maximum number of ids bound in one statement
+SQL_BATCH_SIZE = 500
+
+# Words of a query, including identifiers such as "XJ-200B" or "v1.2"
+_QUERY_WORD = re.compile(r"\w+(?:[-./:]\w+)*")
+_TOKEN = re.compile(r"\w+")
+
+
+def keyword_query(text: str) -> str | None:
+    """
+    Build an FTS5 query matching any word of a text.
+
+    The tokenizer splits identifiers at punctuation, so each identifier
+    is also matched as a phrase of its parts, ranking exact identifiers
+    above chunks that only share one part.
+
+    Args:
+        text: Question or search text.
+
+    Returns:
+        The FTS5 query, or None if the text has no words.
+    """
+    terms = []
+    for word in _QUERY_WORD.findall(text):
+        tokens = _TOKEN.findall(word)
+        if len(tokens) > 1:
+            terms.append(f'"{" ".join(tokens)}"')
+        terms.extend(f'"{token}"' for token in tokens)
+    if not terms:
+        return None
+    return " OR ".join(dict.fromkeys(terms))
+
+
+class KeywordIndex:
+    """
+    Full-text index of chunk texts, searched with BM25 ranking.
+
+    Chunks are stored by id with the path of their source file, in an
+    SQLite database next to the file tracker, and indexed by an FTS5 table
+    over the stored texts. One connection is shared between threads; call
+    ``close`` or use the index as a context manager to release it.
+    """
+
+    def __init__(self, vector_db_path: str):
+        """
+        Initialize the keyword index.
+
+        Args:
+            vector_db_path: Path to the vector database directory.
+                The SQLite database will be created in this directory.
+        """
+        self.db_path = os.path.join(vector_db_path, KEYWORD_INDEX_FILE)
+        self._lock = threading.Lock()
+        os.makedirs(vector_db_path, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            check_same_thread=False
+        )
+        for pragma in SQLITE_PRAGMAS:
+            self._conn.execute(pragma)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    chunk_id TEXT NOT NULL UNIQUE,
+                    source TEXT,
+                    text TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)
+            """)
+            self._conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                    text,
+                    content = 'chunks',
+                    content_rowid = 'id',
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            """)
+            # Keep the full-text index in step with the stored texts
+            self._conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS chunks_insert
+                AFTER INSERT ON chunks BEGIN
+                    INSERT INTO chunks_fts (rowid, text)
+                    VALUES (new.id, new.text);
+                END
+            """)
+            self._conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS chunks_delete
+                AFTER DELETE ON chunks BEGIN
+                    INSERT INTO chunks_fts (chunks_fts, rowid, text)
+                    VALUES ('delete', old.id, old.text);
+                END
+            """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def count(self) -> int:
+        """Number of indexed chunks."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM chunks"
+            ).fetchone()[0]
+
+    def update(
+        self,
+        added: Iterable[tuple[str, str, str]] = (),
+        deleted: Iterable[str] = ()
+    ) -> None:
+        """
+        Delete and add chunks in one transaction.
+
+        Chunks added with the id of an indexed chunk replace it.
+
+        Args:
+            added: (chunk id, source path, text) of chunks to add.
+            deleted: Ids of chunks to delete.
+        """
+        added = list(added)
+        # Replaced chunks are deleted first: REPLACE would remove them
+        # without firing the delete trigger, leaving their words in
+        # chunks_fts
+        deleted = list(dict.fromkeys([
+            *deleted, *(chunk_id for chunk_id, _, _ in added)
+        ]))
+        with self._lock, self._conn:
+            for start in range(0, len(deleted), SQL_BATCH_SIZE):
+                batch = deleted[start:start + SQL_BATCH_SIZE]
+                self._conn.execute(
+                    "DELETE FROM chunks WHERE chunk_id IN "
+                    f"({', '.join('?' * len(batch))})",
+                    batch
+                )
+            self._conn.executemany(
+                """
+                INSERT INTO chunks (chunk_id, source, text)
+                VALUES (?, ?, ?)
+                ON CONFLICT (chunk_id) DO NOTHING
+                """,
+                added
+            )
+
+    def search(self, text: str, k: int) -> list[str]:
+        """
+        Find the chunks that best match the words of a text.
+
+        Args:
+            text: Question or search text.
+            k: Maximum number of chunks.
+
+        Returns:
+            Chunk ids, best match first.
+        """
+        query = keyword_query(text)
+        if query is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT chunks.chunk_id
+                FROM chunks_fts JOIN chunks ON chunks.id = chunks_fts.rowid
+                WHERE chunks_fts MATCH ?
+                ORDER BY chunks_fts.rank
+                LIMIT ?
+                """,
+                (query, k)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[list[Document]],
+    k: int,
+    rrf_k: int = DEFAULT_RRF_K
+) -> list[Document]:
+    """
+    Merge rankings of documents by reciprocal rank fusion.
+
+    Each document scores the sum of ``1 / (rrf_k + rank)`` over the
+    rankings it appears in, so documents found by several rankings rise
+    above documents that only one ranking places high.
+
+    Args:
+        rankings: Lists of documents, best first.
+        k: Number of documents to return.
+        rrf_k: Rank constant.
+
+    Returns:
+        The k best documents, best first.
+    """
+    scores: dict[str, float] = {}
+    documents: dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+
+def hybrid_search(
+    vector_db: FAISS | ShardedVectorStore,
+    keyword_index: KeywordIndex,
+    query: str,
+    k: int,
+    embedding: list[float] = None,
+    candidates: int = None,
+    rrf_k: int = DEFAULT_RRF_K
+) -> list[Document]:
+    """
+    Search by vector similarity and by keywords, and fuse the results.
+
+    Args:
+        vector_db: Vector database to search.
+        keyword_index: Keyword index of the vector database's chunks.
+        query: Question or search text.
+        k: Number of documents to return.
+        embedding: Embedding of the query, if already computed.
+        candidates: Number of documents taken from each search
+            (default: 2 * k).
+        rrf_k: Rank constant of reciprocal rank fusion.
+
+    Returns:
+        The k best documents, best first.
+    """
+    candidates = candidates or 2 * k
+    if embedding is None:
+        embedding = vector_db.embeddings.embed_query(query)
+    vector_results = vector_db.similarity_search_by_vector(
+        embedding, k=candidates
+    )
+    # Chunks indexed by keyword but not saved in the vector database are
+    # not found by id, and left out
+    keyword_results = vector_db.get_by_ids(
+        keyword_index.search(query, candidates)
+    )
+    return reciprocal_rank_fusion(
+        [vector_results, keyword_results], k, rrf_k=rrf_k
+    )
@@ -1,11 +1,42 @@
-"""Main entry point for the local-dir-rag package."""
+"""
+Main entry point for the local-dir-rag package.
+
+Only the command that runs imports LangChain, FAISS and the OpenAI
+client, which take seconds to import, so parsing the command line and
+printing help stay fast.
+"""
 
 import argparse
+import asyncio
+import json
 import os
 import logging
+from dataclasses import replace
+
 from dotenv import load_dotenv
-from local_dir_rag.query_with_rag import query_loop
-from local_dir_rag.embed import embed_docs
+from local_dir_rag.defaults import (
+    DEFAULT_ANSWER_TTL_SECONDS,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_BATCH_TOKENS,
+    DEFAULT_CACHE_ENTRIES,
+    DEFAULT_CHECKPOINT_FILES,
+    DEFAULT_CHECKPOINT_SECONDS,
+    DEFAULT_CONTEXT_TOKENS,
+    DEFAULT_DEBOUNCE_SECONDS,
+    DEFAULT_MAX_ANSWERS,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_DELAY_SECONDS,
+    DEFAULT_POLL_INTERVAL,
+    INDEX_TYPES,
+    SHARD_BY,
+    STORAGE_TYPES,
+)
+from local_dir_rag.file_tracker import (
+    CHECKSUM_ALGORITHMS,
+    DEFAULT_CHECKSUM_ALGORITHM,
+    FileTracker,
+)
+from local_dir_rag.metrics import RunMetrics
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,7 +45,31 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def embed(docs_paths: str | list[str] = None, vector_db_path: str = None):
+def embed(
+    docs_paths: str | list[str] = None,
+    vector_db_path: str = None,
+    verify_checksums: bool = False,
+    checksum_algorithm: str = DEFAULT_CHECKSUM_ALGORITHM,
+    exclude_patterns: list[str] = None,
+    workers: int = 1,
+    max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint_files: int = DEFAULT_CHECKPOINT_FILES,
+    checkpoint_seconds: float = DEFAULT_CHECKPOINT_SECONDS,
+    embedding_cache_entries: int = DEFAULT_CACHE_ENTRIES,
+    use_async: bool = False,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    requests_per_minute: float = None,
+    tokens_per_minute: float = None,
+    index_options: dict = None,
+    rebuild_index: bool = False,
+    shard_by: str = None,
+    embeddings: str = None,
+    quantized: bool = False,
+    embedding_threads: int = None,
+    metrics_json: str = None,
+    metrics_textfile: str = None
+):
     """
     Create and save a vector database from documents.
 
@@ -23,7 +78,54 @@ def embed(docs_paths: str | list[str] = None, vector_db_path: str = None):
             directories. Strings may contain multiple paths separated by
             ``os.pathsep``.
         vector_db_path (str, optional): Path to save the vector database.
+        verify_checksums (bool, optional): Hash every file to detect
+            changes, even when its size and modification time are unchanged.
+        checksum_algorithm (str, optional): Algorithm used to checksum new
+            and changed files.
+        exclude_patterns (list[str], optional): Gitignore-style patterns of
+            paths to leave out of each document directory.
+        workers (int, optional): Number of processes that load and split
+            documents, and of concurrent embedding requests.
+        max_batch_tokens (int, optional): Estimated token budget of an
+            embedding request.
+        max_batch_size (int, optional): Maximum number of chunks in an
+            embedding request.
+        checkpoint_files (int, optional): Save the vector database after
+            this many indexed files; 0 to disable.
+        checkpoint_seconds (float, optional): Save the vector database
+            when this many seconds have passed since the last save; 0 to
+            disable.
+        embedding_cache_entries (int, optional): Maximum number of
+            cached embedding vectors; 0 to disable the cache.
+        use_async (bool, optional): Send embedding requests through the
+            asynchronous client, with rate limiting and backoff.
+        max_concurrency (int, optional): Maximum number of asynchronous
+            embedding requests in flight.
+        requests_per_minute (float, optional): Asynchronous embedding
+            request rate limit.
+        tokens_per_minute (float, optional): Asynchronous embedding token
+            rate limit.
+        index_options (dict, optional): ``IndexConfig`` fields to change
+            from the configuration saved with the vector database, such
+            as ``{"index_type": "hnsw"}``.
+        rebuild_index (bool, optional): Rebuild the index even if it is
+            already of the configured type.
+        shard_by (str, optional): Partitioning of a new vector database
+            into shards (``none``, ``root`` or ``subdirectory``).
+        embeddings (str, optional): Embedding model, ``openai[:<model>]``
+            or ``local[:<model>]``.
+        quantized (bool, optional): Run the int8 ONNX export of a local
+            model.
+        embedding_threads (int, optional): CPU threads of a local model.
+        metrics_json (str, optional): Path to save the run report in, as
+            JSON.
+        metrics_textfile (str, optional): Path to save the run report
+            in, as a Prometheus textfile.
     """
+    from local_dir_rag.embed import aembed_docs, embed_docs
+    from local_dir_rag.embedding_models import create_embeddings
+    from local_dir_rag.faiss_index import IndexConfig
+
     docs_paths = docs_paths or os.getenv("DOCS_PATH")
     if docs_paths is None:
         raise ValueError("Documents path is not set.")
@@ -32,24 +134,507 @@ def embed(docs_paths: str | list[str] = None, vector_db_path: str = None):
     if vector_db_path is None:
         raise ValueError("Vector database path is not set.")
 
-    return embed_docs(
-        docs_paths=docs_paths,
-        vector_db_path=vector_db_path
-    )
+    options = {
+        "docs_paths": docs_paths,
+        "vector_db_path": vector_db_path,
+        "verify_checksums": verify_checksums,
+        "checksum_algorithm": checksum_algorithm,
+        "exclude_patterns": exclude_patterns,
+        "workers": workers,
+        "max_batch_tokens": max_batch_tokens,
+        "max_batch_size": max_batch_size,
+        "checkpoint_files": checkpoint_files,
+        "checkpoint_seconds": checkpoint_seconds,
+        "embedding_cache_entries": embedding_cache_entries,
+        "rebuild_index": rebuild_index,
+        "shard_by": shard_by,
+        "embeddings_model": create_embeddings(
+            embeddings,
+            quantized=quantized,
+            threads=embedding_threads,
+            max_retries=0 if use_async else None
+        ),
+        "metrics": RunMetrics(),
+    }
+    if index_options:
+        options["index_config"] = replace(
+            IndexConfig.load(vector_db_path) or IndexConfig(),
+            **index_options
+        )
+    try:
+        if use_async:
+            return asyncio.run(aembed_docs(
+                **options,
+                max_concurrency=max_concurrency,
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute
+            ))
+        return embed_docs(**options)
+    finally:
+        # Reports of failed runs show how far they got
+        if metrics_json:
+            options["metrics"].write_json(metrics_json)
+        if metrics_textfile:
+            options["metrics"].write_prometheus(metrics_textfile)
 
 
-def query(vector_db_path: str = None):
+def watch(
+    docs_paths: str | list[str] = None,
+    vector_db_path: str = None,
+    verify_checksums: bool = False,
+    checksum_algorithm: str = DEFAULT_CHECKSUM_ALGORITHM,
+    exclude_patterns: list[str] = None,
+    workers: int = 1,
+    max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint_files: int = DEFAULT_CHECKPOINT_FILES,
+    checkpoint_seconds: float = DEFAULT_CHECKPOINT_SECONDS,
+    embedding_cache_entries: int = DEFAULT_CACHE_ENTRIES,
+    shard_by: str = None,
+    embeddings: str = None,
+    quantized: bool = False,
+    embedding_threads: int = None,
+    debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS,
+    max_delay_seconds: float = DEFAULT_MAX_DELAY_SECONDS,
+    polling: bool = False,
+    poll_interval: float = DEFAULT_POLL_INTERVAL
+):
+    """
+    Index documents, then keep indexing their changes until interrupted.
+
+    Args:
+        docs_paths, vector_db_path, verify_checksums, checksum_algorithm,
+        exclude_patterns, workers, max_batch_tokens, max_batch_size,
+        checkpoint_files, checkpoint_seconds, embedding_cache_entries,
+        shard_by, embeddings, quantized, embedding_threads:
+            See ``embed``.
+        debounce_seconds (float, optional): Seconds without changes that
+            end a burst of changes.
+        max_delay_seconds (float, optional): Maximum seconds a burst of
+            changes is collected before it is indexed.
+        polling (bool, optional): Poll the directories instead of using
+            inotify.
+        poll_interval (float, optional): Seconds between polls.
+    """
+    from local_dir_rag.embed import watch_docs
+    from local_dir_rag.embedding_models import create_embeddings
+
+    docs_paths = docs_paths or os.getenv("DOCS_PATH")
+    if docs_paths is None:
+        raise ValueError("Documents path is not set.")
+
+    vector_db_path = vector_db_path or os.getenv("VECTOR_DB_PATH")
+    if vector_db_path is None:
+        raise ValueError("Vector database path is not set.")
+
+    try:
+        watch_docs(
+            docs_paths=docs_paths,
+            vector_db_path=vector_db_path,
+            embeddings_model=create_embeddings(
+                embeddings, quantized=quantized, threads=embedding_threads
+            ),
+            verify_checksums=verify_checksums,
+            checksum_algorithm=checksum_algorithm,
+            exclude_patterns=exclude_patterns,
+            workers=workers,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_size=max_batch_size,
+            checkpoint_files=checkpoint_files,
+            checkpoint_seconds=checkpoint_seconds,
+            embedding_cache_entries=embedding_cache_entries,
+            shard_by=shard_by,
+            debounce_seconds=debounce_seconds,
+            max_delay_seconds=max_delay_seconds,
+            polling=polling,
+            poll_interval=poll_interval
+        )
+    except KeyboardInterrupt:
+        # Changes indexed so far are saved; an interrupted update is
+        # redone on the next run
+        logger.info("Stopped watching")
+
+
+def query(
+    vector_db_path: str = None,
+    k: int = 30,
+    nprobe: int = None,
+    ef_search: int = None,
+    rerank_factor: int = None,
+    mmap: bool = True,
+    warm_up: bool = False,
+    hybrid: bool = True,
+    context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+    use_answer_cache: bool = True,
+    answer_cache_entries: int = DEFAULT_MAX_ANSWERS,
+    answer_cache_ttl: float = DEFAULT_ANSWER_TTL_SECONDS,
+    semantic_cache_threshold: float = None,
+    embeddings: str = None,
+    quantized: bool = False,
+    embedding_threads: int = None
+):
     """
     Run an interactive query session using the specified vector database.
 
     Args:
         vector_db_path: Path to the vector database to query
+        k: Number of documents to retrieve
+        nprobe: Number of IVF lists to search
+        ef_search: Number of HNSW candidates to search
+        rerank_factor: Number of candidates of a compressed index to
+            re-rank by exact distance, as a multiple of the results
+        mmap: Whether to memory-map the index read-only
+        warm_up: Whether to read the index into the page cache first
+        hybrid: Whether to fuse keyword and vector search results
+        context_tokens: Token budget of the retrieved text, 0 for no limit
+        use_answer_cache: Whether to cache answers to repeated questions
+        answer_cache_entries: Maximum number of cached answers
+        answer_cache_ttl: Seconds after which a cached answer expires
+        semantic_cache_threshold: Minimum cosine similarity of question
+            embeddings to reuse an answer, or None for exact matches only
+        embeddings: Embedding model, ``openai[:<model>]`` or
+            ``local[:<model>]``; it must be the model of the index
+        quantized: Whether to run the int8 ONNX export of a local model
+        embedding_threads: CPU threads of a local model
+    """
+    from local_dir_rag.query_with_rag import query_loop
+
+    vector_db_path = vector_db_path or os.getenv("VECTOR_DB_PATH")
+    if vector_db_path is None:
+        raise ValueError("Vector database path is not set.")
+
+    query_loop(
+        vector_db_path,
+        k=k,
+        nprobe=nprobe,
+        ef_search=ef_search,
+        rerank_factor=rerank_factor,
+        mmap=mmap,
+        warm_up=warm_up,
+        hybrid=hybrid,
+        context_tokens=context_tokens,
+        use_answer_cache=use_answer_cache,
+        answer_cache_entries=answer_cache_entries,
+        answer_cache_ttl=answer_cache_ttl,
+        semantic_cache_threshold=semantic_cache_threshold,
+        embeddings=embeddings,
+        quantized=quantized,
+        embedding_threads=embedding_threads
+    )
+
+
+def stats(vector_db_path: str = None):
+    """
+    Print the number of chunks indexed for each file, and how many
+    distinct chunks are stored.
+
+    Counts are read from the file tracker database, without loading the
+    vector database.
+
+    Args:
+        vector_db_path: Path to the vector database
+    """
+    vector_db_path = vector_db_path or os.getenv("VECTOR_DB_PATH")
+    if vector_db_path is None:
+        raise ValueError("Vector database path is not set.")
+
+    if not os.path.exists(os.path.join(vector_db_path, "file_tracker.db")):
+        print(f"No file tracker database found at {vector_db_path}")
+        return
+
+    with FileTracker(vector_db_path) as file_tracker:
+        chunk_counts = file_tracker.get_chunk_counts()
+        _, unique_chunks = file_tracker.get_chunk_totals()
+
+    total_chunks = 0
+    for file_path, chunk_count in chunk_counts:
+        # Files indexed before chunk ids were recorded have no count
+        if chunk_count is None:
+            print(f"{'?':>8}  {file_path}")
+        else:
+            print(f"{chunk_count:>8}  {file_path}")
+            total_chunks += chunk_count
+    print(f"{total_chunks:>8}  chunks in {len(chunk_counts)} files")
+    if unique_chunks < total_chunks:
+        print(
+            f"{unique_chunks:>8}  distinct chunks stored "
+            f"({total_chunks - unique_chunks} duplicates)"
+        )
+
+
+def index_report(
+    vector_db_path: str = None,
+    k: int = 10,
+    query_count: int = 100,
+    recall_tolerance: float = 0.05
+):
     """
+    Print the memory and recall of the index with each storage option.
+
+    The vectors of the saved index, or of all shards, are indexed again
+    with each storage option, with and without re-ranking, using the
+    index type of the saved configuration; the vector database itself is
+    not changed.
+
+    Args:
+        vector_db_path: Path to the vector database
+        k: Number of neighbours searched
+        query_count: Number of stored vectors used as queries
+        recall_tolerance: Largest acceptable loss of recall against
+            exact search
+    """
+    import faiss
+    import numpy as np
+
+    from local_dir_rag.faiss_index import (
+        IndexConfig,
+        compare_storage_options,
+        describe_storage,
+        index_vectors,
+    )
+    from local_dir_rag.shards import list_shards, shard_path
+    from local_dir_rag.vector_store import INDEX_NAME
+
     vector_db_path = vector_db_path or os.getenv("VECTOR_DB_PATH")
     if vector_db_path is None:
         raise ValueError("Vector database path is not set.")
 
-    query_loop(vector_db_path)
+    index_paths = [
+        os.path.join(shard_path(vector_db_path, shard), f"{INDEX_NAME}.faiss")
+        for shard in list_shards(vector_db_path)
+    ]
+    index_paths = [path for path in index_paths if os.path.exists(path)]
+    if not index_paths:
+        print(f"No vector database found at {vector_db_path}")
+        return
+
+    indexes = [faiss.read_index(path) for path in index_paths]
+    config = IndexConfig.load(vector_db_path) or IndexConfig()
+    if (
+        any(describe_storage(index) != "flat" for index in indexes)
+        and not config.reranks
+    ):
+        logger.warning(
+            "The index stores compressed vectors; recall is measured "
+            "against their decoded values"
+        )
+    vectors = np.vstack([index_vectors(index) for index in indexes])
+    reports = compare_storage_options(
+        vectors,
+        config,
+        indexes[0].metric_type,
+        k=k,
+        query_count=query_count
+    )
+
+    print(
+        f"{'index':<24} {'storage':<8} {'rerank':>6} {'memory MiB':>11} "
+        f"{'recall':>7} {'ms/query':>9}"
+    )
+    for report in reports:
+        within = "" if report.recall >= 1 - recall_tolerance else "  low"
+        print(
+            f"{report.description:<24} {report.storage:<8} "
+            f"{report.rerank_factor or '-':>6} "
+            f"{report.memory_bytes / 2**20:>11.2f} "
+            f"{report.recall:>7.3f} {report.query_ms:>9.3f}{within}"
+        )
+    print(
+        f"Recall@{k} of {len(vectors)} vectors with a {config.index_type} "
+        f"index; 'low' marks recall below {1 - recall_tolerance:.3f}"
+    )
+
+
+def migrate(vector_db_path: str = None, compress: bool = True):
+    """
+    Move the documents of a vector database into an SQLite docstore.
+
+    Args:
+        vector_db_path: Path to the vector database
+        compress: Whether to compress the document texts
+    """
+    from local_dir_rag.vector_store import INDEX_NAME, migrate_docstore
+
+    vector_db_path = vector_db_path or os.getenv("VECTOR_DB_PATH")
+    if vector_db_path is None:
+        raise ValueError("Vector database path is not set.")
+
+    if not os.path.exists(os.path.join(vector_db_path, f"{INDEX_NAME}.pkl")):
+        print(f"No vector database found at {vector_db_path}")
+        return
+
+    migrated = migrate_docstore(vector_db_path, compress=compress)
+    if migrated:
+        print(f"Moved {migrated} documents to the SQLite docstore")
+    else:
+        print("The vector database already uses the SQLite docstore")
+
+
+def run_benchmark(
+    corpus_options: dict = None,
+    output: str = None,
+    baseline: str = None,
+    **options
+):
+    """
+    Benchmark ingest on a synthetic corpus and print the results.
+
+    Args:
+        corpus_options: ``CorpusConfig`` fields to change from the
+            default size and shape of the corpus, such as
+            ``{"files": 1000}``
+        output: Path of a JSON file to save the results in
+        baseline: Path of the JSON results of an earlier run to compare
+            with
+        **options: Options of ``benchmark``
+    """
+    from local_dir_rag.benchmark import (
+        CorpusConfig,
+        benchmark,
+        format_results,
+        write_results,
+    )
+
+    corpus = CorpusConfig(**(corpus_options or {}))
+    baseline_results = None
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            baseline_results = json.load(f)
+    results = benchmark(corpus, **options)
+    print(format_results(results, baseline_results))
+    if output:
+        write_results(results, output)
+        print(f"Results saved to {output}")
+
+
+def _add_ingest_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the options of the documents to index to a command.
+
+    Args:
+        parser: Parser of the command.
+    """
+    parser.add_argument(
+        "--docs-paths",
+        "--docs-directory",
+        dest="docs_paths",
+        required=False,
+        help=(
+            "One or more directories containing documents to embed. "
+            f"Separate multiple paths with '{os.pathsep}'."
+        )
+    )
+    parser.add_argument(
+        "--vector-db-path",
+        required=False,
+        help="Path where to save the vector database"
+    )
+    parser.add_argument(
+        "--verify-checksums",
+        action="store_true",
+        help=(
+            "Hash every file to detect changes, instead of trusting "
+            "unchanged file size and modification time"
+        )
+    )
+    parser.add_argument(
+        "--checksum-algorithm",
+        choices=CHECKSUM_ALGORITHMS,
+        default=DEFAULT_CHECKSUM_ALGORITHM,
+        help="Algorithm used to checksum new and changed files"
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help=(
+            "Gitignore-style pattern of paths to leave out, relative to "
+            "each documents directory. May be repeated."
+        )
+    )
+    parser.add_argument(
+        "--exclude-from",
+        metavar="FILE",
+        help="Read gitignore-style exclude patterns from a file"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=(
+            "Number of processes that load and split documents, and of "
+            "concurrent embedding requests"
+        )
+    )
+    parser.add_argument(
+        "--batch-tokens",
+        type=int,
+        default=DEFAULT_BATCH_TOKENS,
+        help="Estimated token budget of an embedding request"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Maximum number of chunks in an embedding request"
+    )
+    parser.add_argument(
+        "--checkpoint-files",
+        type=int,
+        default=DEFAULT_CHECKPOINT_FILES,
+        help=(
+            "Save the vector database after this many indexed files "
+            "(0 to disable)"
+        )
+    )
+    parser.add_argument(
+        "--checkpoint-seconds",
+        type=float,
+        default=DEFAULT_CHECKPOINT_SECONDS,
+        help=(
+            "Save the vector database when this many seconds have passed "
+            "since the last save (0 to disable)"
+        )
+    )
+
+    parser.add_argument(
+        "--embedding-cache-entries",
+        type=int,
+        default=DEFAULT_CACHE_ENTRIES,
+        help=(
+            "Maximum number of embedding vectors cached in the vector "
+            "database directory, so unchanged chunks are not embedded "
+            "again (0 to disable)"
+        )
+    )
+
+
+def _add_embeddings_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the options selecting the embedding model to a command.
+
+    Args:
+        parser: Parser of the command.
+    """
+    parser.add_argument(
+        "--embeddings",
+        help=(
+            "Embedding model: openai, openai:<model>, local or "
+            "local:<sentence-transformers model> (default: the EMBEDDINGS "
+            "environment variable, or openai)"
+        )
+    )
+    parser.add_argument(
+        "--quantized",
+        action="store_true",
+        help="Run the int8 ONNX export of a local model"
+    )
+    parser.add_argument(
+        "--embedding-threads",
+        type=int,
+        help="Number of CPU threads of a local model (default: all cores)"
+    )
 
 
 def main():
@@ -74,20 +659,184 @@ def main():
         "embed",
         help="Create a vector database from documents"
     )
+    _add_ingest_arguments(embed_parser)
+
     embed_parser.add_argument(
-        "--docs-paths",
-        "--docs-directory",
-        dest="docs_paths",
-        required=False,
+        "--async",
+        dest="use_async",
+        action="store_true",
         help=(
-            "One or more directories containing documents to embed. "
-            f"Separate multiple paths with '{os.pathsep}'."
+            "Send embedding requests concurrently from an event loop, with "
+            "rate limiting and backoff on 429 and 5xx responses"
         )
     )
     embed_parser.add_argument(
-        "--vector-db-path",
-        required=False,
-        help="Path where to save the vector database"
+        "--max-concurrency",
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help="Maximum number of embedding requests in flight with --async"
+    )
+    embed_parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        help="Embedding request rate limit with --async"
+    )
+    embed_parser.add_argument(
+        "--tokens-per-minute",
+        type=float,
+        help="Estimated embedding token rate limit with --async"
+    )
+
+    embed_parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        help=(
+            "FAISS index type: exact flat search, or approximate IVF or "
+            "HNSW search (default: the type the database was built with, "
+            "or flat)"
+        )
+    )
+    embed_parser.add_argument(
+        "--nlist",
+        type=int,
+        help="Number of IVF lists (default: about 4 * sqrt(vectors))"
+    )
+    embed_parser.add_argument(
+        "--nprobe",
+        type=int,
+        help="Number of IVF lists searched by default"
+    )
+    embed_parser.add_argument(
+        "--hnsw-m",
+        dest="m",
+        type=int,
+        help="Number of links per vector in the HNSW graph"
+    )
+    embed_parser.add_argument(
+        "--ef-construction",
+        type=int,
+        help="Number of candidates considered when building the HNSW graph"
+    )
+    embed_parser.add_argument(
+        "--ef-search",
+        type=int,
+        help="Number of HNSW candidates searched by default"
+    )
+    embed_parser.add_argument(
+        "--storage",
+        choices=STORAGE_TYPES,
+        help=(
+            "Vector storage: float32, 8-bit scalar quantization, float16, "
+            "or product quantization (default: the storage the database "
+            "was built with, or flat)"
+        )
+    )
+    embed_parser.add_argument(
+        "--pq-m",
+        type=int,
+        help=(
+            "Number of product quantizer bytes per vector; must divide the "
+            "embedding dimensions (default: about one per 8 dimensions)"
+        )
+    )
+    embed_parser.add_argument(
+        "--rerank-factor",
+        type=int,
+        help=(
+            "Keep float32 vectors next to compressed ones, and re-rank this "
+            "many times the requested results by exact distance (0 to "
+            "disable)"
+        )
+    )
+    embed_parser.add_argument(
+        "--training-sample",
+        type=int,
+        help="Maximum number of vectors the IVF lists are trained on"
+    )
+    embed_parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help=(
+            "Rebuild the index even if it is already of the configured "
+            "type, for example to retrain IVF lists"
+        )
+    )
+    embed_parser.add_argument(
+        "--shard-by",
+        choices=SHARD_BY,
+        help=(
+            "Split a new vector database into shards, one per documents "
+            "directory (root) or per top-level subdirectory, which are "
+            "saved separately and searched concurrently (default: the "
+            "saved partitioning, or none)"
+        )
+    )
+    _add_embeddings_arguments(embed_parser)
+    embed_parser.add_argument(
+        "--metrics-json",
+        help=(
+            "Save a JSON report of the run's stage times, counters and "
+            "latency histograms to this path"
+        )
+    )
+    embed_parser.add_argument(
+        "--metrics-textfile",
+        help=(
+            "Save the run report to this path in the Prometheus textfile "
+            "format, for the node exporter's textfile collector"
+        )
+    )
+
+    # Parser for the watch command
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help=(
+            "Create a vector database from documents, then keep indexing "
+            "their changes"
+        )
+    )
+    _add_ingest_arguments(watch_parser)
+    watch_parser.add_argument(
+        "--shard-by",
+        choices=SHARD_BY,
+        help=(
+            "Split a new vector database into shards, one per documents "
+            "directory (root) or per top-level subdirectory (default: the "
+            "saved partitioning, or none)"
+        )
+    )
+    _add_embeddings_arguments(watch_parser)
+    watch_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE_SECONDS,
+        help=(
+            "Index a burst of changes once no change has arrived for this "
+            "many seconds"
+        )
+    )
+    watch_parser.add_argument(
+        "--max-delay",
+        type=float,
+        default=DEFAULT_MAX_DELAY_SECONDS,
+        help=(
+            "Index a burst of changes after this many seconds, even if "
+            "changes keep arriving"
+        )
+    )
+    watch_parser.add_argument(
+        "--poll",
+        action="store_true",
+        help=(
+            "Poll the documents directories instead of using inotify, for "
+            "example on network filesystems"
+        )
+    )
+    watch_parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds between polls, when inotify is not used"
     )
 
     # Parser for the query command
@@ -100,13 +849,369 @@ def main():
         required=False,
         help="Path to the vector database to query"
     )
+    _add_embeddings_arguments(query_parser)
+    query_parser.add_argument(
+        "--k",
+        type=int,
+        default=30,
+        help="Number of document chunks to retrieve for each question"
+    )
+    query_parser.add_argument(
+        "--context-tokens",
+        type=int,
+        default=DEFAULT_CONTEXT_TOKENS,
+        help=(
+            "Token budget of the retrieved text, after merging overlapping "
+            "chunks of the same page; 0 for no limit"
+        )
+    )
+    query_parser.add_argument(
+        "--nprobe",
+        type=int,
+        help="Number of IVF lists to search (default: saved with the index)"
+    )
+    query_parser.add_argument(
+        "--ef-search",
+        type=int,
+        help=(
+            "Number of HNSW candidates to search (default: saved with the "
+            "index)"
+        )
+    )
+    query_parser.add_argument(
+        "--rerank-factor",
+        type=int,
+        help=(
+            "Number of candidates of a compressed index to re-rank by exact "
+            "distance, as a multiple of the results (default: saved with "
+            "the index)"
+        )
+    )
+    query_parser.add_argument(
+        "--no-mmap",
+        dest="mmap",
+        action="store_false",
+        help=(
+            "Read the index into memory instead of memory-mapping it "
+            "read-only"
+        )
+    )
+    query_parser.add_argument(
+        "--warm-up",
+        action="store_true",
+        help=(
+            "Read the index into the page cache at startup, so the first "
+            "questions do not wait for the disk"
+        )
+    )
+    query_parser.add_argument(
+        "--no-hybrid",
+        dest="hybrid",
+        action="store_false",
+        help=(
+            "Retrieve by vector similarity only, instead of fusing it "
+            "with keyword search"
+        )
+    )
+    query_parser.add_argument(
+        "--no-answer-cache",
+        dest="use_answer_cache",
+        action="store_false",
+        help="Do not answer repeated questions from the answer cache"
+    )
+    query_parser.add_argument(
+        "--answer-cache-entries",
+        type=int,
+        default=DEFAULT_MAX_ANSWERS,
+        help="Maximum number of cached answers"
+    )
+    query_parser.add_argument(
+        "--answer-cache-ttl",
+        type=float,
+        default=DEFAULT_ANSWER_TTL_SECONDS,
+        help="Seconds after which a cached answer expires"
+    )
+    query_parser.add_argument(
+        "--semantic-cache-threshold",
+        type=float,
+        help=(
+            "Reuse the answer to a different question whose embedding has "
+            "at least this cosine similarity, such as 0.95"
+        )
+    )
+
+    # Parser for the stats command
+    stats_parser = subparsers.add_parser(
+        "stats",
+        help="Show the number of chunks indexed for each file"
+    )
+    stats_parser.add_argument(
+        "--vector-db-path",
+        required=False,
+        help="Path to the vector database"
+    )
+
+    # Parser for the index-report command
+    report_parser = subparsers.add_parser(
+        "index-report",
+        help="Compare index memory and recall for each storage option"
+    )
+    report_parser.add_argument(
+        "--vector-db-path",
+        required=False,
+        help="Path to the vector database"
+    )
+    report_parser.add_argument(
+        "--k",
+        type=int,
+        default=10,
+        help="Number of neighbours searched"
+    )
+    report_parser.add_argument(
+        "--queries",
+        type=int,
+        default=100,
+        help="Number of stored vectors used as queries"
+    )
+    report_parser.add_argument(
+        "--recall-tolerance",
+        type=float,
+        default=0.05,
+        help="Largest acceptable loss of recall against exact search"
+    )
+
+    # Parser for the migrate-docstore command
+    migrate_parser = subparsers.add_parser(
+        "migrate-docstore",
+        help="Move the documents of index.pkl into an SQLite docstore"
+    )
+    migrate_parser.add_argument(
+        "--vector-db-path",
+        required=False,
+        help="Path to the vector database"
+    )
+    migrate_parser.add_argument(
+        "--no-compress",
+        dest="compress",
+        action="store_false",
+        help="Store document texts uncompressed"
+    )
+
+    # Parser for the benchmark command
+    benchmark_parser = subparsers.add_parser(
+        "benchmark",
+        help=(
+            "Measure ingest throughput on a synthetic corpus with a fake "
+            "embedding model"
+        )
+    )
+    benchmark_parser.add_argument(
+        "--files",
+        type=int,
+        help="Number of files in the corpus"
+    )
+    benchmark_parser.add_argument(
+        "--pdf-fraction",
+        type=float,
+        help="Fraction of the files that are PDFs"
+    )
+    benchmark_parser.add_argument(
+        "--paragraphs-per-file",
+        type=int,
+        help="Average number of paragraphs of a file"
+    )
+    benchmark_parser.add_argument(
+        "--directories",
+        type=int,
+        help="Number of directories the files are spread over"
+    )
+    benchmark_parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed of the generated text"
+    )
+    benchmark_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=(
+            "Number of load and split processes and of concurrent "
+            "embedding requests"
+        )
+    )
+    benchmark_parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Seconds taken by each fake embedding request"
+    )
+    benchmark_parser.add_argument(
+        "--text-latency",
+        type=float,
+        default=0.0005,
+        help="Additional seconds per text of a fake embedding request"
+    )
+    benchmark_parser.add_argument(
+        "--dimension",
+        type=int,
+        default=384,
+        help="Dimension of the fake embeddings"
+    )
+    benchmark_parser.add_argument(
+        "--batch-tokens",
+        type=int,
+        default=DEFAULT_BATCH_TOKENS,
+        help="Estimated token budget of an embedding request"
+    )
+    benchmark_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Maximum number of chunks in an embedding request"
+    )
+    benchmark_parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Embed through the asynchronous client"
+    )
+    benchmark_parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help="Maximum number of asynchronous embedding requests in flight"
+    )
+    benchmark_parser.add_argument(
+        "--work-dir",
+        help=(
+            "Directory to keep the corpus and vector database in "
+            "(default: a temporary directory)"
+        )
+    )
+    benchmark_parser.add_argument(
+        "--output",
+        help="Path of a JSON file to save the results in"
+    )
+    benchmark_parser.add_argument(
+        "--baseline",
+        help="JSON results of an earlier run to compare with"
+    )
 
     # Parse the arguments and execute the appropriate command
     args = parser.parse_args()
+    if args.command in ("embed", "watch"):
+        exclude_patterns = list(args.exclude)
+        if args.exclude_from:
+            with open(args.exclude_from, encoding="utf-8") as f:
+                exclude_patterns.extend(f.read().splitlines())
     if args.command == "embed":
-        embed(args.docs_paths, args.vector_db_path)
+        embed(
+            args.docs_paths,
+            args.vector_db_path,
+            verify_checksums=args.verify_checksums,
+            checksum_algorithm=args.checksum_algorithm,
+            exclude_patterns=exclude_patterns,
+            workers=args.workers,
+            max_batch_tokens=args.batch_tokens,
+            max_batch_size=args.batch_size,
+            checkpoint_files=args.checkpoint_files,
+            checkpoint_seconds=args.checkpoint_seconds,
+            embedding_cache_entries=args.embedding_cache_entries,
+            use_async=args.use_async,
+            max_concurrency=args.max_concurrency,
+            requests_per_minute=args.requests_per_minute,
+            tokens_per_minute=args.tokens_per_minute,
+            index_options={
+                name: getattr(args, name)
+                for name in (
+                    "index_type", "nlist", "nprobe", "m",
+                    "ef_construction", "ef_search", "training_sample",
+                    "storage", "pq_m", "rerank_factor"
+                )
+                if getattr(args, name) is not None
+            },
+            rebuild_index=args.rebuild_index,
+            shard_by=args.shard_by,
+            embeddings=args.embeddings,
+            quantized=args.quantized,
+            embedding_threads=args.embedding_threads,
+            metrics_json=args.metrics_json,
+            metrics_textfile=args.metrics_textfile
+        )
+    elif args.command == "watch":
+        watch(
+            args.docs_paths,
+            args.vector_db_path,
+            verify_checksums=args.verify_checksums,
+            checksum_algorithm=args.checksum_algorithm,
+            exclude_patterns=exclude_patterns,
+            workers=args.workers,
+            max_batch_tokens=args.batch_tokens,
+            max_batch_size=args.batch_size,
+            checkpoint_files=args.checkpoint_files,
+            checkpoint_seconds=args.checkpoint_seconds,
+            embedding_cache_entries=args.embedding_cache_entries,
+            shard_by=args.shard_by,
+            embeddings=args.embeddings,
+            quantized=args.quantized,
+            embedding_threads=args.embedding_threads,
+            debounce_seconds=args.debounce,
+            max_delay_seconds=args.max_delay,
+            polling=args.poll,
+            poll_interval=args.poll_interval
+        )
     elif args.command == "query":
-        query(args.vector_db_path)
+        query(
+            args.vector_db_path,
+            k=args.k,
+            nprobe=args.nprobe,
+            ef_search=args.ef_search,
+            rerank_factor=args.rerank_factor,
+            mmap=args.mmap,
+            warm_up=args.warm_up,
+            hybrid=args.hybrid,
+            context_tokens=args.context_tokens,
+            use_answer_cache=args.use_answer_cache,
+            answer_cache_entries=args.answer_cache_entries,
+            answer_cache_ttl=args.answer_cache_ttl,
+            semantic_cache_threshold=args.semantic_cache_threshold,
+            embeddings=args.embeddings,
+            quantized=args.quantized,
+            embedding_threads=args.embedding_threads
+        )
+    elif args.command == "stats":
+        stats(args.vector_db_path)
+    elif args.command == "index-report":
+        index_report(
+            args.vector_db_path,
+            k=args.k,
+            query_count=args.queries,
+            recall_tolerance=args.recall_tolerance
+        )
+    elif args.command == "migrate-docstore":
+        migrate(args.vector_db_path, compress=args.compress)
+    elif args.command == "benchmark":
+        run_benchmark(
+            {
+                name: getattr(args, name)
+                for name in (
+                    "files", "pdf_fraction", "paragraphs_per_file",
+                    "directories", "seed"
+                )
+                if getattr(args, name) is not None
+            },
+            output=args.output,
+            baseline=args.baseline,
+            work_dir=args.work_dir,
+            workers=args.workers,
+            latency=args.latency,
+            text_latency=args.text_latency,
+            dimension=args.dimension,
+            max_batch_tokens=args.batch_tokens,
+            max_batch_size=args.batch_size,
+            use_async=args.use_async,
+            max_concurrency=args.max_concurrency
+        )
     else:
         parser.print_help()
 
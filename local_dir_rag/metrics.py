@@ -0,0 +1,395 @@
+"""Counters, histograms and stage times of an indexing run."""
+
+import bisect
+import datetime
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Stages of an indexing run, in pipeline order
+STAGES = ("scan", "hash", "load", "split", "embed", "save")
+
+COUNTERS = {
+    "bytes_hashed": "Bytes of file content hashed",
+    "files_hashed": "Files whose content was hashed",
+    "files_skipped": "Unchanged files that were not indexed",
+    "files_deleted": "Deleted files whose chunks were removed",
+    "pages_parsed": "Pages (or whole text files) loaded",
+    "chunks_embedded": "Chunks sent to the embedding model",
+    "tokens_embedded": "Estimated tokens sent to the embedding model",
+    "embedding_requests": "Requests to the embedding model",
+    "embedding_cache_hits": "Chunks whose embedding was cached",
+    "chunks_deduplicated": "Chunks already stored for another file",
+}
+
+HISTOGRAMS = {
+    "file_load_seconds": "Time to load and split one file",
+    "embedding_request_seconds": "Latency of embedding model requests",
+    "save_seconds": "Time to save one index",
+}
+
+# Upper bounds of the histogram buckets, in seconds
+HISTOGRAM_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0, 300.0,
+)
+
+PROMETHEUS_PREFIX = "local_dir_rag_ingest"
+
+
+class Histogram:
+    """Counts of observations in cumulative buckets, as Prometheus keeps."""
+
+    def __init__(self, buckets: tuple[float, ...] = HISTOGRAM_BUCKETS):
+        """
+        Initialize an empty histogram.
+
+        Args:
+            buckets: Upper bounds of the buckets, in increasing order.
+        """
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Add an observation.
+
+        Args:
+            value: Observed value.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> list[int]:
+        """Number of observations up to each bucket's upper bound."""
+        counts, total = [], 0
+        for bucket_count in self.bucket_counts:
+            total += bucket_count
+            counts.append(total)
+        return counts
+
+    def as_dict(self) -> dict:
+        """Count, sum, mean and cumulative bucket counts."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "buckets": dict(zip(
+                (str(bound) for bound in self.buckets),
+                self.cumulative_counts()
+            )),
+        }
+
+
+def max_rss_bytes(children: bool = False) -> int | None:
+    """
+    Get the peak resident set size of this process.
+
+    Args:
+        children: Get the peak of the largest child process that has
+            exited instead.
+
+    Returns:
+        Peak bytes, or None where the platform does not report them.
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    # Linux reports kilobytes and macOS bytes
+    unit = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss * unit
+
+
+def _format_duration(seconds: float) -> str:
+    """Format seconds as H:MM:SS."""
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+class RunMetrics:
+    """
+    Counters, histograms and stage times of an indexing run.
+
+    Stages that run concurrently, such as loading in worker processes or
+    embedding on a thread pool, add up the time of every task, so their
+    totals can exceed the run's elapsed time. Progress is measured in
+    bytes of the files to index, so the estimated time left accounts for
+    file sizes. Safe to update from several threads.
+    """
+
+    def __init__(self):
+        """Start measuring a run."""
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.histograms = {name: Histogram() for name in HISTOGRAMS}
+        self.files = 0
+        self.chunks = 0
+        self.files_total = 0
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.worker_peak_rss_bytes = None
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self._files_started = None
+        self._finished = None
+        self._lock = threading.Lock()
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        """
+        Add time spent in a stage.
+
+        Args:
+            stage: Name of the stage.
+            seconds: Seconds spent.
+        """
+        with self._lock:
+            self.stage_seconds[stage] = (
+                self.stage_seconds.get(stage, 0.0) + seconds
+            )
+
+    @contextmanager
+    def measure(self, stage: str, histogram: str = None) -> Iterator[None]:
+        """
+        Add the time spent in a block to a stage.
+
+        Args:
+            stage: Name of the stage.
+            histogram: Histogram to also record the time in, if any.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.add_time(stage, seconds)
+            if histogram is not None:
+                self.observe(histogram, seconds)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Add to a counter.
+
+        Args:
+            name: Name of the counter.
+            value: Amount to add.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Record an observation in a histogram.
+
+        Args:
+            name: Name of the histogram.
+            value: Observed value.
+        """
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def observe_worker_rss(self, rss_bytes: int | None) -> None:
+        """
+        Record the peak resident set size of a worker process.
+
+        Args:
+            rss_bytes: Peak bytes reported by the worker, or None.
+        """
+        if rss_bytes is None:
+            return
+        with self._lock:
+            self.worker_peak_rss_bytes = max(
+                self.worker_peak_rss_bytes or 0, rss_bytes
+            )
+
+    def start_files(self, files: int, total_bytes: int) -> None:
+        """
+        Start measuring progress through the files to index.
+
+        Args:
+            files: Number of files to index.
+            total_bytes: Total size of the files.
+        """
+        with self._lock:
+            self.files_total = files
+            self.bytes_total = total_bytes
+            self._files_started = time.monotonic()
+
+    def add_files(self, files: int, chunks: int, size: int = 0) -> None:
+        """
+        Count indexed files and their chunks.
+
+        Args:
+            files: Number of files.
+            chunks: Number of chunks of the files.
+            size: Total size of the files, in bytes.
+        """
+        with self._lock:
+            self.files += files
+            self.chunks += chunks
+            self.bytes_done += size
+
+    def progress(self) -> str:
+        """
+        Describe the progress through the files to index.
+
+        Returns:
+            Files done of the total, the percentage of bytes, and the
+            estimated time left.
+        """
+        with self._lock:
+            text = f"{self.files}/{self.files_total} files"
+            if not self.bytes_total or self._files_started is None:
+                return text
+            fraction = min(self.bytes_done / self.bytes_total, 1.0)
+            text += f", {100 * fraction:.0f}%"
+            if fraction > 0:
+                elapsed = time.monotonic() - self._files_started
+                remaining = elapsed * (1 - fraction) / fraction
+                text += f", ETA {_format_duration(remaining)}"
+            return text
+
+    def finish(self) -> None:
+        """Stop the run's clock."""
+        self._finished = time.monotonic()
+
+    @property
+    def elapsed_seconds(self) -> float:
+        """Seconds since the run started, until it finished."""
+        return (self._finished or time.monotonic()) - self._started
+
+    def as_dict(self) -> dict:
+        """
+        Summarize the run.
+
+        Returns:
+            Start time, elapsed time, file and chunk counts and rates,
+            stage times, counters, histograms, and the peak resident set
+            size of the largest load and split worker.
+        """
+        elapsed = self.elapsed_seconds
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "elapsed_seconds": elapsed,
+                "files": self.files,
+                "chunks": self.chunks,
+                "files_per_second": self.files / elapsed if elapsed else 0.0,
+                "chunks_per_second": (
+                    self.chunks / elapsed if elapsed else 0.0
+                ),
+                "stage_seconds": dict(self.stage_seconds),
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: histogram.as_dict()
+                    for name, histogram in self.histograms.items()
+                },
+                "worker_peak_rss_bytes": self.worker_peak_rss_bytes,
+            }
+
+    def write_json(self, path: str) -> None:
+        """
+        Save the run report as JSON.
+
+        Args:
+            path: Path of the JSON file.
+        """
+        _write_atomic(path, json.dumps(self.as_dict(), indent=2) + "\n")
+
+    def prometheus_text(self) -> str:
+        """
+        Format the run report in the Prometheus text exposition format.
+
+        Returns:
+            Gauges of the run's totals and stage times, and histograms.
+        """
+        report = self.as_dict()
+        lines = []
+
+        def gauge(name: str, help_text: str, samples: list[tuple]) -> None:
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in samples:
+                lines.append(f"{metric}{labels} {value}")
+
+        gauge("last_run_timestamp_seconds", "Start time of the last run", [
+            ("", report["started_at"])
+        ])
+        gauge("elapsed_seconds", "Duration of the last run", [
+            ("", report["elapsed_seconds"])
+        ])
+        gauge("files", "Files indexed by the last run", [
+            ("", report["files"])
+        ])
+        gauge("chunks", "Chunks of the files indexed by the last run", [
+            ("", report["chunks"])
+        ])
+        gauge("stage_seconds", "Time spent in each stage of the last run", [
+            (f'{{stage="{stage}"}}', seconds)
+            for stage, seconds in report["stage_seconds"].items()
+        ])
+        for name, value in report["counters"].items():
+            gauge(name, COUNTERS.get(name, name), [("", value)])
+        for name, histogram in self.histograms.items():
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {HISTOGRAMS.get(name, name)}")
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, count in zip(
+                histogram.buckets, histogram.cumulative_counts()
+            ):
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.sum}")
+            lines.append(f"{metric}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Save the run report as a Prometheus textfile.
+
+        The file is replaced in one step, so a collector reading the
+        directory never sees a partial report.
+
+        Args:
+            path: Path of the file, conventionally ending in ``.prom``.
+        """
+        _write_atomic(path, self.prometheus_text())
+
+
+def _write_atomic(path: str, text: str) -> None:
+    """
+    Write a text file through a temporary file and a rename.
+
+    Args:
+        path: Path of the file.
+        text: Content of the file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
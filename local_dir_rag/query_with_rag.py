@@ -1,13 +1,43 @@
 """Query with RAG using a local vector database and OpenAI's ChatGPT model."""
 import os
 import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from typing import TextIO
+
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import Runnable, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
-from local_dir_rag.vector_store import load_vector_database
-from local_dir_rag.text_processor import format_documents, print_sources
+from local_dir_rag.answer_cache import (
+    DEFAULT_ANSWER_TTL_SECONDS,
+    DEFAULT_MAX_ANSWERS,
+    AnswerCache,
+)
+from local_dir_rag.embedding_models import create_embeddings
+from local_dir_rag.keyword_index import (
+    KEYWORD_INDEX_FILE,
+    KeywordIndex,
+    hybrid_search,
+)
+from local_dir_rag.shards import ShardedVectorStore
+from local_dir_rag.vector_store import (
+    close_vector_database,
+    get_index_version,
+    is_save_in_progress,
+    load_vector_database,
+)
+from local_dir_rag.text_processor import (
+    DEFAULT_CONTEXT_TOKENS,
+    format_documents,
+    pack_documents,
+    print_sources,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,22 +46,35 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def query_loop(vector_db_path=None, k: int = 30):
-    """
-    Run an interactive RAG-based chat session using a local vector database
-    and OpenAI's ChatGPT model.
+def create_rag_chain(
+    vector_db: FAISS | ShardedVectorStore,
+    chat_model: BaseChatModel,
+    k: int = 30,
+    keyword_index: KeywordIndex = None,
+    context_tokens: int = DEFAULT_CONTEXT_TOKENS
+) -> Runnable:
     """
+    Create a chain that answers a question from retrieved documents.
 
-    # Load the vector database
-    vector_db = load_vector_database(vector_db_path)
-    logger.info("Vector database loaded successfully from %s", vector_db_path)
+    With a keyword index, documents are retrieved by hybrid search, which
+    also finds chunks containing identifiers and rare terms of the
+    question that vector search ranks low. Retrieved chunks are packed
+    into passages, merging neighbouring chunks of the same page, within
+    a token budget.
 
-    # Set up the chat model
-    chat_model = ChatOpenAI(
-        model="gpt-5.4",
-        temperature=0.3
-    )
+    Args:
+        vector_db: Vector database to retrieve documents from.
+        chat_model: Chat model that writes the answer.
+        k: Number of documents to retrieve.
+        keyword_index: Keyword index of the vector database, if any.
+        context_tokens: Estimated token budget of the retrieved text; 0
+            for no limit.
 
+    Returns:
+        A runnable taking a dictionary with the ``question`` and, if it is
+        already known, the question's ``embedding``, and producing the
+        answer text.
+    """
     # Create the RAG prompt template
     prompt_template = ChatPromptTemplate.from_template("""
     You are a helpful assistant that provides accurate information based on
@@ -46,36 +89,312 @@ def query_loop(vector_db_path=None, k: int = 30):
     Answer:
     """)
 
-    # Create a retriever from the vector database
-    retriever = vector_db.as_retriever(search_kwargs={"k": k})
+    def retrieve(inputs: dict):
+        if keyword_index is not None:
+            return hybrid_search(
+                vector_db,
+                keyword_index,
+                inputs["question"],
+                k,
+                embedding=inputs.get("embedding")
+            )
+        # Reuse the question's embedding if the answer cache computed it
+        if inputs.get("embedding") is not None:
+            return vector_db.similarity_search_by_vector(
+                inputs["embedding"], k=k
+            )
+        return vector_db.similarity_search(inputs["question"], k=k)
 
     # Create the RAG chain
-    rag_chain = (
+    return (
         {
-            "context": retriever | print_sources | format_documents,
-            "question": RunnablePassthrough()
+            "context": (
+                RunnableLambda(retrieve)
+                | RunnableLambda(
+                    lambda documents: pack_documents(documents, context_tokens)
+                )
+                | print_sources
+                | format_documents
+            ),
+            "question": itemgetter("question")
         }
         | prompt_template
         | chat_model
         | StrOutputParser()
     )
 
-    # Interactive query loop
-    print("Local RAG Chat Session")
-    print("Type your questions below.")
-    print("Type 'exit' or 'quit' to end the session.")
 
-    while True:
+def stream_answer(
+    rag_chain: Runnable,
+    question: str,
+    output: TextIO = None,
+    query_embedding: list[float] = None
+) -> tuple[str, float | None]:
+    """
+    Stream the answer to a question, writing tokens as they arrive.
+
+    Args:
+        rag_chain: Chain created by ``create_rag_chain``.
+        question: Question to answer.
+        output: Stream to write the answer to (default: standard output).
+        query_embedding: Embedding of the question, if already computed.
+
+    Returns:
+        The answer, and the seconds from the question to the first token
+        of the answer, or None if the answer is empty.
+    """
+    output = output or sys.stdout
+    started = time.perf_counter()
+    time_to_first_token = None
+    tokens = []
+    for token in rag_chain.stream(
+        {"question": question, "embedding": query_embedding}
+    ):
+        if not token:
+            continue
+        if time_to_first_token is None:
+            time_to_first_token = time.perf_counter() - started
+        tokens.append(token)
+        output.write(token)
+        output.flush()
+    output.write("\n")
+
+    total_time = time.perf_counter() - started
+    if time_to_first_token is None:
+        logger.info("Empty answer after %.2f s", total_time)
+    else:
+        logger.info(
+            "Time to first token: %.2f s, total: %.2f s",
+            time_to_first_token,
+            total_time
+        )
+    return "".join(tokens), time_to_first_token
+
+
+def answer_question(
+    rag_chain: Runnable,
+    vector_db: FAISS | ShardedVectorStore,
+    question: str,
+    answer_cache: AnswerCache = None,
+    output: TextIO = None
+) -> str:
+    """
+    Answer a question from the answer cache, or stream a new answer.
+
+    Exact matches are looked up first. The question is embedded only for
+    the semantic tier, and the embedding is then reused for retrieval.
+
+    Args:
+        rag_chain: Chain created by ``create_rag_chain``.
+        vector_db: Vector database the chain retrieves from.
+        question: Question to answer.
+        answer_cache: Cache of answers, if any.
+        output: Stream to write the answer to (default: standard output).
+
+    Returns:
+        The answer.
+    """
+    output = output or sys.stdout
+    if answer_cache is None:
+        return stream_answer(rag_chain, question, output)[0]
+
+    query_embedding = None
+    answer = answer_cache.get(question)
+    if answer is None and answer_cache.semantic:
+        query_embedding = vector_db.embeddings.embed_query(question)
+        answer = answer_cache.get_similar(query_embedding)
+    if answer is not None:
+        output.write(answer + "\n")
+        return answer
+
+    answer, _ = stream_answer(rag_chain, question, output, query_embedding)
+    answer_cache.put(question, answer, query_embedding)
+    return answer
+
+
+def query_loop(
+    vector_db_path=None,
+    k: int = 30,
+    nprobe: int = None,
+    ef_search: int = None,
+    rerank_factor: int = None,
+    mmap: bool = True,
+    warm_up: bool = False,
+    hybrid: bool = True,
+    context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+    use_answer_cache: bool = True,
+    answer_cache_entries: int = DEFAULT_MAX_ANSWERS,
+    answer_cache_ttl: float = DEFAULT_ANSWER_TTL_SECONDS,
+    semantic_cache_threshold: float = None,
+    embeddings_model: Embeddings = None,
+    embeddings: str = None,
+    quantized: bool = False,
+    embedding_threads: int = None
+):
+    """
+    Run an interactive RAG-based chat session using a local vector database
+    and OpenAI's ChatGPT model.
+
+    Answers are streamed as they are generated, and the time to the first
+    token of each answer is logged. Answers are cached next to the vector
+    database, and repeated questions are answered from the cache until
+    the index changes, if asked with the same retrieval settings. When the
+    vector database is saved again, it is reloaded before the next
+    question, since the documents it no longer refers to are removed from
+    its docstore.
+
+    The chat model, embedding model and vector database are loaded in the
+    background while the first question is typed; errors loading them
+    are raised when it is asked.
+
+    Args:
+        vector_db_path: Path to the vector database to query.
+        k: Number of documents to retrieve.
+        nprobe: Number of IVF lists to search, overriding the index
+            configuration.
+        ef_search: Number of HNSW candidates to search, overriding the
+            index configuration.
+        rerank_factor: Number of candidates of a compressed index to
+            re-rank by exact distance, as a multiple of k, overriding the
+            index configuration.
+        mmap: Memory-map the index read-only instead of reading it.
+        warm_up: Read the index file into the page cache before the
+            first question.
+        hybrid: Fuse keyword search results with vector search results,
+            if the vector database has a keyword index.
+        context_tokens: Estimated token budget of the retrieved text; 0
+            for no limit.
+        use_answer_cache: Whether to cache answers.
+        answer_cache_entries: Maximum number of cached answers.
+        answer_cache_ttl: Seconds after which a cached answer expires.
+        semantic_cache_threshold: Minimum cosine similarity of question
+            embeddings to reuse the answer to a different question, or
+            None to reuse answers to the same question only.
+        embeddings_model: Embedding model of the vector database
+            (default: created from ``embeddings``, ``quantized`` and
+            ``embedding_threads``).
+        embeddings: Embedding model specification, as in
+            ``create_embeddings`` (default: the ``EMBEDDINGS``
+            environment variable, or OpenAI).
+        quantized: Run the int8 ONNX export of a local model.
+        embedding_threads: CPU threads of a local model.
+    """
+
+    def open_database():
+        # Load the vector database, and the answers cached for its version
+        index_version = get_index_version(vector_db_path)
+        vector_db = load_vector_database(
+            vector_db_path,
+            embeddings_model,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            rerank_factor=rerank_factor,
+            mmap=mmap,
+            warm_up=warm_up
+        )
+        logger.info(
+            "Vector database loaded successfully from %s", vector_db_path
+        )
+        answer_cache = None
+        if use_answer_cache:
+            answer_cache = AnswerCache(
+                vector_db_path,
+                max_entries=answer_cache_entries,
+                ttl_seconds=answer_cache_ttl,
+                similarity_threshold=semantic_cache_threshold,
+                # Answers depend on what is retrieved for the question
+                settings={
+                    "k": k,
+                    "context_tokens": context_tokens,
+                    "hybrid": hybrid,
+                    "nprobe": nprobe,
+                    "ef_search": ef_search,
+                    "rerank_factor": rerank_factor,
+                }
+            )
+        return index_version, vector_db, answer_cache
+
+    def open_session():
+        nonlocal embeddings_model
+
+        # Imported here, since the OpenAI client takes seconds to import
+        from langchain_openai import ChatOpenAI
+
+        # Set up the chat model
+        chat_model = ChatOpenAI(
+            model="gpt-5.4",
+            temperature=0.3
+        )
+
+        # Created once, so a local model is not loaded again on reloads
+        embeddings_model = embeddings_model or create_embeddings(
+            embeddings, quantized=quantized, threads=embedding_threads
+        )
+
+        # The keyword index is updated in place, so it is not reopened
+        keyword_index = None
+        if hybrid and os.path.exists(
+            os.path.join(vector_db_path, KEYWORD_INDEX_FILE)
+        ):
+            keyword_index = KeywordIndex(vector_db_path)
+
+        return (chat_model, keyword_index, *open_database())
+
+    # Load while the first question is typed
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        loading = executor.submit(open_session)
+
+        # Interactive query loop
+        print("Local RAG Chat Session")
+        print("Type your questions below.")
+        print("Type 'exit' or 'quit' to end the session.")
         prompt = input("\nPrompt: ")
 
+        (
+            chat_model, keyword_index, index_version, vector_db,
+            answer_cache
+        ) = loading.result()
+    rag_chain = create_rag_chain(
+        vector_db, chat_model, k, keyword_index, context_tokens
+    )
+
+    while True:
         # Check for exit command
         if prompt.lower() in ['exit', 'quit']:
             print("Exiting chat session.")
             break
 
-        # Generate answer
-        prompt = rag_chain.invoke(prompt)
-        print(f"\nResponse: {prompt}")
+        # Reload the database if it was saved since, unless a save is
+        # still in progress
+        if (
+            get_index_version(vector_db_path) != index_version
+            and not is_save_in_progress(vector_db_path)
+        ):
+            logger.info("Vector database changed, reloading")
+            close_vector_database(vector_db)
+            if answer_cache is not None:
+                answer_cache.close()
+            index_version, vector_db, answer_cache = open_database()
+            rag_chain = create_rag_chain(
+                vector_db, chat_model, k, keyword_index, context_tokens
+            )
+
+        # Stream the answer as it is generated
+        print("\nResponse: ", end="", flush=True)
+        answer_question(rag_chain, vector_db, prompt, answer_cache)
+
+        prompt = input("\nPrompt: ")
+
+    close_vector_database(vector_db)
+    if answer_cache is not None:
+        logger.info(
+            "Answer cache: %d hits, %d misses",
+            answer_cache.hits,
+            answer_cache.misses
+        )
+        answer_cache.close()
+    if keyword_index is not None:
+        keyword_index.close()
 
 
 if __name__ == "__main__":
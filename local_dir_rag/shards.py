@@ -0,0 +1,339 @@
+"""Partitioning of a vector database into shards searched together."""
+
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
+
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from local_dir_rag.defaults import SHARD_BY
+from local_dir_rag.docstore import SQLiteDocstore
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+SHARD_CONFIG_FILE = "shard_config.json"
+SHARDS_DIR = "shards"
+
+
+def _contains(directory: str, path: str) -> bool:
+    """Whether a path is in a directory, or is the directory."""
+    try:
+        return os.path.commonpath([directory, path]) == directory
+    except ValueError:
+        # Paths on different drives
+        return False
+
+
+@dataclass
+class ShardConfig:
+    """
+    Partitioning of a vector database into shards.
+
+    With ``none``, the vector database is a single index. With ``root``,
+    each documents directory has its own shard, and with
+    ``subdirectory``, each top-level subdirectory of a documents
+    directory has its own shard, and the files directly in the documents
+    directory share another. Each shard is a complete vector database in
+    ``shards/<name>``, saved only when its own files change.
+
+    ``partitions`` maps shard names to the directories they hold, so
+    files keep their shard when their documents directory is no longer
+    indexed.
+    """
+    shard_by: str = "none"
+    partitions: dict[str, str] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.shard_by not in SHARD_BY:
+            raise ValueError(f"Unknown shard partitioning: {self.shard_by}")
+
+    @property
+    def sharded(self) -> bool:
+        """Whether the vector database is split into shards."""
+        return self.shard_by != "none"
+
+    @classmethod
+    def load(cls, db_path: str) -> "ShardConfig | None":
+        """
+        Load the shard configuration saved with a vector database.
+
+        Args:
+            db_path: Path to the vector database directory.
+
+        Returns:
+            The configuration, or None if none was saved.
+        """
+        config_path = os.path.join(db_path, SHARD_CONFIG_FILE)
+        if not os.path.exists(config_path):
+            return None
+        with open(config_path, encoding="utf-8") as f:
+            values = json.load(f)
+        names = {config_field.name for config_field in fields(cls)}
+        return cls(**{
+            name: value for name, value in values.items() if name in names
+        })
+
+    def save(self, db_path: str) -> None:
+        """
+        Save the shard configuration with a vector database.
+
+        Args:
+            db_path: Path to the vector database directory.
+        """
+        os.makedirs(db_path, exist_ok=True)
+        config_path = os.path.join(db_path, SHARD_CONFIG_FILE)
+        tmp_path = f"{config_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=2)
+        os.replace(tmp_path, config_path)
+
+    def _partition_for(
+        self, file_path: str, docs_paths: list[str]
+    ) -> str | None:
+        """
+        Find the directory of the partition that holds a file.
+
+        Args:
+            file_path: Absolute path of the file.
+            docs_paths: Absolute paths of the documents directories.
+
+        Returns:
+            The partition directory, or None if the file is in no
+            documents directory or known partition.
+        """
+        roots = [root for root in docs_paths if _contains(root, file_path)]
+        if not roots:
+            # The documents directory is no longer indexed
+            known = [
+                directory for directory in self.partitions.values()
+                if _contains(directory, file_path)
+            ]
+            return max(known, key=len) if known else None
+        root = max(roots, key=len)
+        if self.shard_by == "root":
+            return root
+        parts = os.path.relpath(file_path, root).split(os.sep)
+        return root if len(parts) == 1 else os.path.join(root, parts[0])
+
+    def shard_for(self, file_path: str, docs_paths: list[str]) -> str | None:
+        """
+        Get the name of the shard that holds a file, registering new
+        partitions.
+
+        Args:
+            file_path: Path of the file.
+            docs_paths: Documents directories of the run.
+
+        Returns:
+            The shard name, "" if the database is not sharded, or None if
+            the file belongs to no partition.
+        """
+        if not self.sharded:
+            return ""
+        directory = self._partition_for(
+            os.path.abspath(file_path),
+            [os.path.abspath(path) for path in docs_paths]
+        )
+        if directory is None:
+            return None
+        for name, partition in self.partitions.items():
+            if partition == directory:
+                return name
+        name = _shard_name(directory)
+        self.partitions[name] = directory
+        logger.info("New shard %s for %s", name, directory)
+        return name
+
+
+def _shard_name(directory: str) -> str:
+    """
+    Name the shard of a directory.
+
+    Args:
+        directory: Absolute path of the partition directory.
+
+    Returns:
+        A directory name made of the base name and a hash of the path.
+    """
+    base_name = re.sub(
+        r"[^A-Za-z0-9_.-]+", "_", os.path.basename(directory)
+    ).strip("._") or "root"
+    digest = hashlib.sha1(directory.encode("utf-8")).hexdigest()[:8]
+    return f"{base_name}-{digest}"
+
+
+def shard_path(db_path: str, shard: str) -> str:
+    """
+    Get the directory of a shard.
+
+    Args:
+        db_path: Path to the vector database directory.
+        shard: Shard name, or "" for an unsharded database.
+
+    Returns:
+        The directory holding the shard's index and docstore.
+    """
+    if not shard:
+        return db_path
+    return os.path.join(db_path, SHARDS_DIR, shard)
+
+
+def list_shards(db_path: str) -> list[str]:
+    """
+    List the shards of a vector database that have a saved index.
+
+    Args:
+        db_path: Path to the vector database directory.
+
+    Returns:
+        Shard names, or [""] for an unsharded database.
+    """
+    config = ShardConfig.load(db_path) or ShardConfig()
+    if not config.sharded:
+        return [""]
+    return sorted(
+        name for name in config.partitions
+        if os.path.exists(
+            os.path.join(shard_path(db_path, name), "index.faiss")
+        )
+    )
+
+
+class ShardedVectorStore:
+    """
+    Shards of a vector database, searched as one.
+
+    A search embeds the query once, searches every shard for the top k
+    documents on a thread pool, and merges the results by score. FAISS
+    releases the GIL while it searches, so shards are searched in
+    parallel. Scores of different shards are comparable because they
+    share the embedding model and distance.
+    """
+
+    def __init__(self, shards: dict[str, FAISS], max_workers: int = None):
+        """
+        Initialize the sharded vector store.
+
+        Args:
+            shards: Vector databases by shard name.
+            max_workers: Maximum number of shards searched at once
+                (default: the number of shards, up to the CPU count).
+        """
+        if not shards:
+            raise ValueError("A sharded vector store needs a shard")
+        self.shards = shards
+        first = next(iter(shards.values()))
+        self.embeddings: Embeddings = first.embeddings
+        self.distance_strategy = first.distance_strategy
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(len(shards), os.cpu_count() or 1),
+            thread_name_prefix="shard-search"
+        )
+
+    def close(self) -> None:
+        """Stop the search threads and close the shard docstores."""
+        self._executor.shutdown(wait=False)
+        for shard in self.shards.values():
+            if isinstance(shard.docstore, SQLiteDocstore):
+                shard.docstore.close()
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, **kwargs
+    ) -> list[tuple[Document, float]]:
+        """
+        Search every shard and merge the top k documents.
+
+        Args:
+            embedding: Query embedding.
+            k: Number of documents to return.
+            **kwargs: Search arguments passed to each shard.
+
+        Returns:
+            Documents and scores, best first.
+        """
+        def search(vector_db: FAISS) -> list[tuple[Document, float]]:
+            return vector_db.similarity_search_with_score_by_vector(
+                embedding, k=k, **kwargs
+            )
+
+        results = self._executor.map(search, self.shards.values())
+        # Inner products are better when higher; distances when lower
+        sign = (
+            -1
+            if self.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+            else 1
+        )
+        return heapq.nsmallest(
+            k,
+            (result for shard_results in results for result in shard_results),
+            key=lambda result: sign * result[1]
+        )
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, **kwargs
+    ) -> list[Document]:
+        """
+        Search every shard for the documents closest to an embedding.
+
+        Args:
+            embedding: Query embedding.
+            k: Number of documents to return.
+            **kwargs: Search arguments passed to each shard.
+
+        Returns:
+            Documents, best first.
+        """
+        return [
+            doc for doc, _ in self.similarity_search_with_score_by_vector(
+                embedding, k=k, **kwargs
+            )
+        ]
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs
+    ) -> list[Document]:
+        """
+        Search every shard for the documents closest to a query.
+
+        Args:
+            query: Query text.
+            k: Number of documents to return.
+            **kwargs: Search arguments passed to each shard.
+
+        Returns:
+            Documents, best first.
+        """
+        return self.similarity_search_by_vector(
+            self.embeddings.embed_query(query), k=k, **kwargs
+        )
+
+    def get_by_ids(self, ids: list[str]) -> list[Document]:
+        """
+        Get documents by id from whichever shard holds them.
+
+        Args:
+            ids: Document ids.
+
+        Returns:
+            The documents found, in the order of the ids.
+        """
+        documents = []
+        for doc_id in ids:
+            for vector_db in self.shards.values():
+                doc = vector_db.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    documents.append(doc)
+                    break
+        return documents
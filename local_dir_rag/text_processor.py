@@ -2,11 +2,12 @@
 import json
 import logging
 import os
+from dataclasses import dataclass, field
+
 from langchain_core.documents import Document
-from langchain_text_splitters import (
-    RecursiveCharacterTextSplitter,
-    SentenceTransformersTokenTextSplitter,
-)
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from local_dir_rag.defaults import DEFAULT_CONTEXT_TOKENS
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,6 +15,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Chunks this many characters apart are contiguous: the splitter strips
+# the whitespace between them
+CONTIGUOUS_GAP_CHARS = 4
+
+# Chunks without start offsets are merged when the end of one repeats
+# the start of the other for at least this many characters
+MIN_TEXT_OVERLAP_CHARS = 20
+MAX_TEXT_OVERLAP_CHARS = 2000
+
+# A passage is cut to fit the remaining budget only if at least this
+# many tokens of it fit
+MIN_TRIMMED_TOKENS = 50
+
 
 def recursive_character_splitter(chunk_size, chunk_overlap):
     """
@@ -26,11 +40,14 @@ def recursive_character_splitter(chunk_size, chunk_overlap):
     Returns:
         RecursiveCharacterTextSplitter:
             A text splitter configured with the specified parameters.
+            Chunks record their character offset in the page in
+            ``start_index``.
     """
     return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", ". ", " ", ""]
+        separators=["\n\n", "\n", ". ", " ", ""],
+        add_start_index=True
     )
 
 
@@ -48,6 +65,11 @@ def sentence_splitter(chunk_size, chunk_overlap):
             A token-based text splitter configured with the specified
             parameters.
     """
+    # Imported here, since it loads sentence-transformers and PyTorch
+    from langchain_text_splitters import (
+        SentenceTransformersTokenTextSplitter,
+    )
+
     return SentenceTransformersTokenTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap
@@ -85,6 +107,192 @@ def split_documents(
     return chunks
 
 
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of model tokens in a text.
+
+    Uses the common approximation of four characters per token, which is
+    cheap enough to apply to every chunk.
+
+    Args:
+        text: Text to measure.
+
+    Returns:
+        Estimated number of tokens, at least 1.
+    """
+    return max(1, (len(text) + 3) // 4)
+
+
+@dataclass
+class _Passage:
+    """Contiguous text of one page, merged from one or more chunks."""
+    rank: int
+    text: str
+    metadata: dict
+    start: int | None = None
+    chunks: int = 1
+    end: int | None = field(default=None, init=False)
+
+    def __post_init__(self):
+        if self.start is not None:
+            self.end = self.start + len(self.text)
+
+    def absorb(self, other: "_Passage", text: str) -> None:
+        """Take over another passage of the same page, with merged text."""
+        self.text = text
+        self.rank = min(self.rank, other.rank)
+        self.chunks += other.chunks
+        if self.start is not None:
+            self.end = max(self.end, other.end)
+
+
+def _text_overlap(first: str, second: str) -> int:
+    """
+    Find how many characters at the end of a text start another.
+
+    Args:
+        first: Text that may end with the start of the second.
+        second: Text that may start with the end of the first.
+
+    Returns:
+        Length of the longest overlap, or 0 if it is shorter than
+        MIN_TEXT_OVERLAP_CHARS.
+    """
+    longest = min(len(first), len(second), MAX_TEXT_OVERLAP_CHARS)
+    for length in range(longest, MIN_TEXT_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+def _merge_by_offset(passages: list[_Passage]) -> list[_Passage]:
+    """
+    Merge the overlapping and contiguous chunks of a page by offset.
+
+    Args:
+        passages: Chunks of one page, with start offsets.
+
+    Returns:
+        Merged passages, in page order.
+    """
+    merged: list[_Passage] = []
+    for passage in sorted(passages, key=lambda passage: passage.start):
+        last = merged[-1] if merged else None
+        if last is None or passage.start > last.end + CONTIGUOUS_GAP_CHARS:
+            merged.append(passage)
+        elif passage.end <= last.end:
+            last.absorb(passage, last.text)
+        elif passage.start >= last.end:
+            last.absorb(passage, f"{last.text} {passage.text}")
+        else:
+            last.absorb(
+                passage, last.text + passage.text[last.end - passage.start:]
+            )
+    return merged
+
+
+def _merge_by_text(passages: list[_Passage]) -> list[_Passage]:
+    """
+    Merge chunks of a page that repeat or overlap each other's text.
+
+    Used for chunks indexed without start offsets.
+
+    Args:
+        passages: Chunks of one page.
+
+    Returns:
+        Merged passages.
+    """
+    merged = list(passages)
+    changed = True
+    while changed:
+        changed = False
+        for first in merged:
+            for second in merged:
+                if first is second:
+                    continue
+                if second.text in first.text:
+                    first.absorb(second, first.text)
+                else:
+                    overlap = _text_overlap(first.text, second.text)
+                    if overlap == 0:
+                        continue
+                    first.absorb(second, first.text + second.text[overlap:])
+                merged.remove(second)
+                changed = True
+                break
+            if changed:
+                break
+    return merged
+
+
+def pack_documents(
+    documents: list[Document],
+    max_tokens: int = DEFAULT_CONTEXT_TOKENS
+) -> list[Document]:
+    """
+    Assemble retrieved chunks into passages under a token budget.
+
+    Chunks of the same page that overlap, or follow each other, are
+    merged into one passage, so the text they share is sent once.
+    Passages are ordered by their best ranked chunk, and added until the
+    budget is spent; the first passage that does not fit is cut short if
+    enough of it fits.
+
+    Args:
+        documents: Retrieved chunks, best first.
+        max_tokens: Estimated token budget of the passages; 0 for no
+            limit.
+
+    Returns:
+        Passages as documents, best first, with the number of chunks
+        merged into each in ``chunks``.
+    """
+    pages: dict[tuple, list[_Passage]] = {}
+    for rank, doc in enumerate(documents):
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        start = doc.metadata.get("start_index")
+        pages.setdefault(key, []).append(_Passage(
+            rank, doc.page_content, dict(doc.metadata), start
+        ))
+
+    passages: list[_Passage] = []
+    for page_passages in pages.values():
+        with_offsets = [
+            passage for passage in page_passages if passage.start is not None
+        ]
+        without_offsets = [
+            passage for passage in page_passages if passage.start is None
+        ]
+        passages.extend(_merge_by_offset(with_offsets))
+        passages.extend(_merge_by_text(without_offsets))
+    passages.sort(key=lambda passage: passage.rank)
+
+    packed = []
+    remaining = max_tokens
+    for passage in passages:
+        tokens = estimate_tokens(passage.text)
+        if max_tokens > 0 and tokens > remaining:
+            if remaining < MIN_TRIMMED_TOKENS:
+                break
+            passage.text = passage.text[:remaining * 4]
+            tokens = remaining
+        remaining -= tokens
+        metadata = passage.metadata
+        if passage.start is not None:
+            metadata["start_index"] = passage.start
+        metadata["chunks"] = passage.chunks
+        packed.append(Document(page_content=passage.text, metadata=metadata))
+
+    logger.info(
+        "Packed %d chunks into %d passages of about %d tokens",
+        len(documents),
+        len(packed),
+        sum(estimate_tokens(doc.page_content) for doc in packed)
+    )
+    return packed
+
+
 def format_documents(documents: list[Document]) -> str:
     """
     Format the retrieved documents into a single context string.
@@ -2,9 +2,51 @@
 
 import os
 import logging
+import operator
+import pickle
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import (
+    DistanceStrategy,
+    maximal_marginal_relevance,
+)
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from local_dir_rag.docstore import DOCSTORE_FILE, SQLiteDocstore
+from local_dir_rag.embedding_models import (
+    check_embeddings,
+    create_embeddings,
+)
+from local_dir_rag.faiss_index import (
+    MAX_DELETED_FRACTION,
+    IndexConfig,
+    convert_index,
+    rebuild_without,
+    remove_ivf_vectors,
+    search_parameters,
+    set_search_parameters,
+    supports_ivf_removal,
+    supports_removal,
+)
+from local_dir_rag.shards import (
+    ShardConfig,
+    ShardedVectorStore,
+    list_shards,
+    shard_path,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,33 +54,501 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+INDEX_NAME = "index"
+TMP_INDEX_NAME = "index.tmp"
+# Marks the temporary files of a save as complete while they replace the
+# previous files; see save_vector_database
+SAVE_MARKER_NAME = f"{TMP_INDEX_NAME}.commit"
+WRITER_LOCK_FILE = "writer.lock"
 
-def remove_documents_by_source(vector_db: FAISS, source_path: str) -> int:
+# Loads wait this long for a save to finish replacing the index files
+SAVE_WAIT_SECONDS = 10.0
+SAVE_POLL_SECONDS = 0.05
+
+# Map flat codes, IVF lists and HNSW graphs instead of copying them
+MMAP_IO_FLAGS = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+WARM_UP_CHUNK_BYTES = 1 << 20
+
+
+class FAISSVectorStore(FAISS):
     """
-    Remove all documents from the vector store that match the given source.
+    FAISS vector store that deletes documents without rebuilding its
+    index.
+
+    ``FAISS.delete`` removes vectors and shifts the following positions
+    down, which only flat indexes do. IVF indexes move their last vectors
+    into the positions left free instead, see ``remove_ivf_vectors``.
+    HNSW and re-ranking indexes cannot remove vectors: the positions of
+    deleted documents are dropped from ``index_to_docstore_id`` and
+    skipped by searches, and the index is rebuilt without them once they
+    make up MAX_DELETED_FRACTION of it, see ``compact``. New vectors are
+    numbered from the end of the index.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._selector = None
+        self._selector_key = None
+
+    def deleted_positions(self) -> set[int]:
+        """
+        Get the positions of the vectors of deleted documents.
+
+        Returns:
+            Positions in the index that no document maps to.
+        """
+        return set(range(self.index.ntotal)).difference(
+            self.index_to_docstore_id
+        )
+
+    def _search_parameters(self) -> faiss.SearchParameters | None:
+        """Get parameters that skip deleted vectors, if there are any."""
+        if self.index.ntotal == len(self.index_to_docstore_id):
+            return None
+        key = (
+            id(self.index),
+            self.index.ntotal,
+            len(self.index_to_docstore_id)
+        )
+        if self._selector_key != key:
+            # Kept, since the search parameters only refer to it
+            self._selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(
+                np.fromiter(self.deleted_positions(), dtype=np.int64)
+            ))
+            self._selector_key = key
+        return search_parameters(self.index, self._selector)
+
+    def _search(
+        self, vector: np.ndarray, k: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Search the index, skipping the vectors of deleted documents."""
+        return self.index.search(vector, k, params=self._search_parameters())
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[tuple[str, list[float]]],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """
+        Add texts and their embeddings to the vector store.
+
+        Args:
+            text_embeddings: Pairs of a text and its embedding.
+            metadatas: Metadata of each text.
+            ids: Document ID of each text (default: random UUIDs).
+
+        Returns:
+            The document IDs.
+
+        Raises:
+            ValueError: If the IDs are not unique.
+        """
+        texts, embeddings = zip(*text_embeddings)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Duplicate ids found in the ids list.")
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        # Not len(index_to_docstore_id), which leaves out deleted vectors
+        start = self.index.ntotal
+        self.index.add(vectors)
+        self.docstore.add({
+            doc_id: Document(id=doc_id, page_content=text, metadata=metadata)
+            for doc_id, text, metadata in zip(ids, texts, metadatas)
+        })
+        self.index_to_docstore_id.update({
+            start + offset: doc_id for offset, doc_id in enumerate(ids)
+        })
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """
+        Embed texts and add them to the vector store.
+
+        Args:
+            texts: Texts to add.
+            metadatas: Metadata of each text.
+            ids: Document ID of each text (default: random UUIDs).
+
+        Returns:
+            The document IDs.
+        """
+        texts = list(texts)
+        return self.add_embeddings(
+            zip(texts, self._embed_documents(texts)), metadatas, ids
+        )
+
+    async def aadd_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """
+        Embed texts asynchronously and add them to the vector store.
+
+        Args:
+            texts: Texts to add.
+            metadatas: Metadata of each text.
+            ids: Document ID of each text (default: random UUIDs).
+
+        Returns:
+            The document IDs.
+        """
+        texts = list(texts)
+        embeddings = await self._aembed_documents(texts)
+        return self.add_embeddings(zip(texts, embeddings), metadatas, ids)
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool:
+        """
+        Delete documents and their vectors.
+
+        Args:
+            ids: The document IDs to delete.
+
+        Returns:
+            True.
+
+        Raises:
+            ValueError: If no IDs are given, or some are not in the store.
+        """
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        # Positions of earlier deleted vectors are not contiguous
+        contiguous = self.index.ntotal == len(self.index_to_docstore_id)
+        if supports_removal(self.index) and contiguous:
+            return super().delete(ids, **kwargs)
+        ids_to_delete = set(ids)
+        missing_ids = ids_to_delete.difference(
+            self.index_to_docstore_id.values()
+        )
+        if missing_ids:
+            raise ValueError(
+                "Some specified ids do not exist in the current store. "
+                f"Ids not found: {missing_ids}"
+            )
+        positions = {
+            position
+            for position, doc_id in self.index_to_docstore_id.items()
+            if doc_id in ids_to_delete
+        }
+        index_to_docstore_id = {
+            position: doc_id
+            for position, doc_id in self.index_to_docstore_id.items()
+            if position not in positions
+        }
+        if supports_ivf_removal(self.index) and contiguous:
+            moved = remove_ivf_vectors(self.index, positions)
+            for old_position, position in moved.items():
+                index_to_docstore_id[position] = index_to_docstore_id.pop(
+                    old_position
+                )
+        self.index_to_docstore_id = index_to_docstore_id
+        self.docstore.delete(list(ids_to_delete))
+        if (
+            self.index.ntotal - len(index_to_docstore_id)
+            >= MAX_DELETED_FRACTION * self.index.ntotal
+        ):
+            self.compact()
+        return True
+
+    def compact(self) -> int:
+        """
+        Rebuild the index without the vectors of deleted documents.
+
+        Returns:
+            Number of vectors removed.
+        """
+        positions = self.deleted_positions()
+        if not positions:
+            return 0
+        self.index, kept = rebuild_without(self.index, positions)
+        self._renumber(kept)
+        logger.info(
+            "Rebuilt the index without %d deleted vectors", len(positions)
+        )
+        return len(positions)
+
+    def convert_index(
+        self, config: IndexConfig, rebuild: bool = False
+    ) -> bool:
+        """
+        Convert the index to the configured type and storage, if it
+        differs, leaving out the vectors of deleted documents; see
+        ``faiss_index.convert_index``.
+
+        Args:
+            config: Index configuration.
+            rebuild: Rebuild the index even if it is of the configured
+                type.
+
+        Returns:
+            Whether the index was replaced.
+        """
+        positions = self.deleted_positions()
+        index = convert_index(self.index, config, rebuild, positions)
+        if index is None:
+            return False
+        if positions:
+            self._renumber([
+                position for position in range(self.index.ntotal)
+                if position not in positions
+            ])
+        self.index = index
+        return True
+
+    def _renumber(self, kept: list[int]) -> None:
+        """Map the positions of a rebuilt index, by their old positions."""
+        self.index_to_docstore_id = {
+            position: self.index_to_docstore_id[old_position]
+            for position, old_position in enumerate(kept)
+        }
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: Callable | dict[str, Any] | None = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """
+        Find the documents most similar to an embedding.
+
+        Args:
+            embedding: Embedding to search for.
+            k: Number of documents to return.
+            filter: Metadata filter, a dictionary of values or a function
+                of the metadata.
+            fetch_k: Number of documents searched before filtering.
+            **kwargs: ``score_threshold`` drops less similar documents.
+
+        Returns:
+            Documents and their distances, most similar first.
+        """
+        vector = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vector)
+        scores, indices = self._search(
+            vector, k if filter is None else fetch_k
+        )
+        filter_func = None
+        if filter is not None:
+            filter_func = self._create_filter_func(filter)
+        docs = []
+        for score, position in zip(scores[0], indices[0]):
+            if position == -1:
+                # Fewer vectors than requested
+                continue
+            doc = self._document_at(position)
+            if filter_func is None or filter_func(doc.metadata):
+                docs.append((doc, score))
+
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            compare = (
+                operator.ge
+                if self.distance_strategy in (
+                    DistanceStrategy.MAX_INNER_PRODUCT,
+                    DistanceStrategy.JACCARD
+                )
+                else operator.le
+            )
+            docs = [
+                (doc, score) for doc, score in docs
+                if compare(score, score_threshold)
+            ]
+        return docs[:k]
+
+    def max_marginal_relevance_search_with_score_by_vector(
+        self,
+        embedding: list[float],
+        *,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Callable | dict[str, Any] | None = None,
+    ) -> list[tuple[Document, float]]:
+        """
+        Find similar and diverse documents by maximal marginal relevance.
+
+        Args:
+            embedding: Embedding to search for.
+            k: Number of documents to return.
+            fetch_k: Number of documents to choose from.
+            lambda_mult: Between 0 for the most diverse documents and 1
+                for the most similar.
+            filter: Metadata filter, a dictionary of values or a function
+                of the metadata.
+
+        Returns:
+            Documents and their distances.
+        """
+        scores, indices = self._search(
+            np.array([embedding], dtype=np.float32),
+            fetch_k if filter is None else fetch_k * 2
+        )
+        candidates = [
+            (score, position)
+            for score, position in zip(scores[0], indices[0])
+            if position != -1
+        ]
+        if filter is not None:
+            filter_func = self._create_filter_func(filter)
+            candidates = [
+                (score, position) for score, position in candidates
+                if filter_func(self._document_at(position).metadata)
+            ]
+        if not candidates:
+            return []
+        selected = maximal_marginal_relevance(
+            np.array([embedding], dtype=np.float32),
+            [
+                self.index.reconstruct(int(position))
+                for _, position in candidates
+            ],
+            k=k,
+            lambda_mult=lambda_mult
+        )
+        return [
+            (self._document_at(candidates[i][1]), candidates[i][0])
+            for i in selected
+        ]
+
+    def _document_at(self, position: int) -> Document:
+        """Get the document of the vector at a position."""
+        doc_id = self.index_to_docstore_id[position]
+        doc = self.docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            raise ValueError(
+                f"Could not find document for id {doc_id}, got {doc}"
+            )
+        return doc
+
+
+def find_document_ids_by_source(
+    vector_db: FAISS, source_paths: Iterable[str]
+) -> dict[str, list[str]]:
+    """
+    Find the documents of several sources in one pass over the docstore.
+
+    This scans every document, so it is only used for sources whose chunk
+    ids were not recorded in the file tracker.
 
     Args:
         vector_db: The FAISS vector database.
-        source_path: The source file path to match in document metadata.
+        source_paths: The source file paths to match in document metadata.
 
     Returns:
-        Number of documents removed.
+        Dictionary of document IDs by source path, for sources with at
+        least one document.
     """
-    if vector_db is None:
-        return 0
+    source_paths = set(source_paths)
+    ids_by_source: dict[str, list[str]] = {}
+    if vector_db is None or not source_paths:
+        return ids_by_source
 
-    # Get all document IDs that match the source
-    ids_to_remove = []
     docstore = vector_db.docstore
-
     # FAISS uses index_to_docstore_id to map internal indices to doc IDs
     for doc_id in vector_db.index_to_docstore_id.values():
         doc = docstore.search(doc_id)
-        if doc and doc.metadata.get("source") == source_path:
-            ids_to_remove.append(doc_id)
+        if isinstance(doc, Document):
+            source = doc.metadata.get("source")
+            if source in source_paths:
+                ids_by_source.setdefault(source, []).append(doc_id)
+    return ids_by_source
+
+
+def _delete_documents(vector_db: FAISS, doc_ids: list[str]) -> None:
+    """
+    Delete documents that are in the vector store from the index and
+    docstore.
 
+    ``FAISS.delete`` relies on removal shifting the following vectors
+    down, which only holds for flat indexes; a ``FAISSVectorStore``
+    removes vectors from other indexes too, and other stores rebuild them
+    without the deleted vectors, keeping their training.
+
+    Args:
+        vector_db: The FAISS vector database.
+        doc_ids: The document IDs to delete.
+    """
+    if isinstance(vector_db, FAISSVectorStore) or supports_removal(
+        vector_db.index
+    ):
+        vector_db.delete(doc_ids)
+        return
+
+    ids_to_delete = set(doc_ids)
+    positions = {
+        position
+        for position, doc_id in vector_db.index_to_docstore_id.items()
+        if doc_id in ids_to_delete
+    }
+    vector_db.index, kept = rebuild_without(vector_db.index, positions)
+    vector_db.docstore.delete(doc_ids)
+    vector_db.index_to_docstore_id = {
+        position: vector_db.index_to_docstore_id[old_position]
+        for position, old_position in enumerate(kept)
+    }
+
+
+def remove_documents_by_ids(vector_db: FAISS, doc_ids: list[str]) -> int:
+    """
+    Remove documents from the vector store in a single delete.
+
+    IDs that are not in the index are ignored, since a file's recorded
+    chunk ids may include chunks of an interrupted run that were never
+    saved, and a docstore may still hold their documents.
+
+    Args:
+        vector_db: The FAISS vector database.
+        doc_ids: The document IDs to remove.
+
+    Returns:
+        Number of documents removed.
+    """
+    if vector_db is None:
+        return 0
+
+    indexed_ids = set(vector_db.index_to_docstore_id.values())
+    ids_to_remove = [
+        doc_id for doc_id in dict.fromkeys(doc_ids)
+        if doc_id in indexed_ids
+    ]
+    if ids_to_remove:
+        _delete_documents(vector_db, ids_to_remove)
+        logger.info("Removed %d chunks", len(ids_to_remove))
+    return len(ids_to_remove)
+
+
+def remove_documents_by_source(vector_db: FAISS, source_path: str) -> int:
+    """
+    Remove all documents from the vector store that match the given source.
+
+    Args:
+        vector_db: The FAISS vector database.
+        source_path: The source file path to match in document metadata.
+
+    Returns:
+        Number of documents removed.
+    """
+    ids_to_remove = find_document_ids_by_source(
+        vector_db, [source_path]
+    ).get(source_path, [])
     if ids_to_remove:
-        vector_db.delete(ids_to_remove)
+        _delete_documents(vector_db, ids_to_remove)
         logger.info(
             "Removed %d chunks for source %s",
             len(ids_to_remove),
@@ -48,22 +558,610 @@ def remove_documents_by_source(vector_db: FAISS, source_path: str) -> int:
     return len(ids_to_remove)
 
 
+def _update_sources(
+    vector_db: FAISS,
+    sources: dict[str, list[str]],
+    update: Callable[[list[str], list[str]], list[str]]
+) -> int:
+    """
+    Update the sources of documents; see add_document_sources.
+
+    Args:
+        vector_db: The FAISS vector database.
+        sources: File paths by document ID.
+        update: Function of the current sources and the file paths of a
+            document that returns its new sources.
+
+    Returns:
+        Number of documents changed.
+    """
+    updated = {}
+    for doc_id, file_paths in sources.items():
+        doc = vector_db.docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            continue
+        metadata = doc.metadata
+        # Documents stored before sources were recorded cite one file
+        current = metadata.get("sources") or (
+            [metadata["source"]] if "source" in metadata else []
+        )
+        new_sources = update(current, file_paths)
+        if not new_sources or new_sources == metadata.get("sources"):
+            continue
+        metadata["sources"] = new_sources
+        if metadata.get("source") not in new_sources:
+            metadata["source"] = new_sources[0]
+            # They located the text in the old source
+            metadata.pop("page", None)
+            metadata.pop("start_index", None)
+        updated[doc_id] = doc
+    if updated:
+        if not isinstance(vector_db.docstore, SQLiteDocstore):
+            # Other docstores refuse ids that they hold
+            vector_db.docstore.delete(list(updated))
+        vector_db.docstore.add(updated)
+    return len(updated)
+
+
+def add_document_sources(
+    vector_db: FAISS, sources: dict[str, list[str]]
+) -> int:
+    """
+    Record more files that documents are found in.
+
+    A chunk whose text several files share is stored once, and lists the
+    files in its ``sources`` metadata; its ``source`` is one of them.
+
+    Args:
+        vector_db: The FAISS vector database.
+        sources: Paths of the files to add, by document ID.
+
+    Returns:
+        Number of documents changed.
+    """
+    return _update_sources(
+        vector_db,
+        sources,
+        lambda current, file_paths: current + [
+            file_path for file_path in dict.fromkeys(file_paths)
+            if file_path not in current
+        ]
+    )
+
+
+def set_document_sources(
+    vector_db: FAISS, sources: dict[str, list[str]]
+) -> int:
+    """
+    Replace the files that documents are found in.
+
+    A document whose ``source`` is no longer among its sources cites the
+    first of them instead, without the ``page`` and ``start_index`` that
+    located it in the old file. Documents are never left without
+    sources.
+
+    Args:
+        vector_db: The FAISS vector database.
+        sources: Paths of the files that reference each document, by
+            document ID.
+
+    Returns:
+        Number of documents changed.
+    """
+    return _update_sources(
+        vector_db,
+        sources,
+        lambda current, file_paths: list(dict.fromkeys(file_paths))
+    )
+
+
+def _fsync_path(path: str) -> None:
+    """
+    Flush a file or directory to stable storage.
+
+    Args:
+        path: Path to the file or directory.
+    """
+    flags = os.O_RDONLY
+    if os.path.isdir(path):
+        flags |= getattr(os, "O_DIRECTORY", 0)
+    try:
+        fd = os.open(path, flags)
+    except OSError:
+        # Directories cannot be opened on some platforms
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def lock_vector_database(db_path: str) -> Iterator[None]:
+    """
+    Hold the writer lock of a vector database.
+
+    Only one process at a time writes a vector database, and only the
+    writer recovers interrupted saves; loads never change the files. The
+    lock is an exclusive ``flock`` of ``writer.lock``, released when the
+    block exits or the process dies. Platforms without ``fcntl`` are not
+    locked.
+
+    Args:
+        db_path: Path to the vector database directory.
+
+    Raises:
+        RuntimeError: If another process is writing the vector database.
+    """
+    os.makedirs(db_path, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(db_path, WRITER_LOCK_FILE), "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(
+                f"Vector database at {db_path} is being written by another "
+                "process"
+            ) from None
+        yield
+
+
+def _recover_interrupted_save(db_path: str) -> None:
+    """
+    Finish or discard a save that was interrupted.
+
+    A save writes ``index.tmp.faiss`` and ``index.tmp.pkl``, flushes them,
+    then writes the marker ``index.tmp.commit`` before renaming the
+    pickle and then the index into place, and removes the marker last.
+    With the marker, both temporary files are complete, so the renames
+    left are completed; without it, the temporary files may be partial
+    and are discarded.
+
+    Args:
+        db_path: Path to the vector database or shard directory.
+    """
+    marker = os.path.join(db_path, SAVE_MARKER_NAME)
+    if os.path.exists(marker):
+        logger.warning("Completing interrupted save in %s", db_path)
+        for extension in ("pkl", "faiss"):
+            tmp_file = os.path.join(db_path, f"{TMP_INDEX_NAME}.{extension}")
+            if os.path.exists(tmp_file):
+                os.replace(
+                    tmp_file,
+                    os.path.join(db_path, f"{INDEX_NAME}.{extension}")
+                )
+        _fsync_path(db_path)
+        os.remove(marker)
+        return
+    for extension in ("pkl", "faiss"):
+        tmp_file = os.path.join(db_path, f"{TMP_INDEX_NAME}.{extension}")
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def recover_interrupted_saves(db_path: str) -> None:
+    """
+    Finish or discard the interrupted saves of a vector database and its
+    shards.
+
+    Only call this while holding the writer lock, see
+    ``lock_vector_database``: a save in progress looks interrupted.
+
+    Args:
+        db_path: Path to the vector database directory.
+    """
+    shard_config = ShardConfig.load(db_path) or ShardConfig()
+    shards = shard_config.partitions if shard_config.sharded else [""]
+    for shard in shards:
+        if os.path.isdir(shard_path(db_path, shard)):
+            _recover_interrupted_save(shard_path(db_path, shard))
+
+
+def create_vector_database(
+    db_path: str, embeddings_model: Embeddings, dimensions: int
+) -> FAISSVectorStore:
+    """
+    Create an empty vector database with an SQLite docstore.
+
+    Args:
+        db_path: Path to the vector database directory.
+        embeddings_model: Embedding model of the vector database.
+        dimensions: Number of dimensions of the embedding vectors.
+
+    Returns:
+        The vector database.
+    """
+    return FAISSVectorStore(
+        embeddings_model,
+        faiss.IndexFlatL2(dimensions),
+        SQLiteDocstore(db_path),
+        {}
+    )
+
+
+def save_vector_database(vector_db: FAISS, db_path: str) -> None:
+    """
+    Save a FAISS vector database durably.
+
+    The index and docstore are written to temporary files and flushed to
+    disk, and a marker records that both are complete before they replace
+    the previous files. An interrupted save thus leaves either the
+    previous database, or the new one once the next writer completes the
+    renames. Documents deleted from an SQLite docstore are removed after
+    the save.
+
+    Args:
+        vector_db: The FAISS vector database.
+        db_path: Path to the vector database directory.
+    """
+    docstore = vector_db.docstore
+    if isinstance(docstore, SQLiteDocstore):
+        if docstore.db_path != os.path.join(db_path, DOCSTORE_FILE):
+            raise ValueError(
+                f"Cannot save a docstore in {docstore.db_path} to {db_path}"
+            )
+    os.makedirs(db_path, exist_ok=True)
+    vector_db.save_local(db_path, index_name=TMP_INDEX_NAME)
+    for extension in ("pkl", "faiss"):
+        _fsync_path(os.path.join(db_path, f"{TMP_INDEX_NAME}.{extension}"))
+    # See _recover_interrupted_save
+    marker = os.path.join(db_path, SAVE_MARKER_NAME)
+    with open(marker, "wb"):
+        pass
+    _fsync_path(marker)
+    _fsync_path(db_path)
+    for extension in ("pkl", "faiss"):
+        os.replace(
+            os.path.join(db_path, f"{TMP_INDEX_NAME}.{extension}"),
+            os.path.join(db_path, f"{INDEX_NAME}.{extension}")
+        )
+    _fsync_path(db_path)
+    os.remove(marker)
+    if isinstance(docstore, SQLiteDocstore):
+        docstore.purge_deleted()
+    logger.info("Vector database saved to %s", db_path)
+
+
+def _index_files_version(db_path: str) -> str:
+    """
+    Identify the saved version of the index files in a directory.
+
+    Args:
+        db_path: Path to the vector database or shard directory.
+
+    Returns:
+        The inode, size and modification time of the index files.
+    """
+    parts = []
+    for extension in ("faiss", "pkl"):
+        try:
+            file_stat = os.stat(
+                os.path.join(db_path, f"{INDEX_NAME}.{extension}")
+            )
+        except FileNotFoundError:
+            parts.append("-")
+            continue
+        parts.append(
+            f"{file_stat.st_ino}:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+        )
+    return "/".join(parts)
+
+
+def get_index_version(db_path: str) -> str:
+    """
+    Identify the saved version of a vector database.
+
+    Every save replaces the index files, so their inode, size and
+    modification time identify the version on disk; the version of a
+    sharded database combines the versions of its shards.
+
+    Args:
+        db_path: Path to the vector database directory.
+
+    Returns:
+        A string that changes whenever the database is saved.
+    """
+    return ";".join(
+        f"{shard}={_index_files_version(shard_path(db_path, shard))}"
+        if shard else _index_files_version(db_path)
+        for shard in list_shards(db_path)
+    )
+
+
+def is_save_in_progress(db_path: str) -> bool:
+    """
+    Check whether the vector database, or one of its shards, is being
+    saved.
+
+    Args:
+        db_path: Path to the vector database directory.
+
+    Returns:
+        Whether a save is replacing index files, or was interrupted while
+        it did.
+    """
+    return any(
+        os.path.exists(os.path.join(
+            shard_path(db_path, shard), SAVE_MARKER_NAME
+        ))
+        for shard in list_shards(db_path)
+    )
+
+
+def warm_up_index(index_path: str) -> int:
+    """
+    Read an index file into the page cache.
+
+    A memory-mapped index is then searched without waiting for the disk,
+    and processes mapping the same file share the cached pages.
+
+    Args:
+        index_path: Path to the index file.
+
+    Returns:
+        Number of bytes read.
+    """
+    started = time.perf_counter()
+    bytes_read = 0
+    buffer = bytearray(WARM_UP_CHUNK_BYTES)
+    with open(index_path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        while chunk_bytes := f.readinto(buffer):
+            bytes_read += chunk_bytes
+    logger.info(
+        "Warmed up %d bytes of %s in %.2f s",
+        bytes_read,
+        index_path,
+        time.perf_counter() - started
+    )
+    return bytes_read
+
+
+def _saved_files(db_path: str) -> tuple[str, str]:
+    """
+    Get the paths of the saved index and pickle of a vector database.
+
+    While a save's marker exists, its temporary files are the saved
+    version, until they are renamed into place.
+
+    Args:
+        db_path: Path to the vector database directory.
+
+    Returns:
+        Paths of the index file and the pickle file.
+    """
+    committing = os.path.exists(os.path.join(db_path, SAVE_MARKER_NAME))
+    paths = []
+    for extension in ("faiss", "pkl"):
+        tmp_path = os.path.join(db_path, f"{TMP_INDEX_NAME}.{extension}")
+        if committing and os.path.exists(tmp_path):
+            paths.append(tmp_path)
+        else:
+            paths.append(os.path.join(db_path, f"{INDEX_NAME}.{extension}"))
+    return paths[0], paths[1]
+
+
+def _load_local(
+    db_path: str, embeddings_model: Embeddings, mmap: bool
+) -> FAISSVectorStore:
+    """
+    Load a vector database, attaching an SQLite docstore to its file.
+
+    Args:
+        db_path: Path to the vector database directory.
+        embeddings_model: Embedding model of the vector database.
+        mmap: Memory-map the index read-only.
+
+    Returns:
+        The vector database.
+    """
+    index_path, pickle_path = _saved_files(db_path)
+    if not mmap:
+        index = faiss.read_index(index_path)
+    else:
+        try:
+            index = faiss.read_index(index_path, MMAP_IO_FLAGS)
+        except RuntimeError as error:
+            logger.warning(
+                "Cannot memory-map the index in %s, reading it instead: %s",
+                db_path,
+                error
+            )
+            index = faiss.read_index(index_path)
+    with open(pickle_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    vector_db = FAISSVectorStore(
+        embeddings_model, index, docstore, index_to_docstore_id
+    )
+    if isinstance(vector_db.docstore, SQLiteDocstore):
+        vector_db.docstore.attach(db_path)
+    return vector_db
+
+
+def _load_saved(
+    db_path: str, embeddings_model: Embeddings, mmap: bool
+) -> FAISS:
+    """
+    Load the saved version of a vector database without changing its
+    files.
+
+    A save renames its pickle and index into place one after the other,
+    so a load that overlaps the renames could pair files of different
+    versions. The load waits while a save's marker exists, and is
+    retried if the index files changed while they were read. A marker
+    left by an interrupted save stays until the next writer recovers it;
+    past the wait, the files it marks are read in place.
+
+    Args:
+        db_path: Path to the vector database directory.
+        embeddings_model: Embedding model of the vector database.
+        mmap: Memory-map the index read-only.
+
+    Returns:
+        The vector database.
+    """
+    marker = os.path.join(db_path, SAVE_MARKER_NAME)
+    deadline = time.monotonic() + SAVE_WAIT_SECONDS
+    while True:
+        waiting = time.monotonic() < deadline
+        version = _index_files_version(db_path)
+        if waiting and os.path.exists(marker):
+            time.sleep(SAVE_POLL_SECONDS)
+            continue
+        try:
+            vector_db = _load_local(db_path, embeddings_model, mmap)
+        except FileNotFoundError:
+            # Renamed into place while it was read
+            if not waiting:
+                raise
+            time.sleep(SAVE_POLL_SECONDS)
+            continue
+        if not waiting or (
+            not os.path.exists(marker)
+            and _index_files_version(db_path) == version
+        ):
+            return vector_db
+        if isinstance(vector_db.docstore, SQLiteDocstore):
+            vector_db.docstore.close()
+
+
+def migrate_docstore(db_path: str, compress: bool = True) -> int:
+    """
+    Move the documents of a pickled docstore into an SQLite docstore.
+
+    The documents are committed to ``docstore.db`` before ``index.pkl`` is
+    replaced by one that refers to it, so an interrupted migration can
+    be run again. The index itself is not changed.
+
+    Args:
+        db_path: Path to the vector database directory.
+        compress: Whether to compress document texts.
+
+    Returns:
+        Number of documents migrated, 0 if the docstore was already
+        stored in SQLite.
+
+    Raises:
+        RuntimeError: If another process is writing the vector database.
+    """
+    with lock_vector_database(db_path):
+        _recover_interrupted_save(db_path)
+        return _migrate_docstore(db_path, compress)
+
+
+def _migrate_docstore(db_path: str, compress: bool) -> int:
+    """Migrate a docstore under the writer lock; see migrate_docstore."""
+    pickle_path = os.path.join(db_path, f"{INDEX_NAME}.pkl")
+    with open(pickle_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    if isinstance(docstore, SQLiteDocstore):
+        logger.info("Docstore of %s is already stored in SQLite", db_path)
+        return 0
+
+    sqlite_docstore = SQLiteDocstore(db_path, compress=compress)
+    doc_ids = list(index_to_docstore_id.values())
+    for start in range(0, len(doc_ids), 1000):
+        documents = {
+            doc_id: docstore.search(doc_id)
+            for doc_id in doc_ids[start:start + 1000]
+        }
+        sqlite_docstore.add({
+            doc_id: doc for doc_id, doc in documents.items()
+            if isinstance(doc, Document)
+        })
+
+    tmp_pickle_path = os.path.join(db_path, f"{TMP_INDEX_NAME}.pkl")
+    with open(tmp_pickle_path, "wb") as f:
+        pickle.dump((sqlite_docstore, index_to_docstore_id), f)
+    _fsync_path(tmp_pickle_path)
+    os.replace(tmp_pickle_path, pickle_path)
+    _fsync_path(db_path)
+    sqlite_docstore.close()
+    logger.info(
+        "Migrated %d documents to %s", len(doc_ids), sqlite_docstore.db_path
+    )
+    return len(doc_ids)
+
+
 def load_vector_database(
     db_path,
-    embeddings_model: Embeddings = None
-) -> FAISS:
+    embeddings_model: Embeddings = None,
+    nprobe: int = None,
+    ef_search: int = None,
+    rerank_factor: int = None,
+    mmap: bool = False,
+    warm_up: bool = False
+) -> FAISS | ShardedVectorStore:
     """
     Load a FAISS vector database from the specified path.
 
+    A sharded database is loaded as a ``ShardedVectorStore``, with its
+    shards loaded concurrently.
+
+    Documents of an SQLite docstore are read when searches return them;
+    a pickled docstore is read whole, see ``migrate_docstore``.
+
+    Approximate indexes are searched with the parameters saved in their
+    index configuration, unless overridden.
+
+    With mmap, the index is mapped read-only instead of read into memory,
+    so loading takes no time and query processes on the same host share
+    one copy of the index in the page cache. A mapped database must only
+    be searched: FAISS aborts the process when vectors are added to it.
+    Saves replace the index file rather than writing to it, so a mapped
+    index stays valid, at its old version, while the database is updated.
+    Loads never change the files; a load that overlaps a save waits for
+    it, see ``_load_saved``.
+
     Args:
         db_path (str): Path to the vector database
-        embeddings: Embedding model to use (default: OpenAIEmbeddings)
+        embeddings: Embedding model to use (default: the model selected
+            by the ``EMBEDDINGS`` environment variable, or OpenAI); a
+            model other than the one recorded with the database is
+            refused with a ValueError
+        nprobe: Number of IVF lists to search.
+        ef_search: Number of HNSW candidates to search.
+        rerank_factor: Number of candidates of compressed indexes to
+            re-rank by exact distance, as a multiple of k.
+        mmap: Memory-map the index read-only.
+        warm_up: Read the index file into the page cache before loading,
+            so that the first queries do not wait for the disk.
 
     Returns:
         FAISS: The loaded vector database or None if not found
     """
     if embeddings_model is None:
-        embeddings_model = OpenAIEmbeddings()
+        embeddings_model = create_embeddings()
+    check_embeddings(db_path, embeddings_model)
+
+    shard_config = ShardConfig.load(db_path)
+    if shard_config is not None and shard_config.sharded:
+        shards = list_shards(db_path)
+        if not shards:
+            logger.info("No existing vector database found at %s", db_path)
+            return None
+        with ThreadPoolExecutor(
+            max_workers=min(len(shards), os.cpu_count() or 1)
+        ) as pool:
+            vector_dbs = list(pool.map(
+                lambda shard: load_vector_database(
+                    shard_path(db_path, shard),
+                    embeddings_model,
+                    nprobe=nprobe,
+                    ef_search=ef_search,
+                    rerank_factor=rerank_factor,
+                    mmap=mmap,
+                    warm_up=warm_up
+                ),
+                shards
+            ))
+        if any(vector_db is None for vector_db in vector_dbs):
+            return None
+        logger.info("Loaded %d shards from %s", len(shards), db_path)
+        return ShardedVectorStore(dict(zip(shards, vector_dbs)))
 
     # Check if the FAISS index file exists (not just the directory)
     index_file = os.path.join(db_path, "index.faiss")
@@ -71,11 +1169,17 @@ def load_vector_database(
         logger.info("No existing vector database found at %s", db_path)
         return None
 
+    if warm_up:
+        warm_up_index(index_file)
+
     try:
-        vector_db = FAISS.load_local(
-            db_path,
-            embeddings_model,
-            allow_dangerous_deserialization=True
+        vector_db = _load_saved(db_path, embeddings_model, mmap)
+        config = IndexConfig.load(db_path) or IndexConfig()
+        set_search_parameters(
+            vector_db.index,
+            config.nprobe if nprobe is None else nprobe,
+            config.ef_search if ef_search is None else ef_search,
+            config.rerank_factor if rerank_factor is None else rerank_factor
         )
         logger.info("Vector database successfully loaded from %s", db_path)
         return vector_db
@@ -86,3 +1190,18 @@ def load_vector_database(
             error,
         )
         return None
+
+
+def close_vector_database(vector_db: FAISS | ShardedVectorStore) -> None:
+    """
+    Close the docstore connections and search threads of a vector database.
+
+    Args:
+        vector_db: Vector database to close, or None.
+    """
+    if isinstance(vector_db, ShardedVectorStore):
+        vector_db.close()
+    elif vector_db is not None and isinstance(
+        vector_db.docstore, SQLiteDocstore
+    ):
+        vector_db.docstore.close()
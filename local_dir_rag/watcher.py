@@ -0,0 +1,417 @@
+"""Filesystem change notification for documents directories."""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from typing import Callable, Iterator
+
+from local_dir_rag.defaults import (
+    DEFAULT_DEBOUNCE_SECONDS,
+    DEFAULT_MAX_DELAY_SECONDS,
+    DEFAULT_POLL_INTERVAL,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s `%(funcName)s` %(levelname)s:\n  %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# inotify event flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+    | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+# struct inotify_event: wd, mask, cookie and len, followed by the name
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+# Filter of the paths to watch: include(path, is_dir)
+PathFilter = Callable[[str, bool], bool]
+
+
+def _walk(
+    directory_path: str, include: PathFilter
+) -> Iterator[os.DirEntry]:
+    """
+    Walk the included files and directories under a directory.
+
+    Symbolic links to directories are followed once, as in scans.
+
+    Args:
+        directory_path: Directory to walk.
+        include: Filter of the paths to walk.
+
+    Yields:
+        Entries of the included files and directories.
+    """
+    visited = set()
+    pending = [directory_path]
+    while pending:
+        current_path = pending.pop()
+        try:
+            directory_stat = os.stat(current_path)
+            directory_key = (directory_stat.st_dev, directory_stat.st_ino)
+            if directory_key in visited:
+                continue
+            visited.add(directory_key)
+            with os.scandir(current_path) as iterator:
+                entries = list(iterator)
+        except OSError:
+            # Removed since it was listed; its removal is an event
+            continue
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if not include(entry.path, is_dir):
+                continue
+            yield entry
+            if is_dir:
+                pending.append(entry.path)
+
+
+class PollingWatcher:
+    """
+    Watcher that compares snapshots of the documents directories.
+
+    Each poll walks the directories and compares the size, modification
+    time and inode of every file with the previous poll. Works on every
+    platform and filesystem, including network filesystems that do not
+    deliver change notifications.
+    """
+
+    def __init__(
+        self,
+        directories: list[str],
+        include: PathFilter,
+        poll_interval: float = DEFAULT_POLL_INTERVAL
+    ):
+        """
+        Take the first snapshot.
+
+        Args:
+            directories: Documents directories to watch.
+            include: Filter of the paths to watch.
+            poll_interval: Seconds between polls.
+        """
+        self.directories = directories
+        self.include = include
+        self.poll_interval = poll_interval
+        self._files = self._snapshot()
+        self._next_poll = time.monotonic() + poll_interval
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Stop watching."""
+
+    def _snapshot(self) -> dict[str, tuple[int, int, int]]:
+        """Get the size, modification time and inode of every file."""
+        files = {}
+        for directory in self.directories:
+            for entry in _walk(directory, self.include):
+                try:
+                    if entry.is_dir():
+                        continue
+                    file_stat = entry.stat()
+                except OSError:
+                    continue
+                files[entry.path] = (
+                    file_stat.st_size,
+                    file_stat.st_mtime_ns,
+                    file_stat.st_ino
+                )
+        return files
+
+    def read_changes(self, timeout: float = None) -> set[str]:
+        """
+        Wait for files to change.
+
+        Args:
+            timeout: Maximum seconds to wait, or None to wait until a
+                change.
+
+        Returns:
+            Paths of the new, changed and removed files; empty if the
+            timeout passed first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if deadline is not None and self._next_poll > deadline:
+                time.sleep(max(deadline - now, 0))
+                return set()
+            time.sleep(max(self._next_poll - now, 0))
+            self._next_poll = time.monotonic() + self.poll_interval
+            files = self._snapshot()
+            changes = {
+                path for path in files.keys() | self._files.keys()
+                if files.get(path) != self._files.get(path)
+            }
+            self._files = files
+            if changes:
+                return changes
+
+
+class InotifyWatcher:
+    """
+    Watcher using Linux inotify notifications.
+
+    A watch is added to every included directory, and to directories as
+    they are created or moved in. Changed files, and created, moved and
+    removed directories, are reported by path. When the kernel's event
+    queue overflows, the documents directories themselves are reported,
+    so they are scanned again.
+    """
+
+    def __init__(self, directories: list[str], include: PathFilter):
+        """
+        Watch the documents directories and their subdirectories.
+
+        Args:
+            directories: Documents directories to watch.
+            include: Filter of the paths to watch.
+
+        Raises:
+            OSError: If inotify is not available, or the limit of
+                watches (``fs.inotify.max_user_watches``) is reached.
+        """
+        self.directories = directories
+        self.include = include
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1: {os.strerror(error)}")
+        self._paths: dict[int, str] = {}
+        try:
+            for directory in directories:
+                self._add_tree(directory, strict=True)
+        except OSError:
+            self.close()
+            raise
+        logger.info("Watching %d directories", len(self._paths))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Stop watching."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _add_watch(self, directory: str, strict: bool) -> None:
+        """
+        Watch a directory.
+
+        Args:
+            directory: Path of the directory.
+            strict: Raise if the watch limit is reached, instead of
+                logging a warning.
+        """
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), WATCH_MASK | IN_ONLYDIR
+        )
+        if wd >= 0:
+            self._paths[wd] = directory
+            return
+        error = ctypes.get_errno()
+        if error in (errno.ENOENT, errno.ENOTDIR):
+            # Removed since it was listed; its removal is an event
+            return
+        if strict:
+            raise OSError(
+                error, f"inotify_add_watch: {os.strerror(error)}", directory
+            )
+        logger.warning(
+            "Cannot watch %s, its changes are not indexed: %s",
+            directory,
+            os.strerror(error)
+        )
+
+    def _add_tree(self, directory: str, strict: bool = False) -> None:
+        """Watch a directory and its included subdirectories."""
+        self._add_watch(directory, strict)
+        for entry in _walk(directory, self.include):
+            if entry.is_dir():
+                self._add_watch(entry.path, strict)
+
+    def _remove_tree(self, directory: str) -> None:
+        """Stop watching a directory moved away, and its subdirectories."""
+        prefix = directory + os.sep
+        for wd, path in list(self._paths.items()):
+            if path == directory or path.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._paths[wd]
+
+    def _read_events(self) -> Iterator[tuple[int, int, str]]:
+        """Read the queued events as (wd, mask, name)."""
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                yield wd, mask, name
+
+    def read_changes(self, timeout: float = None) -> set[str]:
+        """
+        Wait for files to change.
+
+        Args:
+            timeout: Maximum seconds to wait, or None to wait until a
+                change.
+
+        Returns:
+            Paths of changed files and of created, moved and removed
+            directories; empty if the timeout passed first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = None
+            if deadline is not None:
+                wait = max(deadline - time.monotonic(), 0)
+            readable, _, _ = select.select([self._fd], [], [], wait)
+            if not readable:
+                return set()
+            changes = self._handle_events()
+            if changes:
+                return changes
+
+    def _handle_events(self) -> set[str]:
+        """Apply the queued events to the watches, and collect changes."""
+        changes = set()
+        for wd, mask, name in self._read_events():
+            if mask & IN_Q_OVERFLOW:
+                logger.warning(
+                    "Too many changes to track, scanning the documents "
+                    "directories again"
+                )
+                changes.update(self.directories)
+                continue
+            if mask & IN_IGNORED:
+                self._paths.pop(wd, None)
+                continue
+            directory = self._paths.get(wd)
+            if directory is None:
+                continue
+            if not name:
+                # The watched directory itself was removed or moved
+                if directory in self.directories:
+                    changes.add(directory)
+                continue
+            path = os.path.join(directory, name)
+            is_dir = bool(mask & IN_ISDIR)
+            if not self.include(path, is_dir):
+                continue
+            if is_dir and mask & IN_MOVED_FROM:
+                self._remove_tree(path)
+            elif is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path)
+            changes.add(path)
+        return changes
+
+
+def create_watcher(
+    directories: list[str],
+    include: PathFilter,
+    polling: bool = False,
+    poll_interval: float = DEFAULT_POLL_INTERVAL
+) -> InotifyWatcher | PollingWatcher:
+    """
+    Watch documents directories, with inotify where it is available.
+
+    Args:
+        directories: Documents directories to watch.
+        include: Filter of the paths to watch.
+        polling: Poll even where inotify is available.
+        poll_interval: Seconds between polls.
+
+    Returns:
+        The watcher.
+    """
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directories, include)
+        except (OSError, AttributeError) as error:
+            logger.warning(
+                "Cannot use inotify, polling every %.0f seconds instead: %s",
+                poll_interval,
+                error
+            )
+    return PollingWatcher(directories, include, poll_interval)
+
+
+def collect_changes(
+    watcher: InotifyWatcher | PollingWatcher,
+    timeout: float = None,
+    debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS,
+    max_delay_seconds: float = DEFAULT_MAX_DELAY_SECONDS
+) -> set[str]:
+    """
+    Wait for a burst of changes to settle, and coalesce it.
+
+    After the first change, changes are collected until none arrives for
+    ``debounce_seconds``, so a file written in many steps, or a directory
+    copied file by file, is indexed once. A burst is cut off after
+    ``max_delay_seconds``, so continuous changes are still indexed.
+
+    Args:
+        watcher: Watcher of the documents directories.
+        timeout: Maximum seconds to wait for the first change, or None to
+            wait until a change.
+        debounce_seconds: Seconds without changes that end a burst.
+        max_delay_seconds: Maximum seconds to collect a burst.
+
+    Returns:
+        Paths that changed; empty if the timeout passed first.
+    """
+    changes = watcher.read_changes(timeout)
+    if not changes:
+        return changes
+    deadline = time.monotonic() + max_delay_seconds
+    while True:
+        wait = min(debounce_seconds, deadline - time.monotonic())
+        if wait <= 0:
+            return changes
+        more = watcher.read_changes(wait)
+        if not more:
+            return changes
+        changes.update(more)
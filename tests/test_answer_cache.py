@@ -0,0 +1,112 @@
+"""Tests for the answer cache module."""
+import os
+import time
+
+import pytest
+
+from local_dir_rag import answer_cache
+from local_dir_rag.answer_cache import AnswerCache, normalize_query
+
+
+def _save_index(vector_db_path: str, content: str) -> None:
+    """Replace the index files, as a save of the vector database does."""
+    os.makedirs(vector_db_path, exist_ok=True)
+    for extension in ("faiss", "pkl"):
+        tmp_path = os.path.join(vector_db_path, f"index.tmp.{extension}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(
+            tmp_path, os.path.join(vector_db_path, f"index.{extension}")
+        )
+
+
+@pytest.fixture
+def vector_db_path(temp_dir):
+    """Vector database directory with saved index files."""
+    path = os.path.join(temp_dir, "vector_db")
+    _save_index(path, "version 1")
+    return path
+
+
+def test_normalize_query():
+    """Test that case, whitespace and trailing punctuation are ignored."""
+    assert normalize_query("  What IS   RAG?? ") == "what is rag"
+    assert normalize_query("what is rag") == "what is rag"
+
+
+def test_exact_answers(vector_db_path):
+    """Test that answers match on normalized query text and persist."""
+    with AnswerCache(vector_db_path) as cache:
+        assert cache.get("What is RAG?") is None
+        cache.put("What is RAG?", "Retrieval augmented generation.")
+        assert cache.get("what is  rag") == "Retrieval augmented generation."
+        assert cache.get("What is FAISS?") is None
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    with AnswerCache(vector_db_path) as cache:
+        assert cache.get("WHAT IS RAG") == "Retrieval augmented generation."
+
+
+def test_answers_invalidated_when_index_changes(vector_db_path):
+    """Test that answers from an earlier index are not returned."""
+    with AnswerCache(vector_db_path) as cache:
+        cache.put("What is RAG?", "An old answer.")
+
+    _save_index(vector_db_path, "version 2")
+    with AnswerCache(vector_db_path) as cache:
+        assert cache.get("What is RAG?") is None
+
+
+def test_answers_keyed_by_settings(vector_db_path):
+    """Test that answers are not reused with other query settings."""
+    with AnswerCache(
+        vector_db_path, similarity_threshold=0.95, settings={"k": 30}
+    ) as cache:
+        cache.put("What is RAG?", "An answer.", [1.0, 0.0])
+
+    with AnswerCache(
+        vector_db_path, similarity_threshold=0.95, settings={"k": 5}
+    ) as cache:
+        assert cache.get("What is RAG?") is None
+        assert cache.get_similar([1.0, 0.0]) is None
+        cache.put("What is RAG?", "Another answer.", [1.0, 0.0])
+
+    with AnswerCache(vector_db_path, settings={"k": 30}) as cache:
+        assert cache.get("What is RAG?") == "An answer."
+
+
+def test_answers_expire(vector_db_path, monkeypatch):
+    """Test time-to-live expiry."""
+    with AnswerCache(vector_db_path, ttl_seconds=60) as cache:
+        cache.put("What is RAG?", "An answer.")
+        now = time.time()
+        monkeypatch.setattr(answer_cache.time, "time", lambda: now + 120)
+        assert cache.get("What is RAG?") is None
+
+
+def test_least_recently_used_answers_evicted(vector_db_path):
+    """Test that the cache keeps at most max_entries answers."""
+    with AnswerCache(vector_db_path, max_entries=2) as cache:
+        cache.put("first", "1")
+        cache.put("second", "2")
+        assert cache.get("first") == "1"
+        cache.put("third", "3")
+
+        assert cache.get("first") == "1"
+        assert cache.get("second") is None
+        assert cache.get("third") == "3"
+
+
+def test_semantic_answers(vector_db_path):
+    """Test matching answers by query embedding similarity."""
+    with AnswerCache(vector_db_path, similarity_threshold=0.95) as cache:
+        assert cache.semantic
+        assert cache.get_similar([1.0, 0.0]) is None
+        cache.put("What is RAG?", "An answer.", [1.0, 0.0])
+
+        assert cache.get_similar([0.99, 0.05]) == "An answer."
+        assert cache.get_similar([0.5, 0.5]) is None
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    with AnswerCache(vector_db_path) as cache:
+        assert not cache.semantic
@@ -0,0 +1,77 @@
+"""Tests for the ingest benchmark."""
+import json
+import os
+import sys
+
+import pytest
+
+from local_dir_rag.benchmark import (
+    CorpusConfig,
+    benchmark,
+    format_results,
+    generate_corpus,
+    write_results,
+)
+from local_dir_rag.document_loader import load_document
+from local_dir_rag.metrics import STAGES
+
+
+def test_generate_corpus(temp_dir):
+    """The corpus has the configured shape, and the same seed repeats it."""
+    config = CorpusConfig(files=5, pdf_fraction=0.4, directories=2)
+    first = generate_corpus(os.path.join(temp_dir, "first"), config)
+    second = generate_corpus(os.path.join(temp_dir, "second"), config)
+    assert first == second
+    assert first["pdf_files"] == 2
+    assert sorted(os.listdir(os.path.join(temp_dir, "first"))) == [
+        "dir000", "dir001"
+    ]
+
+    pages = [
+        page
+        for path in ("dir000/doc000000.pdf", "dir001/doc000001.pdf")
+        for page in load_document(os.path.join(temp_dir, "first", path))
+    ]
+    assert len(pages) == first["pdf_pages"]
+    assert all(page.page_content.strip() for page in pages)
+
+
+def test_benchmark_reports_stages(temp_dir):
+    """A run reports rates, stage times and memory, and saves as JSON."""
+    results = benchmark(
+        CorpusConfig(files=4, pdf_fraction=0.25),
+        work_dir=temp_dir,
+        latency=0.0,
+        text_latency=0.0,
+        dimension=8
+    )
+    assert results["files"] == 4
+    assert results["chunks"] > 4
+    assert results["chunks_per_second"] > 0
+    assert set(results["stage_seconds"]) == set(STAGES)
+    assert results["stage_seconds"]["embed"] > 0
+
+    path = os.path.join(temp_dir, "results.json")
+    write_results(results, path)
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    assert "+0.0%" in format_results(results, baseline)
+
+
+@pytest.mark.skipif(
+    sys.platform == "win32", reason="No resource usage on Windows"
+)
+def test_benchmark_reports_worker_memory(temp_dir):
+    """Worker processes report their peak memory with their results."""
+    results = benchmark(
+        CorpusConfig(files=4, pdf_fraction=0.25),
+        work_dir=temp_dir,
+        workers=2,
+        latency=0.0,
+        text_latency=0.0,
+        dimension=8
+    )
+    peak_rss = results["peak_rss_bytes"]
+    assert peak_rss["workers"] > 0
+    assert results["worker_peak_rss_bytes"] == peak_rss["workers"]
+    assert "peak worker RSS MiB" in format_results(results)
@@ -0,0 +1,95 @@
+"""Tests for the SQLite document store."""
+import os
+import pickle
+import sqlite3
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from local_dir_rag.docstore import DOCSTORE_FILE, SQLiteDocstore
+from local_dir_rag.vector_store import (
+    load_vector_database,
+    migrate_docstore,
+    save_vector_database,
+)
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_add_search_delete(temp_dir, compress):
+    """Documents are found by id until deletions are purged."""
+    docstore = SQLiteDocstore(temp_dir, compress=compress)
+    docstore.add({
+        "a": Document(
+            page_content="First document " * 20,
+            metadata={"source": "a.txt", "page": 1, "tags": ["x"]}
+        ),
+        "b": Document(page_content="Second document", metadata={})
+    })
+
+    doc = docstore.search("a")
+    assert doc.id == "a"
+    assert doc.page_content == "First document " * 20
+    assert doc.metadata == {"source": "a.txt", "page": 1, "tags": ["x"]}
+    assert docstore.search("missing") == "ID missing not found."
+
+    docstore.delete(["a"])
+    assert docstore.search("a") == "ID a not found."
+    assert docstore.purge_deleted() == 1
+    assert docstore.search("a") == "ID a not found."
+    assert docstore.search("b").page_content == "Second document"
+
+    with sqlite3.connect(os.path.join(temp_dir, DOCSTORE_FILE)) as conn:
+        assert conn.execute(
+            "SELECT COUNT(*) FROM documents WHERE compressed = ?",
+            (int(compress),)
+        ).fetchone()[0] == 1
+    docstore.close()
+
+
+def test_pickle_stores_reference_only(temp_dir):
+    """A pickled store holds no documents and is attached on load."""
+    docstore = SQLiteDocstore(temp_dir)
+    docstore.add({"a": Document(page_content="Secret text " * 100)})
+    data = pickle.dumps(docstore)
+    docstore.close()
+    assert b"Secret text" not in data
+
+    restored = pickle.loads(data)
+    with pytest.raises(RuntimeError):
+        restored.search("a")
+    restored.attach(temp_dir)
+    assert restored.search("a").page_content == "Secret text " * 100
+    restored.close()
+
+
+def test_migrate_pickled_docstore(temp_dir):
+    """A vector database with a pickled docstore is migrated to SQLite."""
+    embeddings = DeterministicFakeEmbedding(size=16)
+    texts = [f"Document number {i}" for i in range(5)]
+    vector_db = FAISS.from_texts(
+        texts,
+        embeddings,
+        metadatas=[{"source": f"{i}.txt"} for i in range(5)]
+    )
+    vector_db.save_local(temp_dir)
+
+    assert migrate_docstore(temp_dir) == 5
+    assert migrate_docstore(temp_dir) == 0
+
+    loaded = load_vector_database(temp_dir, embeddings)
+    assert isinstance(loaded.docstore, SQLiteDocstore)
+    result = loaded.similarity_search(texts[3], k=1)[0]
+    assert result.page_content == texts[3]
+    assert result.metadata == {"source": "3.txt"}
+
+    # Deleted documents stay readable until the index is saved
+    doc_id = loaded.index_to_docstore_id[0]
+    loaded.delete([doc_id])
+    save_vector_database(loaded, temp_dir)
+    with sqlite3.connect(os.path.join(temp_dir, DOCSTORE_FILE)) as conn:
+        assert conn.execute(
+            "SELECT COUNT(*) FROM documents"
+        ).fetchone()[0] == 4
+    loaded.docstore.close()
@@ -1,7 +1,10 @@
 import os
 from local_dir_rag.document_loader import (
+    ExcludeRules,
     get_files_from_directory,
+    is_scanned,
     load_document,
+    scan_directory,
 )
 
 
@@ -51,6 +54,19 @@ def test_load_document_unsupported_format(temp_dir):
     assert len(docs) == 0
 
 
+def test_load_document_unreadable(temp_dir):
+    """Test loading documents that their loader fails on."""
+    text_path = os.path.join(temp_dir, "undecodable.txt")
+    with open(text_path, "wb") as f:
+        f.write(b"\xff\xfe\xfa undecodable")
+    pdf_path = os.path.join(temp_dir, "malformed.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(b"Not a PDF")
+
+    assert load_document(text_path) == []
+    assert load_document(pdf_path) == []
+
+
 def test_get_files_from_subdirectories(test_file_structure_with_subdirs):
     """Test that files in subdirectories are found recursively."""
     docs_dir, _ = test_file_structure_with_subdirs
@@ -78,3 +94,142 @@ def test_get_files_from_nested_subdirectory(test_file_structure_with_subdirs):
     nested_files = [f for f in files if "nested" in f]
     assert len(nested_files) == 1
     assert "nested_doc.txt" in nested_files[0]
+
+
+def test_scan_directory_returns_stats(test_file_structure_with_subdirs):
+    """Test that the scan returns a stat result for each file."""
+    docs_dir, file_paths = test_file_structure_with_subdirs
+
+    files = scan_directory(docs_dir, extensions=[".txt"])
+    assert set(files) == set(file_paths)
+    for file_path, file_stat in files.items():
+        assert file_stat.st_size == os.path.getsize(file_path)
+        assert file_stat.st_ino == os.stat(file_path).st_ino
+
+
+def test_scan_directory_matches_extensions_case_insensitively(temp_dir):
+    """Test that upper-case extensions match in a single scan."""
+    for file_name in ["upper.PDF", "lower.txt", "mixed.Txt", "other.doc"]:
+        with open(
+            os.path.join(temp_dir, file_name), "w", encoding="utf-8"
+        ) as f:
+            f.write("content")
+
+    files = get_files_from_directory(temp_dir)
+    found_files = {os.path.basename(f) for f in files}
+    assert found_files == {"upper.PDF", "lower.txt", "mixed.Txt"}
+
+
+def test_scan_directory_skips_hidden_paths(temp_dir):
+    """Test that hidden files and directories are skipped, as with glob."""
+    hidden_dir = os.path.join(temp_dir, ".hidden")
+    os.makedirs(hidden_dir)
+    for file_path in [
+        os.path.join(hidden_dir, "inside.txt"),
+        os.path.join(temp_dir, ".dotfile.txt"),
+        os.path.join(temp_dir, "visible.txt"),
+    ]:
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("content")
+
+    files = get_files_from_directory(temp_dir)
+    assert [os.path.basename(f) for f in files] == ["visible.txt"]
+
+
+def test_scan_directory_survives_symlink_loop(temp_dir):
+    """Test that a symbolic link back to a parent is walked only once."""
+    subdir = os.path.join(temp_dir, "subdir")
+    os.makedirs(subdir)
+    with open(os.path.join(subdir, "doc.txt"), "w", encoding="utf-8") as f:
+        f.write("content")
+    os.symlink(temp_dir, os.path.join(subdir, "loop"))
+
+    files = get_files_from_directory(temp_dir)
+    assert files == [os.path.join(subdir, "doc.txt")]
+
+
+def test_scan_directory_exclude_rules(test_file_structure_with_subdirs):
+    """Test gitignore-style exclude rules."""
+    docs_dir, _ = test_file_structure_with_subdirs
+
+    def scan(patterns):
+        rules = ExcludeRules.from_patterns(patterns)
+        return {
+            os.path.relpath(f, docs_dir).replace(os.sep, "/")
+            for f in get_files_from_directory(docs_dir, exclude_rules=rules)
+        }
+
+    all_files = scan([])
+    assert len(all_files) == 6
+
+    # Unanchored patterns match names at any depth
+    assert scan(["nested"]) == all_files - {"subdir1/nested/nested_doc.txt"}
+    assert scan(["*_doc_1.txt"]) == all_files - {
+        "root_doc_1.txt", "subdir1/subdir1_doc_1.txt"
+    }
+
+    # Anchored patterns match from the root only
+    assert scan(["/root_doc_*.txt"]) == all_files - {
+        "root_doc_0.txt", "root_doc_1.txt"
+    }
+    assert scan(["subdir1/*.txt"]) == all_files - {
+        "subdir1/subdir1_doc_0.txt", "subdir1/subdir1_doc_1.txt"
+    }
+    assert scan(["**/nested_doc.txt"]) == all_files - {
+        "subdir1/nested/nested_doc.txt"
+    }
+
+    # Directory-only patterns do not match files
+    assert scan(["subdir2_doc.txt/"]) == all_files
+    assert scan(["subdir2/"]) == all_files - {"subdir2/subdir2_doc.txt"}
+
+    # Negation re-includes, comments and blank lines are ignored
+    assert scan(["# comment", "", "*.txt", "!root_doc_0.txt"]) == {
+        "root_doc_0.txt"
+    }
+
+
+def test_exclude_bracket_expressions():
+    """Test that bracket expressions match like gitignore's."""
+    def excluded(pattern, name):
+        return ExcludeRules.from_patterns([pattern]).is_excluded(name, False)
+
+    assert excluded("doc_[01].txt", "doc_1.txt")
+    assert not excluded("doc_[01].txt", "doc_2.txt")
+    # Only a leading "!" negates the set
+    assert excluded("doc_[!01].txt", "doc_2.txt")
+    assert not excluded("doc_[!01].txt", "doc_0.txt")
+    assert excluded("doc_[a!b].txt", "doc_!.txt")
+    assert not excluded("doc_[a!b].txt", "doc_^.txt")
+    # "^" and "\\" are literal, and a leading "]" is part of the set
+    assert excluded("doc_[\\^].txt", "doc_^.txt")
+    assert excluded("doc_[\\^].txt", "doc_\\.txt")
+    assert excluded("doc_[]x].txt", "doc_].txt")
+    # An unclosed bracket is literal
+    assert excluded("doc_[1.txt", "doc_[1.txt")
+
+
+def test_is_scanned_agrees_with_scan(test_file_structure_with_subdirs):
+    """Test that single paths are checked as a scan would include them."""
+    docs_dir, file_paths = test_file_structure_with_subdirs
+    exclude_rules = ExcludeRules.from_patterns(["subdir1/nested/"])
+    scanned = scan_directory(docs_dir, exclude_rules=exclude_rules)
+    for file_path in file_paths:
+        assert is_scanned(
+            file_path, docs_dir, exclude_rules=exclude_rules
+        ) == (file_path in scanned)
+
+    nested = os.path.join(docs_dir, "subdir1", "nested")
+    assert not is_scanned(nested, docs_dir, True, exclude_rules=exclude_rules)
+    assert is_scanned(os.path.join(docs_dir, "subdir2"), docs_dir, True)
+    assert not is_scanned(os.path.join(docs_dir, "notes.md"), docs_dir)
+    assert not is_scanned(os.path.join(docs_dir, ".hidden.txt"), docs_dir)
+    # Subdirectory scans apply the rules anchored to the root
+    assert scan_directory(
+        os.path.join(docs_dir, "subdir1"),
+        exclude_rules=exclude_rules,
+        relative_dir="subdir1/"
+    ).keys() == {
+        path for path in scanned
+        if path.startswith(os.path.join(docs_dir, "subdir1", ""))
+    }
@@ -1,14 +1,40 @@
 """Tests for incremental embedding behavior."""
 import os
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock
 
+import numpy as np
 import pytest
 from langchain_core.documents import Document
-from langchain_core.embeddings import Embeddings
-
-from local_dir_rag.embed import embed_docs
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from local_dir_rag import embed, file_tracker, vector_store
+from local_dir_rag.embed import (
+    IngestFile,
+    _run_stage,
+    batch_chunks,
+    embed_docs,
+)
+from local_dir_rag.faiss_index import (
+    IndexConfig,
+    describe_index,
+    describe_storage,
+    index_vectors,
+)
+from local_dir_rag.file_tracker import FileState, FileStatus
 from local_dir_rag.file_tracker import FileTracker
-from local_dir_rag.vector_store import remove_documents_by_source
+from local_dir_rag.vector_store import (
+    SAVE_MARKER_NAME,
+    TMP_INDEX_NAME,
+    create_vector_database,
+    load_vector_database,
+    lock_vector_database,
+    recover_interrupted_saves,
+    remove_documents_by_ids,
+    remove_documents_by_source,
+    save_vector_database,
+    warm_up_index,
+)
 
 
 class MockEmbeddings(Embeddings):
@@ -23,6 +49,24 @@ class MockEmbeddings(Embeddings):
         return [0.1, 0.2, 0.3] * 128
 
 
+class CountingEmbeddings(MockEmbeddings):
+    """Mock embeddings model recording the size of each request."""
+
+    def __init__(self, fail_after: int = None):
+        self.requests = []
+        self.fail_after = fail_after
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Record the request and return mock embeddings."""
+        if (
+            self.fail_after is not None
+            and len(self.requests) >= self.fail_after
+        ):
+            raise RuntimeError("Embedding request failed")
+        self.requests.append(len(texts))
+        return super().embed_documents(texts)
+
+
 @pytest.fixture
 def docs_and_vector_db(temp_dir):
     """Create docs directory and vector db path."""
@@ -251,6 +295,47 @@ def test_handle_deleted_files(docs_and_vector_db):
     assert file2 not in tracked_files
 
 
+def test_file_deleted_after_scan(docs_and_vector_db, monkeypatch):
+    """Test that a file deleted during a run is handled as deleted."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    mock_embeddings = MockEmbeddings()
+
+    file1 = os.path.join(docs_dir, "file1.txt")
+    file2 = os.path.join(docs_dir, "file2.txt")
+    with open(file1, "w", encoding="utf-8") as f:
+        f.write("Content for file 1. " * 10)
+    with open(file2, "w", encoding="utf-8") as f:
+        f.write("Content for file 2. " * 10)
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=mock_embeddings
+    )
+
+    with open(file2, "w", encoding="utf-8") as f:
+        f.write("Changed content for file 2. " * 10)
+    scan = embed._scan_docs_paths
+
+    def scan_then_delete(*args, **kwargs):
+        file_stats = scan(*args, **kwargs)
+        os.remove(file2)
+        return file_stats
+
+    monkeypatch.setattr(embed, "_scan_docs_paths", scan_then_delete)
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=mock_embeddings
+    )
+
+    sources = {
+        vector_db.docstore.search(doc_id).metadata["source"]
+        for doc_id in vector_db.index_to_docstore_id.values()
+    }
+    assert sources == {file1}
+    assert FileTracker(vector_db_path).get_all_tracked_files() == [file1]
+
+
 def test_sqlite_db_location(docs_and_vector_db):
     """Test that SQLite database is created in vector_db_path."""
     docs_dir, vector_db_path = docs_and_vector_db
@@ -273,6 +358,315 @@ def test_sqlite_db_location(docs_and_vector_db):
     assert os.path.exists(db_path)
 
 
+def test_embed_exclude_patterns(docs_and_vector_db):
+    """Test that excluded files are not indexed."""
+    docs_dir, vector_db_path = docs_and_vector_db
+
+    drafts_dir = os.path.join(docs_dir, "drafts")
+    os.makedirs(drafts_dir)
+    file1 = os.path.join(docs_dir, "file1.txt")
+    draft = os.path.join(drafts_dir, "draft.txt")
+    for file_path in [file1, draft]:
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("Content for a file. " * 10)
+
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings(),
+        exclude_patterns=["drafts/"]
+    )
+
+    tracker = FileTracker(vector_db_path)
+    assert tracker.get_all_tracked_files() == [file1]
+
+
+def _index_contents(vector_db):
+    """Get the (source, text) pairs stored in a vector database."""
+    return [
+        (
+            vector_db.docstore.search(doc_id).metadata["source"],
+            vector_db.docstore.search(doc_id).page_content
+        )
+        for _, doc_id in sorted(vector_db.index_to_docstore_id.items())
+    ]
+
+
+def test_parallel_pipeline_matches_serial(temp_dir):
+    """Test that worker processes produce the same index and tracker."""
+    docs_dir = os.path.join(temp_dir, "docs")
+    os.makedirs(docs_dir)
+    for i in range(6):
+        with open(
+            os.path.join(docs_dir, f"file{i}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(f"Content for file {i}. " * (20 + 40 * i))
+
+    results = []
+    for workers in [1, 3]:
+        vector_db_path = os.path.join(temp_dir, f"vector_db_{workers}")
+        vector_db = embed_docs(
+            docs_paths=docs_dir,
+            vector_db_path=vector_db_path,
+            embeddings_model=MockEmbeddings(),
+            workers=workers
+        )
+        tracker = FileTracker(vector_db_path)
+        results.append((
+            _index_contents(vector_db),
+            sorted(tracker.get_all_tracked_files())
+        ))
+
+    assert results[0] == results[1]
+    assert len(results[0][1]) == 6
+
+
+def test_run_stage_bounds_pending_tasks():
+    """Test that a stage keeps results ordered and tasks bounded."""
+    submitted = []
+    consumed = []
+
+    def items():
+        for i in range(10):
+            submitted.append(i)
+            # Never more than max_pending ahead of the consumer
+            assert len(submitted) - len(consumed) <= 3
+            yield i, i
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for context, result in _run_stage(
+            pool, lambda value: value * value, items(), max_pending=3
+        ):
+            consumed.append(context)
+            assert result == context * context
+
+    assert consumed == list(range(10))
+
+
+def _ingest_file(name: str, texts: list[str]) -> IngestFile:
+    """Create an ingest file with one chunk per text."""
+    return IngestFile(
+        FileStatus(file_path=name, state=FileState.NEW),
+        [Document(page_content=text, metadata={"source": name})
+         for text in texts]
+    )
+
+
+def test_batch_chunks_groups_small_files():
+    """Test that chunks of small files share a request."""
+    files = [_ingest_file(f"file{i}", ["abcd" * 10]) for i in range(5)]
+
+    batches = list(batch_chunks(files, max_tokens=1000, max_items=3))
+
+    assert [len(batch.chunks) for batch in batches] == [3, 2]
+    assert batches[0].completed == files[:3]
+    assert batches[1].started == files[3:]
+    assert batches[1].completed == files[3:]
+
+
+def test_batch_chunks_splits_large_files():
+    """Test that a file is spread over requests by the token budget."""
+    large = _ingest_file("large", ["abcd" * 10] * 5)  # 10 tokens each
+    empty = _ingest_file("empty", [])
+    small = _ingest_file("small", ["abcd" * 100])  # oversized, 100 tokens
+
+    batches = list(batch_chunks(
+        [large, empty, small], max_tokens=25, max_items=100
+    ))
+
+    assert [len(batch.chunks) for batch in batches] == [2, 2, 1, 1]
+    assert batches[0].started == [large]
+    assert batches[2].completed == [large, empty]
+    assert batches[2].started == [empty]
+    assert batches[3].started == [small]
+    assert batches[3].completed == [small]
+
+
+def test_embed_batches_across_files(docs_and_vector_db):
+    """Test that small files are embedded in shared requests."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    for i in range(10):
+        with open(
+            os.path.join(docs_dir, f"file{i}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(f"Small file {i}.")
+
+    embeddings_model = CountingEmbeddings()
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model,
+        max_batch_size=4
+    )
+
+    assert embeddings_model.requests == [4, 4, 2]
+    assert len(vector_db.index_to_docstore_id) == 10
+    assert len(FileTracker(vector_db_path).get_all_tracked_files()) == 10
+
+
+def test_file_tracked_only_after_all_chunks_stored(docs_and_vector_db):
+    """Test that a file split over failed requests is not tracked."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    small = os.path.join(docs_dir, "a_small.txt")
+    large = os.path.join(docs_dir, "b_large.txt")
+    with open(small, "w", encoding="utf-8") as f:
+        f.write("Small file.")
+    with open(large, "w", encoding="utf-8") as f:
+        f.write(" ".join(f"Large file sentence {i}." for i in range(500)))
+
+    with pytest.raises(RuntimeError):
+        embed_docs(
+            docs_paths=docs_dir,
+            vector_db_path=vector_db_path,
+            embeddings_model=CountingEmbeddings(fail_after=2),
+            max_batch_size=4,
+            checkpoint_files=1
+        )
+
+    # The checkpoint saved part of the large file, which is recorded as
+    # incomplete so that the next run replaces its chunks
+    statuses = FileTracker(vector_db_path).get_file_statuses([small, large])
+    assert [status.state for status in statuses] == [
+        FileState.UNCHANGED, FileState.MODIFIED
+    ]
+
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings(),
+        max_batch_size=4
+    )
+    sources = [source for source, _ in _index_contents(vector_db)]
+    assert sources.count(small) == 1
+    expected_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=os.path.join(docs_dir, "..", "expected_db"),
+        embeddings_model=MockEmbeddings()
+    )
+    assert _index_contents(vector_db) == _index_contents(expected_db)
+
+
+def test_interrupted_run_tracks_only_checkpointed_files(docs_and_vector_db):
+    """Test that files after the last checkpoint are not tracked."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    for i in range(5):
+        with open(
+            os.path.join(docs_dir, f"file{i}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(f"Small file {i}.")
+
+    with pytest.raises(RuntimeError):
+        embed_docs(
+            docs_paths=docs_dir,
+            vector_db_path=vector_db_path,
+            embeddings_model=CountingEmbeddings(fail_after=4),
+            max_batch_size=1,
+            checkpoint_files=3
+        )
+
+    tracked_files = FileTracker(vector_db_path).get_all_tracked_files()
+    assert len(tracked_files) == 3
+    saved_db = load_vector_database(vector_db_path, MockEmbeddings())
+    saved_sources = {source for source, _ in _index_contents(saved_db)}
+    assert saved_sources == set(tracked_files)
+
+    # The next run picks up the remaining files
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    assert len(FileTracker(vector_db_path).get_all_tracked_files()) == 5
+
+
+def test_embed_saves_once_per_checkpoint(docs_and_vector_db, monkeypatch):
+    """Test that the index is not rewritten after every file."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    for i in range(5):
+        with open(
+            os.path.join(docs_dir, f"file{i}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(f"Small file {i}.")
+
+    saves = []
+    original = embed.save_vector_database
+    monkeypatch.setattr(
+        embed,
+        "save_vector_database",
+        lambda vector_db, path: saves.append(path) or original(
+            vector_db, path
+        )
+    )
+
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings(),
+        max_batch_size=1
+    )
+    assert len(saves) == 1
+
+    # Unchanged files do not rewrite the index at all
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    assert len(saves) == 1
+
+
+def test_deleted_files_are_saved(docs_and_vector_db):
+    """Test that a run with only deletions saves the index."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    file1 = os.path.join(docs_dir, "file1.txt")
+    file2 = os.path.join(docs_dir, "file2.txt")
+    for file_path in [file1, file2]:
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(f"Content for {file_path}.")
+
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    os.remove(file2)
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+
+    saved_db = load_vector_database(vector_db_path, MockEmbeddings())
+    assert {source for source, _ in _index_contents(saved_db)} == {file1}
+
+
+def test_embed_hashes_each_file_once(docs_and_vector_db, monkeypatch):
+    """Test that the status checksum is reused to update the tracker."""
+    docs_dir, vector_db_path = docs_and_vector_db
+
+    file1 = os.path.join(docs_dir, "file1.txt")
+    with open(file1, "w", encoding="utf-8") as f:
+        f.write("Content for file 1. " * 10)
+
+    hashed_paths = []
+    original = file_tracker.compute_file_checksums
+    monkeypatch.setattr(
+        file_tracker,
+        "compute_file_checksums",
+        lambda path, algorithms: hashed_paths.append(path) or original(
+            path, algorithms
+        )
+    )
+
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+
+    assert hashed_paths == [file1]
+
+
 def test_remove_documents_by_source():
     """Test removing documents by source from vector store."""
     # Create a mock FAISS vector store
@@ -317,7 +711,529 @@ def test_remove_documents_by_source():
     assert "id2" not in call_args
 
 
+def test_remove_documents_by_ids():
+    """Test that ids missing from the index are ignored."""
+    mock_vector_db = MagicMock()
+    mock_vector_db.index_to_docstore_id = {0: "id1"}
+
+    removed = remove_documents_by_ids(mock_vector_db, ["id1", "id2", "id1"])
+
+    assert removed == 1
+    mock_vector_db.delete.assert_called_once_with(["id1"])
+    assert remove_documents_by_ids(None, ["id1"]) == 0
+
+
 def test_remove_documents_from_none_db():
     """Test that removing from None database returns 0."""
     removed = remove_documents_by_source(None, "/path/to/file.txt")
     assert removed == 0
+
+
+def test_interrupted_save_is_recovered_by_writer(
+    docs_and_vector_db, monkeypatch
+):
+    """Test that only committed saves are completed, by the writer."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    file1 = os.path.join(docs_dir, "file1.txt")
+    with open(file1, "w", encoding="utf-8") as f:
+        f.write("Content for file 1.")
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    tmp_index = os.path.join(vector_db_path, f"{TMP_INDEX_NAME}.faiss")
+    tmp_pickle = os.path.join(vector_db_path, f"{TMP_INDEX_NAME}.pkl")
+    marker = os.path.join(vector_db_path, SAVE_MARKER_NAME)
+
+    # A crash before the marker leaves the previous database, even with
+    # the new index written and its pickle missing
+    vector_db.add_texts(["Added before the crash."])
+    vector_db.save_local(vector_db_path, index_name=TMP_INDEX_NAME)
+    os.remove(tmp_pickle)
+    loaded_db = load_vector_database(vector_db_path, MockEmbeddings())
+    assert loaded_db.index.ntotal == 1
+    # Loads do not change the files; the writer discards the leftovers
+    assert os.path.exists(tmp_index)
+    with lock_vector_database(vector_db_path):
+        with pytest.raises(RuntimeError):
+            with lock_vector_database(vector_db_path):
+                pass
+        recover_interrupted_saves(vector_db_path)
+    assert not os.path.exists(tmp_index)
+
+    # A crash after the marker and the pickle rename is completed
+    vector_db.save_local(vector_db_path, index_name=TMP_INDEX_NAME)
+    with open(marker, "wb"):
+        pass
+    os.replace(tmp_pickle, os.path.join(vector_db_path, "index.pkl"))
+    monkeypatch.setattr(vector_store, "SAVE_WAIT_SECONDS", 0.1)
+    loaded_db = load_vector_database(vector_db_path, MockEmbeddings())
+    assert len(loaded_db.index_to_docstore_id) == 2
+    assert loaded_db.index.ntotal == 2
+    assert os.path.exists(tmp_index) and os.path.exists(marker)
+
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    assert not os.path.exists(tmp_index) and not os.path.exists(marker)
+    recovered_db = load_vector_database(vector_db_path, MockEmbeddings())
+    assert len(recovered_db.index_to_docstore_id) == 2
+    assert recovered_db.index.ntotal == 2
+    assert len(recovered_db.similarity_search("crash", k=2)) == 2
+
+
+def test_load_retries_when_saved_meanwhile(docs_and_vector_db, monkeypatch):
+    """Test that a load overlapping a save returns the saved version."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    with open(os.path.join(docs_dir, "file1.txt"), "w", encoding="utf-8") as f:
+        f.write("Content for file 1.")
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    vector_db.add_texts(["Saved during the load."])
+    load_local = vector_store._load_local
+    loads = []
+
+    def load_during_save(*args):
+        loaded_db = load_local(*args)
+        if not loads:
+            vector_store.save_vector_database(vector_db, vector_db_path)
+        loads.append(loaded_db.index.ntotal)
+        return loaded_db
+
+    monkeypatch.setattr(vector_store, "_load_local", load_during_save)
+    loaded_db = load_vector_database(vector_db_path, MockEmbeddings())
+    assert loads == [1, 2]
+    assert loaded_db.index.ntotal == 2
+
+
+def test_chunk_ids_recorded_per_file(docs_and_vector_db):
+    """Test that the tracker records the index ids of each file's chunks."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    file1 = os.path.join(docs_dir, "file1.txt")
+    file2 = os.path.join(docs_dir, "file2.txt")
+    with open(file1, "w", encoding="utf-8") as f:
+        f.write("".join(f"Large file sentence {i}. " for i in range(500)))
+    with open(file2, "w", encoding="utf-8") as f:
+        f.write("Small file.")
+
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings(),
+        max_batch_size=4
+    )
+
+    ids_by_source = {}
+    for doc_id in vector_db.index_to_docstore_id.values():
+        source = vector_db.docstore.search(doc_id).metadata["source"]
+        ids_by_source.setdefault(source, set()).add(doc_id)
+    chunk_ids = FileTracker(vector_db_path).get_chunk_ids([file1, file2])
+    assert {
+        file_path: set(ids) for file_path, ids in chunk_ids.items()
+    } == ids_by_source
+    assert len(chunk_ids[file1]) > 4
+
+
+def test_removal_does_not_scan_docstore(docs_and_vector_db, monkeypatch):
+    """Test that modified and deleted files are removed by recorded id."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    file1 = os.path.join(docs_dir, "file1.txt")
+    file2 = os.path.join(docs_dir, "file2.txt")
+    for file_path in (file1, file2):
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(f"Original content of {file_path}.")
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+
+    scanned = []
+    original = vector_store.find_document_ids_by_source
+    monkeypatch.setattr(
+        embed,
+        "find_document_ids_by_source",
+        lambda vector_db, source_paths: scanned.extend(source_paths)
+        or original(vector_db, source_paths)
+    )
+    with open(file1, "w", encoding="utf-8") as f:
+        f.write("Modified content, a little longer than before.")
+    os.remove(file2)
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+
+    assert scanned == []
+    assert _index_contents(vector_db) == [
+        (file1, "Modified content, a little longer than before.")
+    ]
+    assert FileTracker(vector_db_path).get_chunk_counts() == [(file1, 1)]
+
+
+def test_removal_of_files_tracked_without_chunk_ids(docs_and_vector_db):
+    """Test that chunks of files tracked without ids are found by scan."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    file1 = os.path.join(docs_dir, "file1.txt")
+    file2 = os.path.join(docs_dir, "file2.txt")
+    for file_path in (file1, file2):
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(f"Original content of {file_path}.")
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+
+    # Forget the chunk ids, as in a database from an earlier version
+    with FileTracker(vector_db_path) as tracker:
+        with tracker._transaction() as cursor:
+            cursor.execute("UPDATE file_checksums SET chunk_count = NULL")
+            cursor.execute("DELETE FROM file_chunks")
+        assert tracker.get_chunk_counts() == [(file1, None), (file2, None)]
+
+    with open(file1, "w", encoding="utf-8") as f:
+        f.write("Modified content, a little longer than before.")
+    os.remove(file2)
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+
+    assert _index_contents(vector_db) == [
+        (file1, "Modified content, a little longer than before.")
+    ]
+    assert FileTracker(vector_db_path).get_chunk_counts() == [(file1, 1)]
+
+
+def test_identical_chunks_stored_once(docs_and_vector_db):
+    """Test that files share identical chunks until none references them."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    boilerplate = "Copyright notice shared by every document."
+    file_paths = []
+    for i in range(3):
+        file_path = os.path.join(docs_dir, f"file{i}.txt")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(boilerplate if i < 2 else f"Unique document {i}.")
+        file_paths.append(file_path)
+
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    assert sorted(text for _, text in _index_contents(vector_db)) == [
+        boilerplate, "Unique document 2."
+    ]
+    tracker = FileTracker(vector_db_path)
+    chunk_ids = tracker.get_chunk_ids(file_paths[:2])
+    assert chunk_ids[file_paths[0]] == chunk_ids[file_paths[1]]
+    assert tracker.get_chunk_totals() == (3, 2)
+
+    # The chunk is kept while another file references it
+    os.remove(file_paths[0])
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    assert boilerplate in [text for _, text in _index_contents(vector_db)]
+
+    with open(file_paths[1], "w", encoding="utf-8") as f:
+        f.write("Rewritten document.")
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    assert sorted(text for _, text in _index_contents(vector_db)) == [
+        "Rewritten document.", "Unique document 2."
+    ]
+
+
+def test_shared_chunk_cites_remaining_file(docs_and_vector_db):
+    """Test that a shared chunk cites another file once its source is
+    deleted."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    boilerplate = "Copyright notice shared by every document."
+    file_paths = [
+        os.path.join(docs_dir, f"file{i}.txt") for i in range(3)
+    ]
+    for file_path in file_paths[:2]:
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(boilerplate)
+
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    doc = vector_db.similarity_search(boilerplate, k=1)[0]
+    assert sorted(doc.metadata["sources"]) == file_paths[:2]
+    cited = doc.metadata["source"]
+    other = file_paths[1] if cited == file_paths[0] else file_paths[0]
+
+    # A file added later is recorded too
+    with open(file_paths[2], "w", encoding="utf-8") as f:
+        f.write(boilerplate)
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    os.remove(cited)
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+
+    vector_db = load_vector_database(vector_db_path, MockEmbeddings())
+    doc = vector_db.similarity_search(boilerplate, k=1)[0]
+    assert doc.metadata["source"] == other
+    assert sorted(doc.metadata["sources"]) == sorted([other, file_paths[2]])
+
+
+def test_embedding_cache_reuses_unchanged_chunks(docs_and_vector_db):
+    """Test that only changed chunks of a modified file are embedded."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    file1 = os.path.join(docs_dir, "file1.txt")
+    file2 = os.path.join(docs_dir, "file2.txt")
+    sentences = [f"Sentence number {i} of the document." for i in range(200)]
+    with open(file1, "w", encoding="utf-8") as f:
+        f.write(" ".join(sentences))
+
+    embeddings_model = CountingEmbeddings()
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model
+    )
+    chunk_count = len(vector_db.index_to_docstore_id)
+    assert chunk_count > 3
+    assert sum(embeddings_model.requests) == chunk_count
+
+    # An edit at the end, and a copy of the original file
+    sentences[-1] = "The last sentence was edited."
+    with open(file1, "w", encoding="utf-8") as f:
+        f.write(" ".join(sentences))
+    with open(file2, "w", encoding="utf-8") as f:
+        f.write(" ".join(sentences[:-1]))
+
+    embeddings_model = CountingEmbeddings()
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model
+    )
+    assert sum(embeddings_model.requests) == 2
+    # The copy's chunks are stored once; only the edited chunk is new
+    assert len(vector_db.index_to_docstore_id) == chunk_count + 1
+    assert os.path.exists(os.path.join(vector_db_path, "embedding_cache.db"))
+
+
+@pytest.mark.parametrize("index_type,storage,rerank_factor", [
+    ("ivf", "flat", 0),
+    ("hnsw", "flat", 0),
+    ("flat", "sq8", 4),
+    ("ivf", "fp16", 0),
+])
+def test_approximate_index_persists_and_updates(
+    docs_and_vector_db, index_type, storage, rerank_factor
+):
+    """Test building, reloading and updating approximate indexes."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    for i in range(60):
+        with open(
+            os.path.join(docs_dir, f"file{i}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(f"Document number {i} about topic {i % 7}.")
+    embeddings_model = DeterministicFakeEmbedding(size=32)
+    config = IndexConfig(
+        index_type=index_type,
+        nlist=4,
+        nprobe=4,
+        storage=storage,
+        rerank_factor=rerank_factor
+    )
+
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model,
+        index_config=config
+    )
+    assert describe_index(vector_db.index) == index_type
+
+    vector_db = load_vector_database(vector_db_path, embeddings_model)
+    assert describe_index(vector_db.index) == index_type
+    assert describe_storage(vector_db.index) == storage
+    assert vector_db.similarity_search(
+        "Document number 3 about topic 3.", k=1
+    )[0].page_content == "Document number 3 about topic 3."
+
+    # Updates keep the saved index type, and positions stay consistent
+    with open(
+        os.path.join(docs_dir, "file0.txt"), "w", encoding="utf-8"
+    ) as f:
+        f.write("Rewritten document.")
+    os.remove(os.path.join(docs_dir, "file1.txt"))
+    vector_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model
+    )
+
+    assert describe_index(vector_db.index) == index_type
+    assert len(vector_db.index_to_docstore_id) == 59
+    # Only IVF indexes remove vectors; the others skip them in searches
+    assert vector_db.index.ntotal == (59 if index_type == "ivf" else 61)
+    vectors = index_vectors(vector_db.index)
+    for position, doc_id in vector_db.index_to_docstore_id.items():
+        text = vector_db.docstore.search(doc_id).page_content
+        np.testing.assert_allclose(
+            vectors[position],
+            embeddings_model.embed_query(text),
+            rtol=1e-3,
+            atol=1e-3
+        )
+    assert "Document number 1 about topic 1." not in [
+        text for _, text in _index_contents(vector_db)
+    ]
+
+
+@pytest.mark.parametrize("index_type,storage,rerank_factor", [
+    ("ivf", "flat", 0),
+    ("hnsw", "flat", 0),
+    ("flat", "sq8", 4),
+])
+def test_delete_keeps_approximate_index(
+    temp_dir, monkeypatch, index_type, storage, rerank_factor
+):
+    """Test that deletes do not rebuild approximate indexes until many
+    vectors are deleted."""
+    embeddings_model = DeterministicFakeEmbedding(size=32)
+    texts = [f"Document number {i} about topic {i % 7}." for i in range(60)]
+    vector_db = create_vector_database(temp_dir, embeddings_model, 32)
+    vector_db.add_texts(texts, ids=[str(i) for i in range(60)])
+    assert vector_db.convert_index(IndexConfig(
+        index_type=index_type,
+        nlist=4,
+        nprobe=4,
+        storage=storage,
+        rerank_factor=rerank_factor
+    ))
+    index = vector_db.index
+
+    def fail(*args):
+        raise AssertionError("Index rebuilt")
+
+    monkeypatch.setattr(vector_store, "rebuild_without", fail)
+    assert remove_documents_by_ids(vector_db, ["0", "5", "58"]) == 3
+    vector_db.add_texts(["A new document."], ids=["new"])
+    save_vector_database(vector_db, temp_dir)
+    monkeypatch.undo()
+
+    assert vector_db.index is index
+    loaded_db = load_vector_database(temp_dir, embeddings_model)
+    for db in (vector_db, loaded_db):
+        assert len(db.index_to_docstore_id) == 58
+        for text in texts[:10] + texts[55:] + ["A new document."]:
+            found = db.similarity_search(text, k=1)
+            assert found
+            assert found[0].id not in {"0", "5", "58"}
+            if text not in {texts[0], texts[5], texts[58]}:
+                assert found[0].page_content == text
+        found = db.similarity_search(texts[0], k=100)
+        assert len(found) == 58
+        assert {doc.id for doc in found} == set(
+            db.index_to_docstore_id.values()
+        )
+
+    # Rebuilt once a fifth of the vectors are deleted
+    remove_documents_by_ids(loaded_db, [str(i) for i in range(10, 20)])
+    assert loaded_db.index.ntotal == len(loaded_db.index_to_docstore_id)
+    assert describe_index(loaded_db.index) == index_type
+    assert loaded_db.similarity_search(
+        "A new document.", k=1
+    )[0].page_content == "A new document."
+
+
+def test_flat_index_loads_unchanged(docs_and_vector_db):
+    """Test that databases without an index configuration stay flat."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    with open(
+        os.path.join(docs_dir, "file1.txt"), "w", encoding="utf-8"
+    ) as f:
+        f.write("Some content.")
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=MockEmbeddings()
+    )
+    os.remove(os.path.join(vector_db_path, "index_config.json"))
+
+    vector_db = load_vector_database(
+        vector_db_path, MockEmbeddings(), nprobe=4, ef_search=8
+    )
+    assert describe_index(vector_db.index) == "flat"
+    assert vector_db.index.ntotal == 1
+
+
+@pytest.mark.parametrize("config", [
+    IndexConfig(),
+    IndexConfig(index_type="ivf", nlist=4),
+    IndexConfig(index_type="hnsw", storage="sq8", rerank_factor=2),
+])
+def test_mmap_load_matches_regular_load(docs_and_vector_db, config):
+    """Test that memory-mapped databases answer like loaded ones."""
+    docs_dir, vector_db_path = docs_and_vector_db
+    for i in range(40):
+        with open(
+            os.path.join(docs_dir, f"file{i}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(f"Document number {i} about topic {i % 7}.")
+    embeddings_model = DeterministicFakeEmbedding(size=32)
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model,
+        index_config=config
+    )
+    index_file = os.path.join(vector_db_path, "index.faiss")
+    assert warm_up_index(index_file) == os.path.getsize(index_file)
+
+    loaded_db = load_vector_database(vector_db_path, embeddings_model)
+    mapped_db = load_vector_database(
+        vector_db_path, embeddings_model, mmap=True, warm_up=True
+    )
+
+    def search(vector_db):
+        return [
+            doc.page_content
+            for doc in vector_db.similarity_search("topic 3", k=5)
+        ]
+
+    assert describe_index(mapped_db.index) == config.index_type
+    assert search(mapped_db) == search(loaded_db)
+
+    # The mapped index keeps its version while the database is updated
+    with open(
+        os.path.join(docs_dir, "file40.txt"), "w", encoding="utf-8"
+    ) as f:
+        f.write("Document number 40 about topic 5.")
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model
+    )
+    assert search(mapped_db) == search(loaded_db)
+    assert mapped_db.index.ntotal == 40
@@ -0,0 +1,55 @@
+"""Tests for the embedding cache module."""
+import os
+
+from langchain_openai import OpenAIEmbeddings
+
+from local_dir_rag.embedding_cache import (
+    EmbeddingCache,
+    embedding_model_name,
+)
+
+
+def test_embedding_cache_round_trip(temp_dir):
+    """Test that stored vectors are returned and counted as hits."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    with EmbeddingCache(vector_db_path, "model-a") as cache:
+        assert cache.get_many(["one", "two"]) == [None, None]
+        cache.put_many({"one": [0.5, 0.25], "two": [1.0, -2.0]})
+        assert cache.get_many(["two", "three", "one"]) == [
+            [1.0, -2.0], None, [0.5, 0.25]
+        ]
+        assert (cache.hits, cache.misses) == (2, 3)
+        assert cache.hit_rate == 0.4
+
+    # Vectors persist, and are kept apart by model
+    with EmbeddingCache(vector_db_path, "model-a") as cache:
+        assert cache.get_many(["one"]) == [[0.5, 0.25]]
+    with EmbeddingCache(vector_db_path, "model-b") as cache:
+        assert cache.get_many(["one"]) == [None]
+
+
+def test_embedding_cache_evicts_least_recently_used(temp_dir):
+    """Test that the cache stays within max_entries."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    with EmbeddingCache(vector_db_path, "model", max_entries=10) as cache:
+        for i in range(10):
+            cache.put_many({f"text {i}": [float(i)]})
+        # Use the oldest entry, so that it is kept
+        assert cache.get_many(["text 0"]) == [[0.0]]
+        cache.put_many({"text 10": [10.0]})
+
+        vectors = cache.get_many([f"text {i}" for i in range(11)])
+        kept = [i for i, vector in enumerate(vectors) if vector is not None]
+        assert kept == [0, *range(3, 11)]
+
+
+def test_embedding_model_name():
+    """Test that model names include the output dimensions if set."""
+    assert embedding_model_name(
+        OpenAIEmbeddings(model="text-embedding-3-small", api_key="test")
+    ) == "text-embedding-3-small"
+    assert embedding_model_name(
+        OpenAIEmbeddings(
+            model="text-embedding-3-large", dimensions=256, api_key="test"
+        )
+    ) == "text-embedding-3-large:256"
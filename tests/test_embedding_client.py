@@ -0,0 +1,269 @@
+"""Tests for the asynchronous embedding client."""
+import asyncio
+import base64
+import json
+import os
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from local_dir_rag import embed
+from local_dir_rag.embed import aembed_docs, embed_docs
+from local_dir_rag.embedding_client import AsyncEmbeddingClient, TokenBucket
+
+
+def _fake_embedding(text: str) -> list[float]:
+    """Deterministic embedding of a text."""
+    return [float(len(text)), float(sum(map(ord, text)) % 997), 1.0]
+
+
+class StatusError(Exception):
+    """Error carrying an HTTP status code, as raised by API clients."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FlakyEmbeddings(Embeddings):
+    """Embedding model failing the first requests with given statuses."""
+
+    def __init__(self, statuses: list[int] = None):
+        self.statuses = list(statuses or [])
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [_fake_embedding(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return _fake_embedding(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.requests.append(len(texts))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if self.statuses:
+                raise StatusError(self.statuses.pop(0))
+            return self.embed_documents(texts)
+        finally:
+            self.in_flight -= 1
+
+
+def test_token_bucket_limits_rate():
+    """Test that takes beyond the capacity wait for the refill."""
+    async def take():
+        bucket = TokenBucket(rate_per_minute=1200, capacity=2)
+        started = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # Two tokens are available at once, two more take 50 ms each
+    assert asyncio.run(take()) >= 0.09
+
+
+def test_client_retries_with_smaller_batches(monkeypatch):
+    """Test backoff on 429 and 5xx responses, halving the batch size."""
+    monkeypatch.setattr(
+        "local_dir_rag.embedding_client.INITIAL_BACKOFF_SECONDS", 0.001
+    )
+    model = FlakyEmbeddings(statuses=[429, 503])
+    client = AsyncEmbeddingClient(model, max_batch_size=8)
+    texts = [f"text {i}" for i in range(8)]
+
+    embeddings = asyncio.run(client.aembed_documents(texts))
+
+    assert embeddings == [_fake_embedding(text) for text in texts]
+    # Halved after each failure, then grown back by a quarter
+    assert model.requests == [8, 4, 2, 3, 3]
+    assert client.retries == 2
+
+
+def test_client_does_not_retry_client_errors():
+    """Test that other errors are raised without retrying."""
+    model = FlakyEmbeddings(statuses=[400])
+    client = AsyncEmbeddingClient(model)
+
+    with pytest.raises(StatusError):
+        asyncio.run(client.aembed_documents(["text"]))
+    assert model.requests == [1]
+
+
+def test_client_limits_requests_in_flight():
+    """Test that concurrent calls share the concurrency limit."""
+    model = FlakyEmbeddings()
+    client = AsyncEmbeddingClient(model, max_concurrency=3)
+
+    async def embed_all():
+        return await asyncio.gather(*(
+            client.aembed_documents([f"text {i}"]) for i in range(10)
+        ))
+
+    asyncio.run(embed_all())
+    assert model.max_in_flight == 3
+
+
+class FakeEmbeddingServer(ThreadingHTTPServer):
+    """Local server for the OpenAI embeddings API, with scripted errors."""
+
+    def __init__(self, statuses: list[int]):
+        super().__init__(("127.0.0.1", 0), FakeEmbeddingHandler)
+        self.statuses = list(statuses)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+    """Handler answering embedding requests like the OpenAI API."""
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests.append(len(body["input"]))
+            status = (
+                self.server.statuses.pop(0) if self.server.statuses else 200
+            )
+        if status != 200:
+            self._send(status, {"error": {"message": "try again"}})
+            return
+        data = []
+        for index, text in enumerate(body["input"]):
+            embedding = _fake_embedding(text)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(
+                    struct.pack(f"<{len(embedding)}f", *embedding)
+                ).decode()
+            data.append(
+                {"object": "embedding", "index": index, "embedding": embedding}
+            )
+        self._send(200, {
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def _send(self, status: int, payload: dict) -> None:
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture
+def embedding_server():
+    """Run a fake embedding server failing its first two requests."""
+    server = FakeEmbeddingServer(statuses=[429, 500])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_aembed_docs_against_fake_server(temp_dir, embedding_server):
+    """Test the async path end to end, with rejected requests retried."""
+    docs_dir = os.path.join(temp_dir, "docs")
+    os.makedirs(docs_dir)
+    for i in range(6):
+        with open(
+            os.path.join(docs_dir, f"file{i}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(f"Content of file {i}.")
+
+    def embeddings_model():
+        return OpenAIEmbeddings(
+            model="text-embedding-3-small",
+            base_url=embedding_server.base_url,
+            api_key="test",
+            max_retries=0,
+            check_embedding_ctx_length=False
+        )
+
+    vector_db = asyncio.run(aembed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=os.path.join(temp_dir, "vector_db"),
+        embeddings_model=embeddings_model(),
+        max_batch_size=4,
+        max_concurrency=2,
+        requests_per_minute=6000,
+        embedding_cache_entries=0
+    ))
+
+    assert sorted(embedding_server.requests[:2]) == [2, 4]
+    assert sum(embedding_server.requests[2:]) == 6
+
+    expected_db = embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=os.path.join(temp_dir, "expected_db"),
+        embeddings_model=embeddings_model(),
+        embedding_cache_entries=0
+    )
+
+    def contents(db):
+        return sorted(
+            (
+                db.docstore.search(doc_id).page_content,
+                tuple(db.index.reconstruct(index))
+            )
+            for index, doc_id in db.index_to_docstore_id.items()
+        )
+
+    assert contents(vector_db) == contents(expected_db)
+
+
+def test_aembed_docs_keeps_event_loop_free(temp_dir, monkeypatch):
+    """Test that scanning, hashing, writes and saves run off the loop."""
+    docs_dir = os.path.join(temp_dir, "docs")
+    os.makedirs(docs_dir)
+    for i in range(3):
+        with open(
+            os.path.join(docs_dir, f"file{i}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(f"Content of file {i}.")
+
+    threads = {}
+
+    def record(owner, name):
+        function = getattr(owner, name)
+
+        def recorded(*args, **kwargs):
+            threads[name] = threading.current_thread()
+            return function(*args, **kwargs)
+        monkeypatch.setattr(owner, name, recorded)
+
+    for name in ("_scan_docs_paths", "_plan_files", "save_vector_database"):
+        record(embed, name)
+    record(embed._IndexWriter, "write_batch")
+
+    vector_db = asyncio.run(aembed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=os.path.join(temp_dir, "vector_db"),
+        embeddings_model=FlakyEmbeddings()
+    ))
+
+    assert vector_db.index.ntotal == 3
+    assert set(threads) == {
+        "_scan_docs_paths", "_plan_files", "save_vector_database",
+        "write_batch"
+    }
+    assert threading.main_thread() not in threads.values()
@@ -0,0 +1,102 @@
+"""Tests for the embedding model selection and index information."""
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from local_dir_rag.embed import embed_docs
+from local_dir_rag.embedding_models import (
+    EMBEDDINGS_ENV,
+    QUANTIZED_MODEL_FILE,
+    IndexInfo,
+    LocalEmbeddings,
+    create_embeddings,
+)
+from local_dir_rag.vector_store import load_vector_database
+
+
+class FakeSentenceTransformer:
+    """Stand-in for a sentence-transformers model."""
+
+    def __init__(self, model_name, device=None, **options):
+        self.model_name = model_name
+        self.device = device
+        self.options = options
+        self.batch_sizes = []
+
+    def get_sentence_embedding_dimension(self):
+        return 8
+
+    def encode(self, texts, batch_size, **kwargs):
+        self.batch_sizes.append(batch_size)
+        return np.array(
+            [[float(len(text))] * 8 for text in texts], dtype=np.float32
+        )
+
+
+@pytest.fixture
+def fake_sentence_transformers(monkeypatch):
+    """Replace the sentence-transformers package with a fake model."""
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = FakeSentenceTransformer
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    return module
+
+
+def test_create_local_embeddings(fake_sentence_transformers, monkeypatch):
+    """Local models are selected by specification or environment."""
+    embeddings_model = create_embeddings("local:my-model", quantized=True)
+    assert isinstance(embeddings_model, LocalEmbeddings)
+    assert embeddings_model.model == "local:my-model:int8"
+    assert embeddings_model.dimension == 8
+    assert embeddings_model._model.options == {
+        "backend": "onnx",
+        "model_kwargs": {"file_name": QUANTIZED_MODEL_FILE},
+    }
+    assert embeddings_model.embed_documents(["ab", "abcd"]) == [
+        [2.0] * 8, [4.0] * 8
+    ]
+    assert embeddings_model.embed_query("abc") == [3.0] * 8
+    assert embeddings_model.embed_documents([]) == []
+
+    monkeypatch.setenv(EMBEDDINGS_ENV, "local")
+    assert create_embeddings().model.startswith("local:")
+    with pytest.raises(ValueError):
+        create_embeddings("cohere:embed")
+
+
+def test_index_refuses_other_models(temp_dir):
+    """The model recorded with an index must be used to query it."""
+    docs_dir = os.path.join(temp_dir, "docs")
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    os.makedirs(docs_dir)
+    with open(
+        os.path.join(docs_dir, "file.txt"), "w", encoding="utf-8"
+    ) as f:
+        f.write("Some document text.")
+
+    embeddings_model = DeterministicFakeEmbedding(size=16)
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model
+    )
+    assert IndexInfo.load(vector_db_path) == IndexInfo(
+        "DeterministicFakeEmbedding", 16
+    )
+    assert load_vector_database(vector_db_path, embeddings_model) is not None
+
+    class OtherEmbedding(DeterministicFakeEmbedding):
+        """Another embedding model."""
+
+    with pytest.raises(ValueError):
+        load_vector_database(vector_db_path, OtherEmbedding(size=16))
+    with pytest.raises(ValueError):
+        embed_docs(
+            docs_paths=docs_dir,
+            vector_db_path=vector_db_path,
+            embeddings_model=OtherEmbedding(size=16)
+        )
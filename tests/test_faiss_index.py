@@ -0,0 +1,251 @@
+"""Tests for FAISS index types and parameters."""
+import faiss
+import numpy as np
+import pytest
+
+from local_dir_rag.faiss_index import (
+    IndexConfig,
+    build_index,
+    compare_storage_options,
+    convert_index,
+    describe_index,
+    describe_storage,
+    index_vectors,
+    matches_config,
+    rebuild_without,
+    remove_ivf_vectors,
+    search_parameters,
+    set_search_parameters,
+    supports_ivf_removal,
+    supports_removal,
+)
+
+
+def _vectors(count: int, dimensions: int = 16) -> np.ndarray:
+    """Random vectors in clusters, like embeddings of related texts."""
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(20, dimensions))
+    return (
+        centers[rng.integers(0, 20, count)]
+        + 0.1 * rng.normal(size=(count, dimensions))
+    ).astype(np.float32)
+
+
+def _recall(index: faiss.Index, vectors: np.ndarray, k: int = 10) -> float:
+    """Fraction of the exact nearest neighbours found by an index."""
+    queries = vectors[:50] + 0.01
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, expected = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    return np.mean([
+        len(set(row_found) & set(row_expected)) / k
+        for row_found, row_expected in zip(found, expected)
+    ])
+
+
+@pytest.mark.parametrize("index_type", ["ivf", "hnsw"])
+def test_build_approximate_index(index_type):
+    """Test that approximate indexes keep positions and find neighbours."""
+    vectors = _vectors(2000)
+    index = build_index(IndexConfig(index_type=index_type), vectors)
+
+    assert describe_index(index) == index_type
+    assert index.ntotal == len(vectors)
+    np.testing.assert_allclose(index_vectors(index), vectors, rtol=1e-5)
+    assert _recall(index, vectors) >= 0.9
+
+
+def test_ivf_trains_on_sample():
+    """Test the IVF list count and training sample size."""
+    config = IndexConfig(index_type="ivf", training_sample=500)
+    assert config.nlist_for(2000) == 51
+    assert config.nlist_for(100) == 2
+    assert IndexConfig(index_type="ivf", nlist=8).nlist_for(100) == 8
+
+    index = build_index(config, _vectors(2000))
+    assert faiss.extract_index_ivf(index).nlist == 51
+
+
+def test_set_search_parameters():
+    """Test setting nprobe and efSearch on matching index types."""
+    vectors = _vectors(500)
+    ivf_index = build_index(IndexConfig(index_type="ivf"), vectors)
+    hnsw_index = build_index(IndexConfig(index_type="hnsw"), vectors)
+
+    set_search_parameters(ivf_index, nprobe=3, ef_search=7)
+    set_search_parameters(hnsw_index, nprobe=3, ef_search=7)
+
+    assert faiss.extract_index_ivf(ivf_index).nprobe == 3
+    assert faiss.downcast_index(hnsw_index).hnsw.efSearch == 7
+
+
+def test_convert_index():
+    """Test conversion between index types."""
+    vectors = _vectors(200)
+    flat_index = faiss.IndexFlatL2(vectors.shape[1])
+    flat_index.add(vectors)
+
+    assert convert_index(flat_index, IndexConfig()) is None
+    hnsw_index = convert_index(flat_index, IndexConfig(index_type="hnsw"))
+    assert describe_index(hnsw_index) == "hnsw"
+    np.testing.assert_allclose(index_vectors(hnsw_index), vectors)
+
+    # Too few vectors for the configured number of lists
+    assert convert_index(
+        flat_index, IndexConfig(index_type="ivf", nlist=500)
+    ) is None
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_rebuild_without(index_type):
+    """Test that rebuilding without vectors keeps the others in order."""
+    vectors = _vectors(300)
+    index = build_index(IndexConfig(index_type=index_type), vectors)
+
+    new_index, kept = rebuild_without(index, {0, 5, 299})
+
+    assert kept == [i for i in range(300) if i not in {0, 5, 299}]
+    assert describe_index(new_index) == index_type
+    np.testing.assert_allclose(
+        index_vectors(new_index), vectors[kept], rtol=1e-5
+    )
+
+
+@pytest.mark.parametrize("storage", ["flat", "sq8", "pq"])
+def test_remove_ivf_vectors(storage):
+    """Test that removing IVF vectors moves the last ones into the gaps."""
+    vectors = _vectors(300)
+    config = IndexConfig(index_type="ivf", nlist=4, nprobe=4, storage=storage)
+    index = build_index(config, vectors)
+    expected = index_vectors(index)
+    assert supports_ivf_removal(index)
+
+    moved = remove_ivf_vectors(index, {0, 5, 298})
+
+    assert moved == {297: 0, 299: 5}
+    assert index.ntotal == 297
+    order = [297, *range(1, 5), 299, *range(6, 297)]
+    np.testing.assert_allclose(
+        index_vectors(index), expected[order], rtol=1e-2, atol=1e-2
+    )
+    _, found = index.search(vectors[[297, 299]], 1)
+    assert found[:, 0].tolist() == [0, 5]
+    index.add(vectors[:1])
+    _, found = index.search(vectors[:1], 1)
+    assert found[0, 0] == 297
+
+
+@pytest.mark.parametrize("index_type,storage,rerank_factor", [
+    ("flat", "flat", 0),
+    ("ivf", "flat", 0),
+    ("hnsw", "flat", 0),
+    ("hnsw", "sq8", 4),
+])
+def test_search_parameters(index_type, storage, rerank_factor):
+    """Test searching an index without some of its vectors."""
+    vectors = _vectors(300)
+    index = build_index(IndexConfig(
+        index_type=index_type,
+        nlist=4,
+        nprobe=4,
+        storage=storage,
+        rerank_factor=rerank_factor
+    ), vectors)
+    selector = faiss.IDSelectorNot(
+        faiss.IDSelectorBatch(np.array([0, 1, 2], dtype=np.int64))
+    )
+
+    _, found = index.search(
+        vectors[:3], 5, params=search_parameters(index, selector)
+    )
+
+    assert not set(found.ravel()) & {0, 1, 2}
+    assert (found >= 0).all()
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+@pytest.mark.parametrize("storage", ["sq8", "fp16", "pq"])
+def test_compressed_storage(index_type, storage):
+    """Test that compressed indexes are smaller and re-rank exactly."""
+    vectors = _vectors(1000)
+    config = IndexConfig(index_type=index_type, storage=storage)
+    index = build_index(config, vectors)
+    reranked_config = IndexConfig(
+        index_type=index_type, storage=storage, rerank_factor=8
+    )
+    reranked_index = build_index(reranked_config, vectors)
+
+    assert describe_index(index) == index_type
+    assert describe_storage(index) == storage
+    assert matches_config(index, config)
+    assert not matches_config(index, reranked_config)
+    assert matches_config(reranked_index, reranked_config)
+    assert faiss.downcast_index(reranked_index).k_factor == 8
+
+    flat_index = build_index(IndexConfig(index_type=index_type), vectors)
+    assert len(faiss.serialize_index(index)) < len(
+        faiss.serialize_index(flat_index)
+    )
+    assert _recall(reranked_index, vectors) >= 0.9
+    # Re-ranking indexes keep the float32 vectors
+    np.testing.assert_allclose(
+        index_vectors(reranked_index), vectors, rtol=1e-5
+    )
+    assert not supports_removal(reranked_index)
+    new_index, kept = rebuild_without(reranked_index, {3})
+    assert matches_config(new_index, reranked_config)
+    np.testing.assert_allclose(
+        index_vectors(new_index), vectors[kept], rtol=1e-5
+    )
+
+
+def test_product_quantizer_size():
+    """Test the default product quantizer size and training minimum."""
+    config = IndexConfig(storage="pq")
+    assert config.pq_m_for(1536) == 192
+    assert config.pq_m_for(100) == 10
+    assert IndexConfig(storage="pq", pq_m=8).pq_m_for(1536) == 8
+    assert config.min_training_vectors(100) == 256
+
+    flat_index = faiss.IndexFlatL2(16)
+    flat_index.add(_vectors(100))
+    assert convert_index(flat_index, config) is None
+
+
+def test_compare_storage_options():
+    """Test the memory and recall report of each storage option."""
+    reports = compare_storage_options(
+        _vectors(500), IndexConfig(), k=5, query_count=20
+    )
+
+    assert [
+        (report.storage, report.rerank_factor) for report in reports
+    ] == [
+        ("flat", 0),
+        ("sq8", 0),
+        ("sq8", 4),
+        ("fp16", 0),
+        ("fp16", 4),
+        ("pq", 0),
+        ("pq", 4),
+    ]
+    assert reports[0].recall == 1.0
+    assert reports[1].memory_bytes < reports[0].memory_bytes
+    assert reports[5].memory_bytes < reports[0].memory_bytes
+
+
+def test_config_round_trip(temp_dir):
+    """Test saving and loading the index configuration."""
+    assert IndexConfig.load(temp_dir) is None
+
+    config = IndexConfig(
+        index_type="hnsw", m=16, ef_search=100, storage="sq8"
+    )
+    config.save(temp_dir)
+
+    assert IndexConfig.load(temp_dir) == config
+    with pytest.raises(ValueError):
+        IndexConfig(index_type="lsh")
+    with pytest.raises(ValueError):
+        IndexConfig(storage="sq4")
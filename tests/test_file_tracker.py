@@ -2,11 +2,14 @@
 import os
 import sqlite3
 
+import pytest
+
 from local_dir_rag.file_tracker import (
     FileTracker,
     FileStatus,
     FileState,
     compute_file_checksum,
+    compute_file_checksums,
 )
 
 
@@ -330,3 +333,436 @@ def test_file_status_dataclass():
     assert status_unchanged.is_new is False
     assert status_unchanged.is_modified is False
     assert status_unchanged.needs_indexing is False
+
+
+def _write_old_file(file_path: str, content: str) -> int:
+    """Write a file and set its modification time an hour in the past."""
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    mtime_ns = os.stat(file_path).st_mtime_ns - 3600 * 1_000_000_000
+    os.utime(file_path, ns=(mtime_ns, mtime_ns))
+    return mtime_ns
+
+
+def test_unchanged_stat_skips_hashing(temp_dir, monkeypatch):
+    """Test that unchanged stat data short-circuits without hashing."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    tracker = FileTracker(vector_db_path)
+
+    file_path = os.path.join(temp_dir, "stable.txt")
+    _write_old_file(file_path, "stable content")
+    tracker.update_file_checksum(file_path)
+
+    def fail_checksums(_file_path, _algorithms):
+        raise AssertionError("File should not be hashed")
+
+    monkeypatch.setattr(
+        "local_dir_rag.file_tracker.compute_file_checksums",
+        fail_checksums
+    )
+    status = tracker.get_file_status(file_path)
+    assert status.state == FileState.UNCHANGED
+
+
+def test_verify_checksums_detects_same_stat_change(temp_dir):
+    """Test that verify mode hashes files even with unchanged stat data."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    file_path = os.path.join(temp_dir, "same_stat.txt")
+    mtime_ns = _write_old_file(file_path, "content one")
+    FileTracker(vector_db_path).update_file_checksum(file_path)
+
+    # Same size and modification time, different content
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("content two")
+    os.utime(file_path, ns=(mtime_ns, mtime_ns))
+
+    fast_tracker = FileTracker(vector_db_path)
+    assert fast_tracker.get_file_status(file_path).is_modified is False
+
+    verifying_tracker = FileTracker(vector_db_path, verify_checksums=True)
+    assert verifying_tracker.get_file_status(file_path).is_modified is True
+
+
+def test_recently_modified_file_is_hashed(temp_dir, monkeypatch):
+    """Test that stat data recorded right after a write is not trusted."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    tracker = FileTracker(vector_db_path)
+
+    file_path = os.path.join(temp_dir, "fresh.txt")
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("fresh content")
+    tracker.update_file_checksum(file_path)
+
+    calls = []
+    original = compute_file_checksums
+    monkeypatch.setattr(
+        "local_dir_rag.file_tracker.compute_file_checksums",
+        lambda path, algorithms: calls.append(path) or original(
+            path, algorithms
+        )
+    )
+    status = tracker.get_file_status(file_path)
+    assert status.state == FileState.UNCHANGED
+    assert calls == [file_path]
+
+
+def test_touched_file_refreshes_stat(temp_dir):
+    """Test that a touched but unchanged file records its new stat data."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    tracker = FileTracker(vector_db_path)
+
+    file_path = os.path.join(temp_dir, "touched.txt")
+    mtime_ns = _write_old_file(file_path, "touched content")
+    tracker.update_file_checksum(file_path)
+
+    new_mtime_ns = mtime_ns + 60 * 1_000_000_000
+    os.utime(file_path, ns=(new_mtime_ns, new_mtime_ns))
+
+    status = tracker.get_file_status(file_path)
+    assert status.state == FileState.UNCHANGED
+
+    conn = sqlite3.connect(tracker.db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT mtime_ns FROM file_checksums WHERE file_name = ?",
+            ("touched.txt",)
+        )
+        assert cursor.fetchone()[0] == new_mtime_ns
+    finally:
+        conn.close()
+
+
+def test_file_tracker_migrates_old_schema(temp_dir):
+    """Test that databases without stat columns are upgraded."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    os.makedirs(vector_db_path)
+    conn = sqlite3.connect(os.path.join(vector_db_path, "file_tracker.db"))
+    try:
+        conn.execute("""
+            CREATE TABLE file_checksums (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                directory_path TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                file_size INTEGER,
+                indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (directory_path, file_name)
+            )
+        """)
+        conn.execute(
+            "INSERT INTO file_checksums "
+            "(directory_path, file_name, checksum, file_size) "
+            "VALUES (?, ?, ?, ?)",
+            (temp_dir, "legacy.txt", "0" * 64, 1)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    tracker = FileTracker(vector_db_path)
+    conn = sqlite3.connect(tracker.db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_info(file_checksums)")
+        columns = {row[1] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+    assert {"mtime_ns", "inode"} <= columns
+
+    # Legacy rows have no stat data, so the file is hashed and compared
+    file_path = os.path.join(temp_dir, "legacy.txt")
+    _write_old_file(file_path, "legacy content")
+    assert tracker.get_file_status(file_path).is_modified is True
+
+
+def test_compute_file_checksum_algorithms(temp_dir):
+    """Test the selectable checksum algorithms."""
+    file_path = os.path.join(temp_dir, "algorithms.txt")
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("algorithm content")
+
+    assert len(compute_file_checksum(file_path, "blake2b")) == 128
+    assert len(compute_file_checksum(file_path, "xxh3_64")) == 16
+
+    checksums = compute_file_checksums(file_path, ("sha256", "blake2b"))
+    assert checksums["sha256"] == compute_file_checksum(file_path)
+    assert checksums["blake2b"] == compute_file_checksum(
+        file_path, "blake2b"
+    )
+
+    with pytest.raises(ValueError):
+        compute_file_checksum(file_path, "crc32")
+
+
+def test_get_file_statuses(temp_dir):
+    """Test bulk status of new, modified and unchanged files."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    tracker = FileTracker(vector_db_path, max_workers=4)
+
+    unchanged = os.path.join(temp_dir, "unchanged.txt")
+    modified = os.path.join(temp_dir, "modified.txt")
+    new = os.path.join(temp_dir, "new.txt")
+    _write_old_file(unchanged, "unchanged content")
+    _write_old_file(modified, "original content")
+    tracker.update_file_checksum(unchanged)
+    tracker.update_file_checksum(modified)
+
+    _write_old_file(modified, "modified content, longer")
+    _write_old_file(new, "new content")
+
+    statuses = tracker.get_file_statuses([unchanged, modified, new])
+    assert [status.file_path for status in statuses] == [
+        unchanged, modified, new
+    ]
+    assert [status.state for status in statuses] == [
+        FileState.UNCHANGED, FileState.MODIFIED, FileState.NEW
+    ]
+    assert statuses[1].checksum == compute_file_checksum(modified)
+    assert statuses[2].checksum == compute_file_checksum(new)
+
+
+def test_update_with_status_does_not_rehash(temp_dir, monkeypatch):
+    """Test that the checksum computed for the status is recorded."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    tracker = FileTracker(vector_db_path)
+
+    file_path = os.path.join(temp_dir, "hash_once.txt")
+    _write_old_file(file_path, "hash once")
+    status = tracker.get_file_status(file_path)
+
+    def fail_checksums(_file_path, _algorithms):
+        raise AssertionError("File should not be hashed again")
+
+    monkeypatch.setattr(
+        "local_dir_rag.file_tracker.compute_file_checksums",
+        fail_checksums
+    )
+    tracker.update_file_checksum(file_path, status)
+    assert tracker.get_file_status(file_path).state == FileState.UNCHANGED
+
+
+def test_change_checksum_algorithm(temp_dir):
+    """Test comparing files recorded with another checksum algorithm."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    file_path = os.path.join(temp_dir, "algorithm_change.txt")
+    _write_old_file(file_path, "algorithm change")
+    FileTracker(vector_db_path).update_file_checksum(file_path)
+
+    tracker = FileTracker(
+        vector_db_path,
+        verify_checksums=True,
+        checksum_algorithm="blake2b"
+    )
+    status = tracker.get_file_status(file_path)
+    assert status.state == FileState.UNCHANGED
+    assert status.checksum == compute_file_checksum(file_path, "blake2b")
+
+    # The record is migrated to the configured algorithm
+    conn = sqlite3.connect(tracker.db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT checksum, checksum_algorithm FROM file_checksums"
+        )
+        assert cursor.fetchone() == (status.checksum, "blake2b")
+    finally:
+        conn.close()
+
+    _write_old_file(file_path, "algorithm change, modified")
+    assert tracker.get_file_status(file_path).is_modified is True
+
+
+def test_file_tracker_uses_wal_journal(temp_dir):
+    """Test that the tracker database is switched to WAL journaling."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    with FileTracker(vector_db_path) as tracker:
+        conn = sqlite3.connect(tracker.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA journal_mode")
+            assert cursor.fetchone()[0] == "wal"
+        finally:
+            conn.close()
+
+
+def test_file_tracker_close(temp_dir):
+    """Test that the context manager closes the shared connection."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    with FileTracker(vector_db_path) as tracker:
+        assert tracker.get_all_tracked_files() == []
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        tracker.get_all_tracked_files()
+
+
+def test_batch_update_and_remove(temp_dir):
+    """Test batched checksum updates and removals."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    tracker = FileTracker(vector_db_path)
+
+    file_paths = []
+    for i in range(5):
+        file_path = os.path.join(temp_dir, f"batch_{i}.txt")
+        _write_old_file(file_path, f"batch content {i}")
+        file_paths.append(file_path)
+
+    statuses = tracker.get_file_statuses(file_paths)
+    assert all(status.is_new for status in statuses)
+    tracker.update_file_checksums(statuses)
+    assert set(tracker.get_all_tracked_files()) == set(file_paths)
+
+    tracker.remove_files(file_paths[:3])
+    assert set(tracker.get_all_tracked_files()) == set(file_paths[3:])
+
+
+def test_get_deleted_files_many(temp_dir):
+    """Test the SQL set difference with many tracked files."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    tracker = FileTracker(vector_db_path)
+
+    directory_path = os.path.join(temp_dir, "many")
+    statuses = [
+        FileStatus(
+            file_path=os.path.join(directory_path, f"file_{i}.txt"),
+            state=FileState.NEW,
+            checksum=f"{i:064x}",
+            checksum_algorithm="sha256",
+            file_stat=os.stat(temp_dir)
+        )
+        for i in range(1000)
+    ]
+    tracker.update_file_checksums(statuses)
+
+    current_files = [
+        status.file_path for i, status in enumerate(statuses) if i % 10
+    ]
+    # Duplicates in the current file list are tolerated
+    current_files.extend(current_files[:5])
+    deleted = tracker.get_deleted_files(current_files)
+
+    assert sorted(deleted) == sorted(
+        status.file_path for i, status in enumerate(statuses) if i % 10 == 0
+    )
+    # The temporary table does not leak into the next call
+    assert len(tracker.get_deleted_files([])) == 1000
+
+
+def test_chunk_ids(temp_dir):
+    """Test recording, replacing and removing the chunk ids of files."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    tracker = FileTracker(vector_db_path)
+
+    file_paths = []
+    for i in range(3):
+        file_path = os.path.join(temp_dir, f"chunks_{i}.txt")
+        _write_old_file(file_path, f"chunk content {i}")
+        file_paths.append(file_path)
+    statuses = tracker.get_file_statuses(file_paths)
+
+    # Files tracked without chunk ids have no recorded ids
+    tracker.update_file_checksums(statuses[:1])
+    assert tracker.get_chunk_ids(file_paths) == {}
+
+    tracker.update_file_checksums(statuses, {
+        file_paths[0]: ["a", "b"],
+        file_paths[1]: [],
+        file_paths[2]: ["c"],
+    })
+    assert tracker.get_chunk_ids(file_paths) == {
+        file_paths[0]: ["a", "b"],
+        file_paths[1]: [],
+        file_paths[2]: ["c"],
+    }
+    assert tracker.get_chunk_counts() == [
+        (file_paths[0], 2), (file_paths[1], 0), (file_paths[2], 1)
+    ]
+
+    # Refreshing a record without chunk ids keeps the recorded ones
+    tracker.update_file_checksums(statuses[:1])
+    assert tracker.get_chunk_ids(file_paths[:1]) == {file_paths[0]: ["a", "b"]}
+
+    tracker.mark_files_incomplete({file_paths[0]: ["a", "b", "d"]})
+    assert tracker.get_chunk_ids(file_paths[:1]) == {
+        file_paths[0]: ["a", "b", "d"]
+    }
+    assert tracker.get_file_status(file_paths[0]).is_modified
+
+    tracker.remove_files(file_paths[:2])
+    assert tracker.get_chunk_ids(file_paths) == {file_paths[2]: ["c"]}
+    assert tracker.get_chunk_counts() == [(file_paths[2], 1)]
+
+
+def test_shared_chunk_ids(temp_dir):
+    """Test finding chunks that other files also reference."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    tracker = FileTracker(vector_db_path)
+
+    file_paths = []
+    for i in range(3):
+        file_path = os.path.join(temp_dir, f"shared_{i}.txt")
+        _write_old_file(file_path, f"chunk content {i}")
+        file_paths.append(file_path)
+    tracker.update_file_checksums(tracker.get_file_statuses(file_paths), {
+        file_paths[0]: ["a", "b", "c"],
+        file_paths[1]: ["b", "d"],
+        file_paths[2]: ["c", "d"],
+    })
+
+    assert tracker.get_shared_chunk_ids(
+        ["a", "b", "c"], file_paths[:1]
+    ) == {"b", "c"}
+    assert tracker.get_shared_chunk_ids(
+        ["a", "b", "c", "d"], file_paths[:2]
+    ) == {"c", "d"}
+    assert tracker.get_shared_chunk_ids(["a", "d"], file_paths) == set()
+    assert tracker.get_chunk_references(
+        ["a", "b", "c", "d"], file_paths[:1]
+    ) == {
+        "b": [file_paths[1]],
+        "c": [file_paths[2]],
+        "d": [file_paths[1], file_paths[2]],
+    }
+    assert tracker.get_chunk_totals() == (7, 4)
+
+
+def test_files_deleted_after_scan(temp_dir):
+    """Test that files deleted during a run are reported as deleted."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    tracker = FileTracker(vector_db_path)
+
+    file_paths = []
+    for i in range(3):
+        file_path = os.path.join(temp_dir, f"vanished_{i}.txt")
+        _write_old_file(file_path, f"vanished content {i}")
+        file_paths.append(file_path)
+    tracker.update_file_checksums(tracker.get_file_statuses(file_paths[:1]))
+    # Changed, so the tracked file is hashed, then deleted after the scan
+    _write_old_file(file_paths[0], "changed content")
+    file_stats = {file_path: os.stat(file_path) for file_path in file_paths}
+    for file_path in file_paths[:2]:
+        os.remove(file_path)
+
+    statuses = tracker.get_file_statuses(file_paths, file_stats)
+    assert [status.state for status in statuses] == [
+        FileState.DELETED, FileState.DELETED, FileState.NEW
+    ]
+    assert statuses[0].checksum is not None
+    assert statuses[1].checksum is None
+    assert not any(status.needs_indexing for status in statuses[:2])
+
+    # A file deleted before its checksum is recorded is kept only if the
+    # index holds chunks of it, as incomplete
+    tracker.update_file_checksums(
+        [
+            FileStatus(file_path=file_path, state=FileState.NEW)
+            for file_path in file_paths
+        ],
+        {file_paths[1]: ["a"], file_paths[2]: ["b"]}
+    )
+    assert tracker.get_chunk_ids(file_paths) == {
+        file_paths[1]: ["a"], file_paths[2]: ["b"]
+    }
+    assert sorted(tracker.get_deleted_files(file_paths[2:])) == sorted(
+        file_paths[:2]
+    )
@@ -0,0 +1,133 @@
+"""Tests for the keyword index and hybrid search."""
+import os
+import sqlite3
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from local_dir_rag.embed import embed_docs
+from local_dir_rag.keyword_index import (
+    KEYWORD_INDEX_FILE,
+    KeywordIndex,
+    hybrid_search,
+    keyword_query,
+    reciprocal_rank_fusion,
+)
+from local_dir_rag.vector_store import load_vector_database
+
+
+def test_keyword_query_matches_identifiers():
+    """Identifiers are matched as phrases and by their parts."""
+    assert keyword_query("Where is XJ-200B?") == (
+        '"Where" OR "is" OR "XJ 200B" OR "XJ" OR "200B"'
+    )
+    assert keyword_query("?!") is None
+
+
+def test_update_and_search(temp_dir):
+    """Chunks are found by keyword until they are deleted."""
+    with KeywordIndex(temp_dir) as keyword_index:
+        keyword_index.update(added=[
+            ("1", "a.txt", "The XJ-200B pump is rated for 40 bar."),
+            ("2", "a.txt", "The XJ-300 pump is rated for 60 bar."),
+            ("3", "b.txt", "Maintenance schedule for all pumps."),
+        ])
+        assert keyword_index.count() == 3
+        assert keyword_index.search("XJ-200B rating", 3)[0] == "1"
+        assert keyword_index.search("maintenance", 3) == ["3"]
+        assert keyword_index.search("", 3) == []
+
+        keyword_index.update(deleted=["1", "missing"])
+        assert keyword_index.count() == 2
+        assert "1" not in keyword_index.search("XJ-200B", 3)
+
+
+
+def test_readded_chunk_replaces_its_words(temp_dir):
+    """A chunk added again under its id leaves no stale words behind."""
+    with KeywordIndex(temp_dir) as keyword_index:
+        keyword_index.update(added=[("a", "s.txt", "zebra alpha")])
+        keyword_index.update(added=[("a", "s.txt", "yak beta")])
+
+        assert keyword_index.count() == 1
+        assert keyword_index.search("zebra", 3) == []
+        assert keyword_index.search("yak", 3) == ["a"]
+    conn = sqlite3.connect(os.path.join(temp_dir, KEYWORD_INDEX_FILE))
+    try:
+        conn.execute(
+            "INSERT INTO chunks_fts (chunks_fts, rank) "
+            "VALUES ('integrity-check', 1)"
+        )
+    finally:
+        conn.close()
+
+
+def test_reciprocal_rank_fusion():
+    """Documents ranked by both lists come first."""
+    docs = {name: Document(id=name, page_content=name) for name in "abcd"}
+    fused = reciprocal_rank_fusion(
+        [
+            [docs["a"], docs["b"], docs["c"]],
+            [docs["d"], docs["c"], docs["a"]],
+        ],
+        k=3
+    )
+    assert [doc.id for doc in fused] == ["a", "c", "d"]
+
+
+def test_embed_maintains_keyword_index(temp_dir):
+    """The keyword index follows added, modified and deleted files, and
+    hybrid search finds identifiers."""
+    docs_dir = os.path.join(temp_dir, "docs")
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    os.makedirs(docs_dir)
+    for i in range(20):
+        with open(
+            os.path.join(docs_dir, f"file{i}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(f"General notes number {i}.")
+    with open(
+        os.path.join(docs_dir, "part.txt"), "w", encoding="utf-8"
+    ) as f:
+        f.write("Replacement part QZ-4471 fits the older housing.")
+    embeddings_model = DeterministicFakeEmbedding(size=16)
+
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model
+    )
+    vector_db = load_vector_database(vector_db_path, embeddings_model)
+    with KeywordIndex(vector_db_path) as keyword_index:
+        assert keyword_index.count() == 21
+        results = hybrid_search(
+            vector_db, keyword_index, "Which part is QZ-4471?", k=2
+        )
+        assert len(results) == 2
+        assert any("QZ-4471" in doc.page_content for doc in results)
+
+    os.remove(os.path.join(docs_dir, "part.txt"))
+    with open(
+        os.path.join(docs_dir, "file0.txt"), "w", encoding="utf-8"
+    ) as f:
+        f.write("Rewritten notes.")
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model
+    )
+    with KeywordIndex(vector_db_path) as keyword_index:
+        assert keyword_index.count() == 20
+        assert keyword_index.search("QZ-4471", 5) == []
+        assert len(keyword_index.search("rewritten", 5)) == 1
+        assert len(keyword_index.search("General", 25)) == 19
+
+    # A database without a keyword index gets one from its chunks
+    os.remove(os.path.join(vector_db_path, KEYWORD_INDEX_FILE))
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model
+    )
+    with KeywordIndex(vector_db_path) as keyword_index:
+        assert keyword_index.count() == 20
@@ -0,0 +1,69 @@
+"""Tests for the command line entry point."""
+import json
+import subprocess
+import sys
+
+# Packages that take seconds to import, which only the commands that use
+# them may load
+HEAVY_PACKAGES = (
+    "faiss",
+    "langchain_community",
+    "langchain_core",
+    "langchain_openai",
+    "langchain_text_splitters",
+    "openai",
+    "sentence_transformers",
+    "torch",
+)
+
+# Importing the command line took over two seconds with the heavy
+# packages; without them it takes a fraction of a second
+MAX_IMPORT_SECONDS = 1.0
+
+
+def _run_python(*args: str) -> subprocess.CompletedProcess:
+    """Run a fresh interpreter, so no module is imported already."""
+    return subprocess.run(
+        [sys.executable, *args],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+
+def test_import_loads_no_heavy_packages():
+    """Parsing the command line does not import LangChain or FAISS."""
+    result = _run_python(
+        "-c",
+        "import json, sys\n"
+        "import local_dir_rag.main\n"
+        "print(json.dumps(sorted(sys.modules)))"
+    )
+    modules = json.loads(result.stdout)
+    loaded = [
+        module for module in modules
+        if module.split(".")[0] in HEAVY_PACKAGES
+    ]
+    assert not loaded
+
+
+def test_import_time():
+    """Import time regression benchmark of the command line."""
+    result = _run_python("-X", "importtime", "-c", "import local_dir_rag.main")
+    # Lines read "import time: <self us> | <cumulative us> | <module>"
+    cumulative = {
+        fields[2].strip(): int(fields[1])
+        for fields in (
+            line.split(":", 1)[1].split("|")
+            for line in result.stderr.splitlines()
+            if line.startswith("import time:") and "[us]" not in line
+        )
+    }
+    assert cumulative["local_dir_rag.main"] / 1e6 < MAX_IMPORT_SECONDS
+
+
+def test_help():
+    """Help is printed for each command."""
+    for command in ("embed", "query", "stats", "benchmark"):
+        result = _run_python("-m", "local_dir_rag.main", command, "--help")
+        assert "usage:" in result.stdout
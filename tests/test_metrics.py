@@ -0,0 +1,90 @@
+"""Tests for the ingest run metrics."""
+import json
+import os
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from local_dir_rag.embed import embed_docs
+from local_dir_rag.metrics import Histogram, RunMetrics
+
+
+def test_histogram_buckets():
+    """Observations are counted in cumulative buckets."""
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.cumulative_counts() == [2, 3]
+    assert histogram.count == 4
+    assert histogram.as_dict()["sum"] == 2.65
+
+
+def test_progress():
+    """Progress is measured in bytes, with an estimate of the time left."""
+    metrics = RunMetrics()
+    assert metrics.progress() == "0/0 files"
+    metrics.start_files(4, 1000)
+    metrics.add_files(1, 3, 250)
+    assert metrics.progress().startswith("1/4 files, 25%, ETA ")
+
+
+def test_embed_writes_run_report(temp_dir):
+    """A run records every stage, and saves JSON and Prometheus reports."""
+    docs_dir = os.path.join(temp_dir, "docs")
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    os.makedirs(docs_dir)
+    for i in range(3):
+        with open(
+            os.path.join(docs_dir, f"file{i}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(f"Document number {i}. " * 40)
+
+    metrics = RunMetrics()
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=DeterministicFakeEmbedding(size=8),
+        metrics=metrics
+    )
+    report = metrics.as_dict()
+    assert report["files"] == 3
+    assert report["counters"]["files_hashed"] == 3
+    assert report["counters"]["bytes_hashed"] == sum(
+        os.path.getsize(os.path.join(docs_dir, name))
+        for name in os.listdir(docs_dir)
+    )
+    assert report["counters"]["pages_parsed"] == 3
+    assert report["counters"]["chunks_embedded"] == report["chunks"]
+    assert report["counters"]["tokens_embedded"] > 0
+    assert report["histograms"]["embedding_request_seconds"]["count"] == (
+        report["counters"]["embedding_requests"]
+    )
+    assert report["histograms"]["save_seconds"]["count"] >= 1
+    assert report["histograms"]["file_load_seconds"]["count"] == 3
+
+    json_path = os.path.join(temp_dir, "report.json")
+    metrics.write_json(json_path)
+    with open(json_path, encoding="utf-8") as f:
+        assert json.load(f)["counters"] == report["counters"]
+
+    prom_path = os.path.join(temp_dir, "ingest.prom")
+    metrics.write_prometheus(prom_path)
+    with open(prom_path, encoding="utf-8") as f:
+        text = f.read()
+    assert "local_dir_rag_ingest_files 3" in text
+    assert 'local_dir_rag_ingest_stage_seconds{stage="hash"}' in text
+    assert (
+        'local_dir_rag_ingest_embedding_request_seconds_bucket{le="+Inf"}'
+        in text
+    )
+
+    # An unchanged corpus is skipped without embedding
+    metrics = RunMetrics()
+    embed_docs(
+        docs_paths=docs_dir,
+        vector_db_path=vector_db_path,
+        embeddings_model=DeterministicFakeEmbedding(size=8),
+        metrics=metrics
+    )
+    assert metrics.counters["files_skipped"] == 3
+    assert metrics.counters["chunks_embedded"] == 0
+    assert metrics.files == 0
@@ -0,0 +1,159 @@
+"""Tests for the query with RAG module."""
+import io
+import os
+
+import langchain_openai
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings.fake import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import (
+    GenericFakeChatModel,
+)
+from langchain_core.messages import AIMessage
+
+from local_dir_rag.answer_cache import AnswerCache
+from local_dir_rag.docstore import SQLiteDocstore
+from local_dir_rag.query_with_rag import (
+    answer_question,
+    create_rag_chain,
+    query_loop,
+    stream_answer,
+)
+from local_dir_rag.vector_store import (
+    load_vector_database,
+    migrate_docstore,
+    save_vector_database,
+)
+
+
+class RecordingOutput(io.StringIO):
+    """Text stream recording each write."""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def write(self, text: str) -> int:
+        self.writes.append(text)
+        return super().write(text)
+
+
+def test_stream_answer_writes_tokens_as_they_arrive(sample_documents):
+    """Test that the answer is written token by token and timed."""
+    vector_db = FAISS.from_documents(
+        sample_documents, DeterministicFakeEmbedding(size=16)
+    )
+    chat_model = GenericFakeChatModel(
+        messages=iter([AIMessage(content="RAG combines retrieval and LLMs.")])
+    )
+    rag_chain = create_rag_chain(vector_db, chat_model, k=2)
+    output = RecordingOutput()
+
+    answer, time_to_first_token = stream_answer(
+        rag_chain, "What is RAG?", output
+    )
+
+    assert answer == "RAG combines retrieval and LLMs."
+    assert output.getvalue() == answer + "\n"
+    # The fake model streams one word at a time
+    assert output.writes[:2] == ["RAG", " "]
+    assert time_to_first_token is not None and time_to_first_token >= 0
+
+
+def test_answer_question_uses_answer_cache(sample_documents, temp_dir):
+    """Test that repeated and similar questions skip retrieval and LLM."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    vector_db = FAISS.from_documents(
+        sample_documents, DeterministicFakeEmbedding(size=16)
+    )
+    save_vector_database(vector_db, vector_db_path)
+    # The fake model has a single answer, so a second call would fail
+    chat_model = GenericFakeChatModel(
+        messages=iter([AIMessage(content="An answer.")])
+    )
+    rag_chain = create_rag_chain(vector_db, chat_model, k=2)
+
+    with AnswerCache(vector_db_path, similarity_threshold=0.99) as cache:
+        for question in ["What is RAG?", "what is rag", "What is RAG?!"]:
+            output = io.StringIO()
+            assert answer_question(
+                rag_chain, vector_db, question, cache, output
+            ) == "An answer."
+            assert output.getvalue() == "An answer.\n"
+        assert cache.hits == 2
+
+
+def test_query_loop_loads_while_prompting(
+    sample_documents, temp_dir, monkeypatch, capsys
+):
+    """Test that the session loads in the background of the first prompt."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    embeddings_model = DeterministicFakeEmbedding(size=16)
+    save_vector_database(
+        FAISS.from_documents(sample_documents, embeddings_model),
+        vector_db_path
+    )
+    monkeypatch.setattr(
+        langchain_openai,
+        "ChatOpenAI",
+        lambda **kwargs: GenericFakeChatModel(
+            messages=iter([AIMessage(content="An answer.")])
+        )
+    )
+    prompts = iter(["What is RAG?", "exit"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(prompts))
+
+    query_loop(vector_db_path, k=2, embeddings_model=embeddings_model)
+    output = capsys.readouterr().out
+    assert output.index("Local RAG Chat Session") < output.index(
+        "An answer."
+    )
+    assert "Exiting chat session." in output
+
+
+def test_query_loop_closes_replaced_database(
+    sample_documents, temp_dir, monkeypatch
+):
+    """Test that a reload closes the docstore of the replaced database."""
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    embeddings_model = DeterministicFakeEmbedding(size=16)
+    save_vector_database(
+        FAISS.from_documents(sample_documents, embeddings_model),
+        vector_db_path
+    )
+    migrate_docstore(vector_db_path)
+    monkeypatch.setattr(
+        langchain_openai,
+        "ChatOpenAI",
+        lambda **kwargs: GenericFakeChatModel(
+            messages=iter([AIMessage(content="An answer.")] * 2)
+        )
+    )
+    opened = []
+    original_init = SQLiteDocstore.__init__
+
+    def recording_init(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        opened.append(self)
+
+    monkeypatch.setattr(SQLiteDocstore, "__init__", recording_init)
+
+    def save_again():
+        vector_db = load_vector_database(vector_db_path, embeddings_model)
+        vector_db.add_texts(["A new document."])
+        save_vector_database(vector_db, vector_db_path)
+        vector_db.docstore.close()
+        return "What is new?"
+
+    prompts = iter([
+        lambda: "What is RAG?", save_again, lambda: "exit"
+    ])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(prompts)())
+
+    query_loop(
+        vector_db_path,
+        k=2,
+        use_answer_cache=False,
+        embeddings_model=embeddings_model
+    )
+    assert len(opened) >= 3
+    assert all(docstore._conn is None for docstore in opened)
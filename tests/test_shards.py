@@ -0,0 +1,153 @@
+"""Tests for sharded vector databases."""
+import os
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from local_dir_rag.embed import embed_docs
+from local_dir_rag.shards import (
+    ShardConfig,
+    ShardedVectorStore,
+    list_shards,
+    shard_path,
+)
+from local_dir_rag.vector_store import get_index_version, load_vector_database
+
+
+def _write(path: str, text: str) -> None:
+    """Write a text file, creating its directory."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_shard_for_partitions(temp_dir):
+    """Files are assigned to shards by documents directory or subdirectory."""
+    docs_a = os.path.join(temp_dir, "a")
+    docs_b = os.path.join(temp_dir, "b")
+
+    assert ShardConfig().shard_for(
+        os.path.join(docs_a, "x.txt"), [docs_a]
+    ) == ""
+
+    by_root = ShardConfig("root")
+    shard_a = by_root.shard_for(os.path.join(docs_a, "s", "x.txt"), [
+        docs_a, docs_b
+    ])
+    assert shard_a.startswith("a-")
+    assert by_root.shard_for(os.path.join(docs_a, "y.txt"), [
+        docs_a, docs_b
+    ]) == shard_a
+    assert by_root.shard_for(
+        os.path.join(docs_b, "x.txt"), [docs_a, docs_b]
+    ) != shard_a
+    # Files of a documents directory that is no longer indexed
+    assert by_root.shard_for(
+        os.path.join(docs_a, "z.txt"), [docs_b]
+    ) == shard_a
+    assert by_root.shard_for(os.path.join(temp_dir, "c.txt"), []) is None
+
+    by_subdirectory = ShardConfig("subdirectory")
+    shards = {
+        by_subdirectory.shard_for(os.path.join(docs_a, *parts), [docs_a])
+        for parts in (("x.txt",), ("s", "x.txt"), ("s", "t", "y.txt"))
+    }
+    assert len(shards) == 2
+    assert sorted(by_subdirectory.partitions.values()) == [
+        docs_a, os.path.join(docs_a, "s")
+    ]
+
+    with pytest.raises(ValueError):
+        ShardConfig("month")
+
+
+def test_sharded_search_matches_single_index():
+    """Merged shard results equal the results of one index."""
+    embeddings = DeterministicFakeEmbedding(size=16)
+    texts = [f"Document number {i}" for i in range(20)]
+    single = FAISS.from_texts(texts, embeddings)
+    sharded = ShardedVectorStore({
+        "even": FAISS.from_texts(texts[::2], embeddings),
+        "odd": FAISS.from_texts(texts[1::2], embeddings),
+    })
+
+    for query in ("Document number 4", "Something else"):
+        expected = single.similarity_search_with_score(query, k=5)
+        results = sharded.similarity_search_with_score_by_vector(
+            embeddings.embed_query(query), k=5
+        )
+        assert [doc.page_content for doc, _ in results] == [
+            doc.page_content for doc, _ in expected
+        ]
+        assert [doc.page_content for doc in sharded.similarity_search(
+            query, k=5
+        )] == [doc.page_content for doc, _ in expected]
+    sharded.close()
+
+
+def test_embed_writes_only_changed_shards(temp_dir):
+    """A run saves only the shards of changed files, and search merges
+    all shards."""
+    docs_a = os.path.join(temp_dir, "a")
+    docs_b = os.path.join(temp_dir, "b")
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    for i in range(3):
+        _write(os.path.join(docs_a, f"a{i}.txt"), f"Alpha document {i}.")
+        _write(os.path.join(docs_b, f"b{i}.txt"), f"Beta document {i}.")
+    embeddings_model = DeterministicFakeEmbedding(size=16)
+
+    vector_db = embed_docs(
+        docs_paths=[docs_a, docs_b],
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model,
+        shard_by="root"
+    )
+    assert isinstance(vector_db, ShardedVectorStore)
+    shards = list_shards(vector_db_path)
+    assert len(shards) == 2
+    assert not os.path.exists(os.path.join(vector_db_path, "index.faiss"))
+    shard_b = next(shard for shard in shards if shard.startswith("b-"))
+    version_b = get_index_version(shard_path(vector_db_path, shard_b))
+    version = get_index_version(vector_db_path)
+    vector_db.close()
+
+    _write(os.path.join(docs_a, "a0.txt"), "Rewritten alpha document.")
+    os.remove(os.path.join(docs_a, "a1.txt"))
+    embed_docs(
+        docs_paths=[docs_a, docs_b],
+        vector_db_path=vector_db_path,
+        embeddings_model=embeddings_model
+    )
+    assert get_index_version(shard_path(vector_db_path, shard_b)) == (
+        version_b
+    )
+    assert get_index_version(vector_db_path) != version
+
+    loaded = load_vector_database(vector_db_path, embeddings_model)
+    assert isinstance(loaded, ShardedVectorStore)
+    texts = [
+        doc.page_content for doc in loaded.similarity_search("x", k=10)
+    ]
+    assert sorted(texts) == sorted([
+        "Rewritten alpha document.",
+        "Alpha document 2.",
+        "Beta document 0.",
+        "Beta document 1.",
+        "Beta document 2.",
+    ])
+    assert loaded.similarity_search("Beta document 1.", k=1)[
+        0
+    ].page_content == "Beta document 1."
+    loaded.close()
+    assert all(
+        shard.docstore._conn is None for shard in loaded.shards.values()
+    )
+
+    with pytest.raises(ValueError):
+        embed_docs(
+            docs_paths=[docs_a, docs_b],
+            vector_db_path=vector_db_path,
+            embeddings_model=embeddings_model,
+            shard_by="none"
+        )
@@ -1,6 +1,9 @@
 # pylint: disable=protected-access
+import pytest
 from langchain_core.documents import Document
 from local_dir_rag.text_processor import (
+    estimate_tokens,
+    pack_documents,
     split_documents,
     format_documents,
     recursive_character_splitter,
@@ -32,9 +35,11 @@ def test_split_documents():
     chunks = split_documents(docs, chunk_size=200, chunk_overlap=20)
     assert len(chunks) > 1
 
-    # Ensure metadata is preserved
+    # Ensure metadata is preserved, and offsets are recorded
     for chunk in chunks:
         assert chunk.metadata["source"] == "test.txt"
+        start = chunk.metadata["start_index"]
+        assert long_text[start:].startswith(chunk.page_content)
 
 
 def test_format_documents(sample_documents):
@@ -47,3 +52,72 @@ def test_format_documents(sample_documents):
 
     # Check documents are separated by newlines
     assert "\n\n" in context
+
+
+def test_estimate_tokens():
+    """Test the four characters per token estimate."""
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("a" * 1024) == 256
+
+
+def _page_chunks(source: str, offsets: bool = True) -> tuple[str, list]:
+    """Split a page into overlapping chunks, in shuffled order."""
+    text = " ".join(
+        f"Sentence {i} of {source} is about topic {i % 5}." for i in range(40)
+    )
+    chunks = split_documents(
+        [Document(page_content=text, metadata={"source": source})],
+        chunk_size=200,
+        chunk_overlap=50
+    )
+    if not offsets:
+        chunks = [
+            Document(page_content=chunk.page_content, metadata={
+                "source": source
+            })
+            for chunk in chunks
+        ]
+    return text, chunks[1::2] + chunks[::2]
+
+
+@pytest.mark.parametrize("offsets", [True, False])
+def test_pack_documents_merges_neighbours(offsets):
+    """Overlapping and contiguous chunks of a page become one passage."""
+    text, chunks = _page_chunks("a.txt", offsets)
+
+    packed = pack_documents(chunks, max_tokens=0)
+
+    assert len(packed) == 1
+    assert packed[0].page_content == text
+    assert packed[0].metadata["chunks"] == len(chunks)
+    assert estimate_tokens(text) < sum(
+        estimate_tokens(chunk.page_content) for chunk in chunks
+    )
+
+
+def test_pack_documents_orders_and_trims():
+    """Passages follow their best chunk, and stop at the token budget."""
+    _, chunks_a = _page_chunks("a.txt")
+    _, chunks_b = _page_chunks("b.txt")
+    other_page = Document(
+        page_content="Separate page.", metadata={"source": "a.txt", "page": 2}
+    )
+    documents = [chunks_b[0], other_page, chunks_a[0]] + chunks_a[1:]
+
+    packed = pack_documents(documents, max_tokens=0)
+    assert [doc.metadata["source"] for doc in packed] == [
+        "b.txt", "a.txt", "a.txt"
+    ]
+    assert packed[1].page_content == "Separate page."
+
+    budget = estimate_tokens(chunks_b[0].page_content) + 100
+    trimmed = pack_documents(documents, max_tokens=budget)
+    assert len(trimmed) == 3
+    assert sum(
+        estimate_tokens(doc.page_content) for doc in trimmed
+    ) <= budget
+    assert packed[2].page_content.startswith(trimmed[2].page_content)
+
+    assert len(pack_documents(documents, max_tokens=budget - 60)) == 2
@@ -0,0 +1,244 @@
+"""Tests for the filesystem watchers and watch mode."""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from local_dir_rag.embed import watch_docs
+from local_dir_rag.file_tracker import FileState, FileTracker
+from local_dir_rag.vector_store import load_vector_database
+from local_dir_rag.watcher import (
+    InotifyWatcher,
+    PollingWatcher,
+    collect_changes,
+)
+
+WATCHERS = ["polling"]
+if sys.platform.startswith("linux"):
+    WATCHERS.append("inotify")
+
+
+def _include(path, is_dir):
+    """Include directories and text files that are not hidden."""
+    name = os.path.basename(path)
+    return not name.startswith(".") and (is_dir or name.endswith(".txt"))
+
+
+def _create_watcher(kind, directory):
+    if kind == "inotify":
+        return InotifyWatcher([directory], _include)
+    return PollingWatcher([directory], _include, poll_interval=0.05)
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _wait_for(condition, timeout=10.0):
+    """Wait until a condition holds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+@pytest.mark.parametrize("kind", WATCHERS)
+def test_watcher_reports_changes(kind, temp_dir):
+    """New, changed, removed and ignored files and directories."""
+    _write(os.path.join(temp_dir, "old.txt"), "old")
+    with _create_watcher(kind, temp_dir) as watcher:
+        assert watcher.read_changes(0.2) == set()
+
+        _write(os.path.join(temp_dir, "new.txt"), "new")
+        _write(os.path.join(temp_dir, "ignored.log"), "log")
+        _write(os.path.join(temp_dir, ".hidden.txt"), "hidden")
+        assert collect_changes(watcher, 5, debounce_seconds=0.3) == {
+            os.path.join(temp_dir, "new.txt")
+        }
+
+        subdirectory = os.path.join(temp_dir, "sub")
+        os.mkdir(subdirectory)
+        changes = collect_changes(watcher, 5, debounce_seconds=0.3)
+        # A directory created after the start is watched too
+        _write(os.path.join(subdirectory, "nested.txt"), "nested")
+        changes |= collect_changes(watcher, 5, debounce_seconds=0.3)
+        assert os.path.join(subdirectory, "nested.txt") in changes
+
+        os.remove(os.path.join(temp_dir, "old.txt"))
+        assert collect_changes(watcher, 5, debounce_seconds=0.3) == {
+            os.path.join(temp_dir, "old.txt")
+        }
+
+
+def test_collect_changes_coalesces_bursts(temp_dir):
+    """Changes are collected until they settle, up to the maximum delay."""
+
+    class ScriptedWatcher:
+        """Watcher returning a fixed sequence of changes."""
+
+        def __init__(self, changes):
+            self.changes = list(changes)
+
+        def read_changes(self, timeout=None):
+            return self.changes.pop(0) if self.changes else set()
+
+    watcher = ScriptedWatcher([{"a"}, {"b", "a"}, {"c"}, set(), {"d"}])
+    assert collect_changes(watcher, debounce_seconds=0.01) == {
+        "a", "b", "c"
+    }
+    assert collect_changes(watcher, debounce_seconds=0.01) == {"d"}
+    assert collect_changes(watcher, debounce_seconds=0.01) == set()
+
+    watcher = ScriptedWatcher([{"a"}, {"b"}, {"c"}])
+    assert collect_changes(
+        watcher, debounce_seconds=0.01, max_delay_seconds=0
+    ) == {"a"}
+
+
+@pytest.mark.parametrize("polling", [True, False])
+def test_watch_docs_indexes_changes(polling, temp_dir):
+    """Only changed files are indexed while watching."""
+    docs_dir = os.path.join(temp_dir, "docs")
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    os.makedirs(docs_dir)
+    _write(os.path.join(docs_dir, "kept.txt"), "A document that stays.")
+    _write(os.path.join(docs_dir, "removed.txt"), "A document to remove.")
+
+    def tracked_files():
+        if not os.path.exists(os.path.join(vector_db_path, "index.faiss")):
+            return set()
+        with FileTracker(vector_db_path) as file_tracker:
+            return {
+                os.path.relpath(path, docs_dir)
+                for path in file_tracker.get_all_tracked_files()
+            }
+
+    stop_event = threading.Event()
+    thread = threading.Thread(target=watch_docs, kwargs={
+        "docs_paths": docs_dir,
+        "vector_db_path": vector_db_path,
+        "embeddings_model": DeterministicFakeEmbedding(size=8),
+        "exclude_patterns": ["drafts/"],
+        "debounce_seconds": 0.2,
+        "polling": polling,
+        "poll_interval": 0.1,
+        "stop_event": stop_event,
+    })
+    thread.start()
+    try:
+        _wait_for(lambda: tracked_files() == {"kept.txt", "removed.txt"})
+
+        os.remove(os.path.join(docs_dir, "removed.txt"))
+        os.makedirs(os.path.join(docs_dir, "new", "deeper"))
+        _write(
+            os.path.join(docs_dir, "new", "deeper", "added.txt"),
+            "A document added while watching."
+        )
+        os.makedirs(os.path.join(docs_dir, "drafts"))
+        _write(os.path.join(docs_dir, "drafts", "draft.txt"), "Excluded.")
+        _wait_for(lambda: tracked_files() == {
+            "kept.txt", os.path.join("new", "deeper", "added.txt")
+        })
+
+        os.rename(
+            os.path.join(docs_dir, "new"), os.path.join(temp_dir, "moved")
+        )
+        _wait_for(lambda: tracked_files() == {"kept.txt"})
+    finally:
+        stop_event.set()
+        thread.join(timeout=10)
+    assert not thread.is_alive()
+
+
+@contextmanager
+def _watching(docs_dir, vector_db_path):
+    """Watch a documents directory in a thread, by polling."""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=watch_docs, kwargs={
+        "docs_paths": docs_dir,
+        "vector_db_path": vector_db_path,
+        "embeddings_model": DeterministicFakeEmbedding(size=8),
+        "debounce_seconds": 0.2,
+        "polling": True,
+        "poll_interval": 0.1,
+        "stop_event": stop_event,
+    })
+    thread.start()
+    try:
+        yield thread
+    finally:
+        stop_event.set()
+        thread.join(timeout=10)
+    assert not thread.is_alive()
+
+
+def _tracked_files(docs_dir, vector_db_path):
+    """Names of the files recorded as indexed."""
+    if not os.path.exists(os.path.join(vector_db_path, "index.faiss")):
+        return set()
+    with FileTracker(vector_db_path) as file_tracker:
+        return {
+            os.path.relpath(status.file_path, docs_dir)
+            for status in file_tracker.get_file_statuses(
+                file_tracker.get_all_tracked_files()
+            )
+            if status.state == FileState.UNCHANGED
+        }
+
+
+def test_watch_docs_skips_unloadable_file(temp_dir):
+    """A file that cannot be loaded does not stop watching, and is
+    indexed once it is fixed."""
+    docs_dir = os.path.join(temp_dir, "docs")
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    os.makedirs(docs_dir)
+    _write(os.path.join(docs_dir, "kept.txt"), "A document that stays.")
+
+    with _watching(docs_dir, vector_db_path) as thread:
+        _wait_for(
+            lambda: _tracked_files(docs_dir, vector_db_path) == {"kept.txt"}
+        )
+        with open(os.path.join(docs_dir, "bad.txt"), "wb") as f:
+            f.write(b"\xff\xfe\xfa undecodable")
+        # Indexed in a burst of its own
+        time.sleep(1.0)
+        _write(os.path.join(docs_dir, "added.txt"), "A document added.")
+        _wait_for(lambda: _tracked_files(docs_dir, vector_db_path) == {
+            "kept.txt", "added.txt"
+        })
+        assert thread.is_alive()
+
+        _write(os.path.join(docs_dir, "bad.txt"), "A document fixed.")
+        _wait_for(lambda: _tracked_files(docs_dir, vector_db_path) == {
+            "kept.txt", "added.txt", "bad.txt"
+        })
+
+
+def test_watch_docs_replaces_modified_file(temp_dir):
+    """The chunks of a file modified while watching are replaced."""
+    docs_dir = os.path.join(temp_dir, "docs")
+    vector_db_path = os.path.join(temp_dir, "vector_db")
+    os.makedirs(docs_dir)
+    file_path = os.path.join(docs_dir, "changing.txt")
+    _write(file_path, "The first version.")
+
+    def texts():
+        vector_db = load_vector_database(
+            vector_db_path, DeterministicFakeEmbedding(size=8)
+        )
+        if vector_db is None:
+            return []
+        return [
+            vector_db.docstore.search(doc_id).page_content
+            for doc_id in vector_db.index_to_docstore_id.values()
+        ]
+
+    with _watching(docs_dir, vector_db_path):
+        _wait_for(lambda: texts() == ["The first version."])
+        _write(file_path, "The second version.")
+        _wait_for(lambda: texts() == ["The second version."])